@@ -0,0 +1,291 @@
+"""
+Benchmarks of Engine against sqlite3 on synthetic tables
+
+    python bench.py --sizes 1000,100000 --save baseline.json
+    python bench.py --sizes 1000,100000 --compare baseline.json
+
+Comparing fails with exit code 1 when some workload got slower
+than the baseline by more than --threshold
+"""
+
+import argparse
+import dataclasses
+import json
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from typing import Any
+
+from engine import Engine
+
+SIZES = (1_000, 100_000, 1_000_000, 10_000_000)
+CATEGORIES = ("books", "games", "music", "tools", "toys", "garden", "food", "auto")
+BATCH = 1000
+CREATE = "CREATE TABLE items (id INTEGER, category TEXT, price INTEGER, name TEXT)"
+
+
+class SqliteRunner:
+    name = "sqlite3"
+
+    def __init__(self) -> None:
+        self.con = sqlite3.connect(":memory:")
+
+    def execute(self, cmd: str) -> Any:
+        res = self.con.execute(cmd).fetchall()
+        self.con.commit()
+        return res
+
+
+class EngineRunner:
+    name = "engine"
+
+    def __init__(self) -> None:
+        self.engine = Engine()
+
+    def execute(self, cmd: str) -> Any:
+        return self.engine.execute(cmd)
+
+
+Runner = SqliteRunner | EngineRunner
+
+
+@dataclasses.dataclass
+class Result:
+    size: int
+    workload: str
+    runner: str
+    # rows per second for inserts, queries per second otherwise
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    peak_memory: int | None
+
+    def key(self) -> str:
+        return f"{self.size}/{self.workload}/{self.runner}"
+
+
+def generate_rows(size: int, seed: int = 0) -> list[tuple[int, str, int, str]]:
+    rng = random.Random(seed)
+    return [
+        (i, rng.choice(CATEGORIES), rng.randrange(10_000), f"item{rng.randrange(size)}")
+        for i in range(size)
+    ]
+
+
+def insert_statements(rows: list[tuple[int, str, int, str]]) -> list[str]:
+    stmts = []
+    for start in range(0, len(rows), BATCH):
+        values = ", ".join(
+            f"({i}, '{category}', {price}, '{name}')"
+            for i, category, price, name in rows[start : start + BATCH]
+        )
+        stmts.append(f"INSERT INTO items VALUES {values}")  # noqa: S608
+    return stmts
+
+
+def workloads(size: int, seed: int = 0) -> dict[str, list[str]]:
+    "Queries of every read workload, timed one by one"
+    rng = random.Random(seed)
+    queries = 20
+    return {
+        "point_lookup": [
+            f"SELECT * FROM items WHERE id = {rng.randrange(size)}"  # noqa: S608
+            for _ in range(queries)
+        ],
+        "range_scan": [
+            f"SELECT id, price FROM items WHERE price BETWEEN {lo} AND {lo + 100}"  # noqa: S608
+            for lo in (rng.randrange(9_900) for _ in range(queries))
+        ],
+        "like": [
+            f"SELECT id FROM items WHERE name LIKE 'item{rng.randrange(10, 100)}%'"  # noqa: S608
+            for _ in range(queries)
+        ],
+        "distinct": ["SELECT DISTINCT category FROM items"] * queries,
+        "order_by_limit": ["SELECT price, id FROM items ORDER BY price LIMIT 10"]
+        * queries,
+        "aggregate": [
+            (
+                "SELECT category, COUNT(*), AVG(price), MAX(price) FROM items "
+                "GROUP BY category"
+            )
+        ]
+        * queries,
+    }
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    pos = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[pos]
+
+
+def timed(stmts: list[str], execute: Callable[[str], Any]) -> list[float]:
+    latencies = []
+    for stmt in stmts:
+        start = time.perf_counter()
+        execute(stmt)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_memory(stmts: list[str], execute: Callable[[str], Any]) -> int:
+    "Peak of python allocations while running, sqlite's own heap is not seen"
+    tracemalloc.start()
+    try:
+        for stmt in stmts:
+            execute(stmt)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def result(
+    size: int,
+    workload: str,
+    runner: Runner,
+    latencies: list[float],
+    units: int,
+    memory: int | None,
+) -> Result:
+    return Result(
+        size,
+        workload,
+        runner.name,
+        units / sum(latencies),
+        percentile(latencies, 0.50),
+        percentile(latencies, 0.95),
+        percentile(latencies, 0.99),
+        memory,
+    )
+
+
+def bench_size(size: int, memory: bool) -> list[Result]:
+    rows = generate_rows(size)
+    inserts = insert_statements(rows)
+    queries = workloads(size)
+
+    results = []
+    for factory in (EngineRunner, SqliteRunner):
+        runner = factory()
+        runner.execute(CREATE)
+        latencies = timed(inserts, runner.execute)
+        peak = None
+        if memory:
+            # a separate load, tracemalloc slows down everything it traces
+            fresh = factory()
+            fresh.execute(CREATE)
+            peak = peak_memory(inserts, fresh.execute)
+            del fresh
+        results.append(result(size, "bulk_insert", runner, latencies, size, peak))
+
+        for workload, stmts in queries.items():
+            latencies = timed(stmts, runner.execute)
+            peak = peak_memory(stmts[:1], runner.execute) if memory else None
+            results.append(result(size, workload, runner, latencies, len(stmts), peak))
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def report(results: list[Result]) -> None:
+    header = f"{'size':>9} {'workload':<15} {'runner':<8} {'throughput':>12} "
+    header += f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9}"
+    print(header)
+    for r in results:
+        memory = "-" if r.peak_memory is None else str(r.peak_memory // 1024)
+        print(
+            f"{r.size:>9} {r.workload:<15} {r.runner:<8} {r.throughput:>12.1f} "
+            f"{r.p50 * 1000:>9.3f} {r.p95 * 1000:>9.3f} {r.p99 * 1000:>9.3f} "
+            f"{memory:>9}"
+        )
+
+    # how many times sqlite3 is faster on every workload
+    medians = {r.key(): r.p50 for r in results}
+    print()
+    for r in results:
+        if r.runner == EngineRunner.name:
+            other = medians.get(f"{r.size}/{r.workload}/{SqliteRunner.name}")
+            if other:
+                print(f"{r.size:>9} {r.workload:<15} x{r.p50 / other:.1f} vs sqlite3")
+
+
+def save(path: str, results: list[Result]) -> None:
+    data = {
+        "commit": git_commit(),
+        "results": [dataclasses.asdict(r) for r in results],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def regressions(
+    baseline_path: str, results: list[Result], threshold: float
+) -> list[str]:
+    "Workloads of our engine whose median latency grew more than threshold"
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {Result(**r).key(): Result(**r) for r in baseline["results"]}
+
+    slower = []
+    for r in results:
+        old = before.get(r.key())
+        if r.runner != EngineRunner.name or old is None:
+            continue
+        if r.p50 > old.p50 * (1 + threshold):
+            slower.append(
+                f"{r.key()}: p50 {old.p50 * 1000:.3f} -> {r.p50 * 1000:.3f} ms"
+                f" (baseline {baseline.get('commit')})"
+            )
+    return slower
+
+
+def main(argv: list[str] | None = None) -> int:
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument(
+        "--sizes",
+        default="1000,100000",
+        help=f"comma separated row counts, full suite is {','.join(map(str, SIZES))}",
+    )
+    argparser.add_argument("--save", help="write results as a baseline json")
+    argparser.add_argument("--compare", help="baseline json to check against")
+    argparser.add_argument("--threshold", type=float, default=0.2)
+    argparser.add_argument(
+        "--no-memory", action="store_true", help="skip tracemalloc runs"
+    )
+    args = argparser.parse_args(argv)
+
+    results: list[Result] = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.extend(bench_size(size, not args.no_memory))
+
+    report(results)
+    if args.save:
+        save(args.save, results)
+
+    if args.compare:
+        slower = regressions(args.compare, results, args.threshold)
+        for line in slower:
+            print(f"REGRESSION {line}")
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
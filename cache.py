@@ -0,0 +1,106 @@
+import dataclasses
+import sys
+import weakref
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from engine import PartitionedTable, Table
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+
+@dataclasses.dataclass
+class CacheEntry:
+    rows: list[Any]
+    deps: list[tuple["weakref.ref[Table | PartitionedTable]", int]]
+    size: int
+
+
+def estimate_size(rows: list[Any]) -> int:
+    "Rough number of bytes held by a list of result tuples"
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for val in row:
+            size += sys.getsizeof(val)
+    return size
+
+
+class ResultCache:
+    """
+    LRU cache of SELECT results.
+    Every entry remembers the version of each table it was computed from,
+    entry is dropped on lookup if any of those tables was modified since
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._stats = CacheStats()
+
+    def get(self, key: str) -> list[Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats.misses += 1
+            return None
+
+        for ref, version in entry.deps:
+            table = ref()
+            if table is None or table.version != version:
+                self._remove(key)
+                self._stats.invalidations += 1
+                self._stats.misses += 1
+                return None
+
+        self._entries.move_to_end(key)
+        self._stats.hits += 1
+        return list(entry.rows)
+
+    def put(
+        self, key: str, tables: list["Table | PartitionedTable"], rows: list[Any]
+    ) -> None:
+        size = estimate_size(rows)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        deps = [(weakref.ref(t), t.version) for t in tables]
+        self._entries[key] = CacheEntry(list(rows), deps, size)
+        self._stats.bytes += size
+
+        while (
+            len(self._entries) > self.max_entries or self._stats.bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._stats.bytes = 0
+
+    def stats(self) -> CacheStats:
+        return dataclasses.replace(self._stats, entries=len(self._entries))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._stats.bytes -= entry.size
@@ -0,0 +1,93 @@
+"""
+Query results as batches of columns, see Engine.columns().
+Numeric columns are typed arrays and dictionary encoded text columns
+are arrays of codes into their distinct values, both expose the buffer
+protocol. numpy is optional, it is imported by Column.numpy() only
+"""
+
+import array
+import dataclasses
+from typing import Any
+
+# rows per batch
+BATCH_ROWS = 65536
+
+
+@dataclasses.dataclass
+class Column:
+    name: str
+    # int64 'q' or float64 'd' array, uint32 'I' codes into dictionary,
+    # or a list of python objects for anything else
+    data: "array.array[Any] | list[Any]"
+    # 0 marks NULLs of an array column, None if it has none
+    valid: bytearray | None = None
+    dictionary: list[Any] | None = None
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def memoryview(self) -> memoryview:
+        if not isinstance(self.data, array.array):
+            raise TypeError(f"column {self.name} holds python objects")
+        return memoryview(self.data)
+
+    def numpy(self) -> Any:
+        "numpy array over the same buffer, masked where values are NULL"
+        import numpy as np
+
+        if not isinstance(self.data, array.array):
+            return np.array(self.data, dtype=object)
+        values = np.frombuffer(self.data, dtype=self.data.typecode)
+        if self.valid is None:
+            return values
+        mask = np.frombuffer(self.valid, dtype=np.uint8) == 0
+        return np.ma.masked_array(values, mask=mask)
+
+    def tolist(self) -> list[Any]:
+        values: list[Any] = list(self.data)
+        if self.dictionary is not None:
+            values = [self.dictionary[code] for code in values]
+        if self.valid is not None:
+            values = [v if ok else None for v, ok in zip(values, self.valid)]
+        return values
+
+
+@dataclasses.dataclass
+class Batch:
+    columns: list[Column]
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> Column:
+        for column in self.columns:
+            if column.name == name:
+                return column
+        raise KeyError(name)
+
+    def rows(self) -> list[tuple[Any, ...]]:
+        return list(zip(*(column.tolist() for column in self.columns)))
+
+
+def build(name: str, values: list[Any]) -> Column:
+    "Column of the narrowest array type holding values, else of the list"
+    kinds = set(map(type, values))
+    valid = None
+    if type(None) in kinds:
+        kinds.discard(type(None))
+        if not kinds:
+            return Column(name, values)
+        valid = bytearray(v is not None for v in values)
+        values = [0 if v is None else v for v in values]
+
+    if kinds <= {int}:
+        try:
+            return Column(name, array.array("q", values), valid)
+        except OverflowError:
+            pass
+    elif kinds <= {int, float}:
+        return Column(name, array.array("d", values), valid)
+
+    if valid is not None:
+        values = [v if ok else None for v, ok in zip(values, valid)]
+    return Column(name, values)
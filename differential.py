@@ -0,0 +1,282 @@
+"""
+Randomized differential testing of Engine against sqlite3
+
+    python differential.py --seed 1 --queries 500 --rows 2000
+
+Runs seeded random SELECTs on both, reports every result mismatch
+and the query shapes on which Engine is disproportionately slow
+"""
+
+import argparse
+import dataclasses
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import Any
+
+from engine import Engine
+
+COLUMNS = [("id", "INTEGER"), ("a", "INTEGER"), ("b", "INTEGER"), ("s", "TEXT")]
+WORDS = ("ab", "abc", "b", "bca", "cab", "xy", "xyz", "zz")
+INT_OPS = ("=", "!=", "<>", "<", "<=", ">", ">=", "==")
+
+
+@dataclasses.dataclass
+class Query:
+    sql: str
+    # features of the query, used to group timings
+    shape: str
+    # position of the ORDER BY column in the result, if any
+    orderpos: int | None
+
+
+@dataclasses.dataclass
+class Outcome:
+    query: Query
+    expected: list[Any]
+    actual: list[Any] | str
+    engine_time: float
+    sqlite_time: float
+
+    @property
+    def ok(self) -> bool:
+        if isinstance(self.actual, str):
+            return False
+        return same(self.expected, self.actual, self.query.orderpos)
+
+    @property
+    def ratio(self) -> float:
+        return self.engine_time / max(self.sqlite_time, 1e-9)
+
+
+def same(expected: list[Any], actual: list[Any], orderpos: int | None) -> bool:
+    """
+    Row order is compared exactly, except for rows with equal ORDER BY keys,
+    whose order sqlite leaves unspecified
+    """
+    if orderpos is None:
+        return expected == actual
+    if len(expected) != len(actual):
+        return False
+
+    def runs(rows: list[Any]) -> list[Counter[Any]]:
+        output: list[Counter[Any]] = []
+        last: Any = object()
+        for row in rows:
+            key = row[orderpos]
+            if not output or key != last or type(key) is not type(last):
+                output.append(Counter())
+            output[-1][row] += 1
+            last = key
+        return output
+
+    return runs(expected) == runs(actual)
+
+
+class QueryGenerator:
+    def __init__(self, seed: int, rows: int):
+        self.rng = random.Random(seed)
+        self.rows = rows
+
+    def setup(self) -> list[str]:
+        columns = ", ".join(f"{name} {type_name}" for name, type_name in COLUMNS)
+        stmts = [f"CREATE TABLE t ({columns})"]
+        values = [
+            f"({i}, {self.maybe_null(self.rng.randrange(50))}, "
+            f"{self.rng.randrange(1000)}, {self.maybe_null(self.word())})"
+            for i in range(self.rows)
+        ]
+        for start in range(0, len(values), 500):
+            batch = ", ".join(values[start : start + 500])
+            stmts.append(f"INSERT INTO t VALUES {batch}")  # noqa: S608
+        return stmts
+
+    def maybe_null(self, val: Any) -> str:
+        if self.rng.random() < 0.1:
+            return "NULL"
+        return f"'{val}'" if isinstance(val, str) else str(val)
+
+    def word(self) -> str:
+        return self.rng.choice(WORDS) + self.rng.choice(("", "", "a", "b", "q"))
+
+    def int_literal(self, column: str) -> int:
+        return self.rng.randrange(1000 if column == "b" else 50)
+
+    def predicate(self, features: set[str]) -> str:
+        column = self.rng.choice(["id", "a", "b", "s"])
+        kind = self.rng.choice(["cmp", "cmp", "between", "in", "like", "is"])
+        if column == "s" and kind in ("cmp", "between", "in"):
+            kind = "like"
+        if column != "s" and kind == "like":
+            kind = "cmp"
+        features.add(kind)
+        isnot = "NOT " if self.rng.random() < 0.3 else ""
+
+        if kind == "cmp":
+            op = self.rng.choice(INT_OPS)
+            return f"{column} {op} {self.int_literal(column)}"
+        elif kind == "between":
+            lo = self.int_literal(column)
+            hi = lo + self.rng.randrange(1, 200)
+            return f"{column} {isnot}BETWEEN {lo} AND {hi}"
+        elif kind == "in":
+            items = ", ".join(
+                str(self.int_literal(column)) for _ in range(self.rng.randrange(1, 5))
+            )
+            return f"{column} {isnot}IN ({items})"
+        elif kind == "like":
+            pattern = self.rng.choice(
+                [self.word(), self.word()[:1] + "%", "%" + self.word()[-1:], "_b%"]
+            )
+            if self.rng.random() < 0.3:
+                pattern = pattern.upper()
+            return f"{column} {isnot}LIKE '{pattern}'"
+        else:
+            return f"{column} IS {isnot}NULL"
+
+    def where(self, depth: int, features: set[str]) -> str:
+        if depth == 0 or self.rng.random() < 0.35:
+            return self.predicate(features)
+
+        op = self.rng.choice(["AND", "OR", "NOT"])
+        features.add(op)
+        if op == "NOT":
+            return f"NOT ({self.where(depth - 1, features)})"
+        lhs = self.operand(depth - 1, features)
+        rhs = self.operand(depth - 1, features)
+        return f"{lhs} {op} {rhs}"
+
+    def operand(self, depth: int, features: set[str]) -> str:
+        "Operand of AND/OR, predicates are left bare half of the time"
+        if depth == 0 or self.rng.random() < 0.35:
+            pred = self.predicate(features)
+            return pred if self.rng.random() < 0.5 else f"({pred})"
+        return f"({self.where(depth, features)})"
+
+    def query(self) -> Query:
+        features: set[str] = set()
+        names = [name for name, _ in COLUMNS]
+        if self.rng.random() < 0.2:
+            selected = names
+            columns = "*"
+        else:
+            selected = self.rng.sample(names, self.rng.randrange(1, len(names) + 1))
+            columns = ", ".join(selected)
+
+        sql = "SELECT "
+        if self.rng.random() < 0.2:
+            sql += "DISTINCT "
+            features.add("distinct")
+        sql += f"{columns} FROM t"
+
+        if self.rng.random() < 0.85:
+            sql += f" WHERE {self.where(3, features)}"
+
+        orderpos = None
+        unique = False
+        if self.rng.random() < 0.5:
+            column = self.rng.choice(selected)
+            orderpos = selected.index(column)
+            unique = column == "id"
+            direction = self.rng.choice(["", " ASC", " DESC"])
+            sql += f" ORDER BY {column}{direction}"
+            features.add("order")
+
+        # with ties, which rows make it past LIMIT is up to the engine
+        if (orderpos is None or unique) and self.rng.random() < 0.3:
+            sql += f" LIMIT {self.rng.randrange(0, 30)}"
+            features.add("limit")
+            if self.rng.random() < 0.5:
+                sql += f" OFFSET {self.rng.randrange(0, 30)}"
+                features.add("offset")
+
+        return Query(sql, "+".join(sorted(features)) or "scan", orderpos)
+
+
+def run(seed: int, queries: int, rows: int) -> list[Outcome]:
+    gen = QueryGenerator(seed, rows)
+    engine = Engine()
+    con = sqlite3.connect(":memory:")
+    for stmt in gen.setup():
+        engine.execute(stmt)
+        con.execute(stmt)
+
+    outcomes = []
+    for _ in range(queries):
+        query = gen.query()
+
+        start = time.perf_counter()
+        expected = con.execute(query.sql).fetchall()
+        sqlite_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual: list[Any] | str
+        try:
+            actual = engine.execute(query.sql)
+        except Exception as e:  # noqa: BLE001
+            actual = f"{type(e).__name__}: {e}"
+        engine_time = time.perf_counter() - start
+
+        outcomes.append(Outcome(query, expected, actual, engine_time, sqlite_time))
+    return outcomes
+
+
+def slow_shapes(
+    outcomes: list[Outcome], factor: float, min_queries: int = 5
+) -> dict[str, float]:
+    "Shapes whose median time ratio is factor times above the overall median"
+    overall = statistics.median(o.ratio for o in outcomes)
+    ratios: dict[str, list[float]] = {}
+    for o in outcomes:
+        ratios.setdefault(o.query.shape, []).append(o.ratio)
+
+    return {
+        shape: statistics.median(rs)
+        for shape, rs in sorted(ratios.items())
+        if len(rs) >= min_queries and statistics.median(rs) > factor * overall
+    }
+
+
+def report(outcomes: list[Outcome], factor: float) -> int:
+    failures = [o for o in outcomes if not o.ok]
+    for o in failures:
+        print(f"MISMATCH {o.query.sql}")
+        print(f"  sqlite3: {sorted(o.expected, key=repr)[:10]}")
+        actual = o.actual
+        if not isinstance(actual, str):
+            actual = str(sorted(actual, key=repr)[:10])
+        print(f"  engine:  {actual}")
+
+    ratios = sorted(o.ratio for o in outcomes)
+    print(
+        f"{len(outcomes)} queries, {len(failures)} mismatches, "
+        f"engine/sqlite3 time ratio median x{statistics.median(ratios):.1f}, "
+        f"max x{ratios[-1]:.1f}"
+    )
+    for shape, ratio in slow_shapes(outcomes, factor).items():
+        print(f"SLOW {shape}: median x{ratio:.1f}")
+    return len(failures)
+
+
+def main(argv: list[str] | None = None) -> int:
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--queries", type=int, default=500)
+    argparser.add_argument("--rows", type=int, default=2000)
+    argparser.add_argument(
+        "--slow-factor",
+        type=float,
+        default=3.0,
+        help="flag shapes this many times slower than the median ratio",
+    )
+    args = argparser.parse_args(argv)
+
+    outcomes = run(args.seed, args.queries, args.rows)
+    return 1 if report(outcomes, args.slow_factor) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
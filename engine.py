@@ -1,16 +1,50 @@
 import abc
+import array
+import bisect
+import copy
+import csv
+import itertools
+import operator
 import parser
 import re
-from dataclasses import dataclass
-from typing import Any
+import shlex
+import sys
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, fields, is_dataclass, replace
+from typing import TYPE_CHECKING, Any
 
+from cache import ResultCache
+from columnar import BATCH_ROWS, Batch, Column, build
+from explain import Profile
+from like import compile_like, prefix_ranges
+from metrics import Metrics
+from optimizer import Filter, InSet, Optimizer, andall, conjuncts, literal
+from spill import external_distinct, external_sort, topn
 from tokenizer import TT
 
+if TYPE_CHECKING:
+    from replication import StatementLog
+
 
 class EngineError(Exception):
     pass
 
 
+class Interrupted(EngineError):
+    "Statement stopped by Engine.interrupt() or by the progress handler"
+
+
+class QueryTimeout(Interrupted):
+    pass
+
+
+class MemoryLimitExceeded(EngineError):
+    "INSERT rejected because the tables would outgrow Engine.memory_limit"
+
+
 class Value(abc.ABC):
     val: Any
 
@@ -40,30 +74,1486 @@ class BlobValue(Value):
     val: bytes
 
 
+def tovalue(val: Any) -> Value:
+    if val is None:
+        return NullValue(None)
+    elif isinstance(val, int):
+        return IntegerValue(int(val))
+    elif isinstance(val, float):
+        return RealValue(val)
+    elif isinstance(val, str):
+        return TextValue(val)
+    else:
+        return BlobValue(val)
+
+
+def valuesize(value: Value) -> int:
+    "Bytes of a Value and the python object it wraps, None is shared"
+    if value.val is None:
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sys.getsizeof(value.val)
+
+
+# a pointer in a list or array
+POINTER_BYTES = 8
+# a row position in an index bucket
+ROWID_BYTES = POINTER_BYTES + sys.getsizeof(1 << 20)
+# a new bucket list and its dict entry, hash and key and value pointers
+BUCKET_BYTES = sys.getsizeof([]) + 3 * POINTER_BYTES
+
+
+def sortkey(val: Any) -> tuple[int, Any]:
+    "Key that orders values like sqlite does: NULL, numbers, text, blobs"
+    if val is None:
+        return (0, 0)
+    elif isinstance(val, int | float):
+        return (1, val)
+    elif isinstance(val, str):
+        return (2, val)
+    else:
+        return (3, val)
+
+
+def stablehash(val: Any) -> int:
+    "Hash that is the same in every process, equal numbers hash alike"
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    if isinstance(val, int):
+        return val
+    if val is None:
+        return 0
+    return zlib.crc32(val if isinstance(val, bytes) else str(val).encode())
+
+
+def rowidvalue(val: Any) -> int:
+    "Value of an INTEGER PRIMARY KEY as an integer, like sqlite converts it"
+    if isinstance(val, str):
+        try:
+            val = int(val.strip())
+        except ValueError:
+            try:
+                val = float(val)
+            except ValueError:
+                raise EngineError("datatype mismatch") from None
+    if isinstance(val, float) and val.is_integer():
+        val = int(val)
+    if not isinstance(val, int):
+        raise EngineError("datatype mismatch")
+    return val
+
+
+class Index:
+    """
+    Index on one column: hash buckets of row positions per value,
+    plus distinct keys sorted on demand for ordered access
+    """
+
+    def __init__(self, indexname: str, column: str, position: int):
+        self.indexname = indexname
+        self.column = column
+        self.position = position
+        self.buckets: dict[Any, list[int]] = {}
+        self._sorted: list[Any] | None = []
+        # estimated, keys are shared with the rows
+        self.bytes = 0
+        # keys whose buckets were copied since a fork, None if nothing is shared
+        self.copied: set[Any] | None = None
+
+    def copy(self) -> "Index":
+        "Index sharing buckets with this one until they are changed"
+        index = Index(self.indexname, self.column, self.position)
+        index.buckets = dict(self.buckets)
+        index._sorted = self._sorted
+        index.bytes = self.bytes
+        index.copied = set()
+        return index
+
+    def bucket(self, val: Any) -> list[int] | None:
+        "Bucket of val that can be changed"
+        bucket = self.buckets.get(val)
+        if bucket is not None and self.copied is not None and val not in self.copied:
+            bucket = self.buckets[val] = list(bucket)
+            self.copied.add(val)
+        return bucket
+
+    def insert(self, val: Any, rowid: int) -> None:
+        bucket = self.bucket(val)
+        if bucket is None:
+            self.buckets[val] = [rowid]
+            self._sorted = None
+            self.bytes += BUCKET_BYTES + POINTER_BYTES
+        elif bucket[-1] < rowid:
+            bucket.append(rowid)
+        else:
+            # updated row, buckets stay in rowid order
+            bisect.insort(bucket, rowid)
+        self.bytes += ROWID_BYTES
+
+    def remove(self, val: Any, rowid: int) -> None:
+        bucket = self.bucket(val)
+        assert bucket is not None
+        del bucket[bisect.bisect_left(bucket, rowid)]
+        self.bytes -= ROWID_BYTES
+        if not bucket:
+            del self.buckets[val]
+            self._sorted = None
+            self.bytes -= BUCKET_BYTES + POINTER_BYTES
+
+    def lookup(self, val: Any) -> list[int]:
+        return self.buckets.get(val, [])
+
+    def renumber(self, start: int, points: list[int]) -> None:
+        """
+        Moves rows at or after start past the rows inserted before them,
+        a row was inserted before position p for every p in points
+        """
+        for val, rowids in self.buckets.items():
+            if rowids[-1] < start:
+                continue
+            bucket = self.bucket(val)
+            assert bucket is not None
+            i = bisect.bisect_left(bucket, start)
+            bucket[i:] = [r + bisect.bisect_right(points, r) for r in bucket[i:]]
+
+    def sortedkeys(self) -> list[Any]:
+        if self._sorted is None:
+            self._sorted = sorted(self.buckets, key=sortkey)
+        return self._sorted
+
+    def keyrange(self, lo: tuple[Any, ...], hi: tuple[Any, ...]) -> list[Any]:
+        "Keys whose sortkey is in [lo, hi)"
+        keys = self.sortedkeys()
+        start = bisect.bisect_left(keys, lo, key=sortkey)
+        end = bisect.bisect_left(keys, hi, key=sortkey)
+        return keys[start:end]
+
+
+class Dictionary:
+    """
+    Dictionary encoding of a column: rows share one Value per distinct value
+    and codes[rowid] is the position of the row's value in values
+    """
+
+    # past this many distinct values the column is stored plainly
+    MAX_VALUES = 1 << 16
+
+    def __init__(self) -> None:
+        self.values: list[Value] = []
+        self.positions: dict[tuple[type, Any], int] = {}
+        self.codes = array.array("I")
+        # estimated bytes of values and of positions
+        self.valuebytes = 0
+        self.positionbytes = 0
+
+    def copy(self) -> "Dictionary":
+        dictionary = Dictionary()
+        dictionary.values = list(self.values)
+        dictionary.positions = dict(self.positions)
+        dictionary.codes = array.array("I", self.codes)
+        dictionary.valuebytes = self.valuebytes
+        dictionary.positionbytes = self.positionbytes
+        return dictionary
+
+    def code(self, value: Value) -> int:
+        key = (type(value), value.val)
+        code = self.positions.get(key)
+        if code is None:
+            code = len(self.values)
+            self.positions[key] = code
+            self.values.append(value)
+            self.valuebytes += valuesize(value) + POINTER_BYTES
+            self.positionbytes += sys.getsizeof(key) + 3 * POINTER_BYTES
+        return code
+
+    def encode(self, value: Value) -> Value:
+        code = self.code(value)
+        self.codes.append(code)
+        return self.values[code]
+
+    def recode(self, rowid: int, value: Value) -> Value:
+        "Value of an updated row, values no row uses anymore stay until compaction"
+        code = self.code(value)
+        self.codes[rowid] = code
+        return self.values[code]
+
+    def bytes(self) -> int:
+        codebytes = self.codes.itemsize * len(self.codes)
+        return self.valuebytes + self.positionbytes + codebytes
+
+    def full(self) -> bool:
+        return len(self.values) > self.MAX_VALUES
+
+
+class Block:
+    """
+    Zone map of up to BLOCK_ROWS consecutive rows:
+    per column sortkeys of the smallest and largest values and NULL count
+    """
+
+    __slots__ = ("rows", "mins", "maxs", "nulls")
+
+    def __init__(self, ncolumns: int) -> None:
+        self.rows = 0
+        self.mins: list[tuple[int, Any] | None] = [None] * ncolumns
+        self.maxs: list[tuple[int, Any] | None] = [None] * ncolumns
+        self.nulls = [0] * ncolumns
+
+    def add(self, row: list[Value]) -> None:
+        self.rows += 1
+        mins, maxs = self.mins, self.maxs
+        for i, value in enumerate(row):
+            if value.val is None:
+                self.nulls[i] += 1
+                continue
+            key = sortkey(value.val)
+            low = mins[i]
+            if low is None or key < low:
+                mins[i] = key
+            high = maxs[i]
+            if high is None or key > high:
+                maxs[i] = key
+
+    def replace(self, pos: int, old: Value, new: Value) -> None:
+        "Widens the zone map for a value updated in place, never narrows it"
+        self.nulls[pos] += (new.val is None) - (old.val is None)
+        if new.val is None:
+            return
+        key = sortkey(new.val)
+        low, high = self.mins[pos], self.maxs[pos]
+        if low is None or key < low:
+            self.mins[pos] = key
+        if high is None or key > high:
+            self.maxs[pos] = key
+
+    def copy(self) -> "Block":
+        block = Block(0)
+        block.rows = self.rows
+        block.mins, block.maxs, block.nulls = (
+            list(self.mins),
+            list(self.maxs),
+            list(self.nulls),
+        )
+        return block
+
+    def bytes(self) -> int:
+        # every column has a min and a max sortkey tuple
+        keys = 2 * len(self.mins) * sys.getsizeof((0, 0))
+        return sys.getsizeof(self) + 3 * sys.getsizeof(self.mins) + keys
+
+    def overlaps(self, pos: int, lo: tuple[int, Any], hi: tuple[int, Any]) -> bool:
+        "Whether some value of column pos may lie in [lo, hi]"
+        low, high = self.mins[pos], self.maxs[pos]
+        if low is None or high is None:
+            return False
+        return low <= hi and lo <= high
+
+
+# rows per zone map block
+BLOCK_ROWS = 1024
+# rows copied by one step of compaction
+COMPACT_ROWS = 4 * BLOCK_ROWS
+# share of deleted rows that starts compaction
+COMPACT_RATIO = 0.25
+# records of a CSV file inserted at once by import_csv()
+IMPORT_ROWS = 16 * BLOCK_ROWS
+# names of the rowid of a table, unless a column has them
+ROWID_NAMES = ("rowid", "_rowid_", "oid")
+
+
+@dataclass
+class Chunk:
+    "Rows of one zone map block as they were before their first change"
+
+    rows: list[list[Value]]
+    live: bytes
+    block: Block
+    # codes of the rows by position of their dictionary encoded column
+    codes: dict[int, "array.array[int]"]
+
+
+class Snapshot:
+    """
+    State of a table when a savepoint started.
+    Blocks of rows are copied into chunks only before they are first changed,
+    rows inserted since are cut off on rollback
+    """
+
+    def __init__(self, table: "Table") -> None:
+        self.nrows = len(table.data)
+        self.tombstones = table.tombstones
+        self.ordered = list(table.ordered)
+        self.indexes = list(table.indexes)
+        self.dictionaries = dict(table.dictionaries)
+        self.column_bytes = list(table.column_bytes)
+        self.row_bytes = table.row_bytes
+        self.block_bytes = table.block_bytes
+        self.nblocks = len(table.blocks)
+        # inserts may still fill the last block
+        self.lastblock = table.blocks[-1].copy() if table.blocks else None
+        self.chunks: dict[int, Chunk] = {}
+
+
+def istext(type_name: str) -> bool:
+    "Whether a declared column type has TEXT affinity in sqlite"
+    upper = type_name.upper()
+    return any(name in upper for name in ("CHAR", "CLOB", "TEXT"))
+
+
+def affinity(type_name: str) -> str:
+    "Affinity of a declared column type, by the rules of sqlite"
+    upper = type_name.upper()
+    if "INT" in upper:
+        return "INTEGER"
+    elif istext(type_name):
+        return "TEXT"
+    elif "BLOB" in upper or not upper:
+        return "BLOB"
+    elif any(name in upper for name in ("REAL", "FLOA", "DOUB")):
+        return "REAL"
+    return "NUMERIC"
+
+
+INTEGER_TEXT = re.compile(r"\s*[+-]?\d+\s*")
+NUMBER_TEXT = re.compile(r"\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*")
+
+
+def fromtext(type_name: str) -> Callable[[str], Value]:
+    """
+    Conversion of text read from a file into a value of a column, numbers
+    are stored as such in INTEGER, REAL and NUMERIC columns like sqlite does
+    """
+    kind = affinity(type_name)
+    if kind in ("TEXT", "BLOB"):
+        return TextValue
+
+    def convert(text: str) -> Value:
+        if kind != "REAL" and text.isascii() and text.isdigit():
+            # the common case, without matching
+            return IntegerValue(int(text))
+        if not NUMBER_TEXT.fullmatch(text):
+            return TextValue(text)
+        if kind != "REAL" and INTEGER_TEXT.fullmatch(text):
+            return IntegerValue(int(text))
+        val = float(text)
+        if kind != "REAL" and val.is_integer() and abs(val) < 2**63:
+            return IntegerValue(int(val))
+        return RealValue(val)
+
+    return convert
+
+
 class Table:
     tablename: str
     columns: list[str]
+    # declared types, "" for columns declared without one
+    types: list[str]
     data: list[list[Value]]
+    version: int
+    # ordered[i] is True while values of column i never decrease in row order
+    ordered: list[bool]
+    indexes: list[Index]
+    # dictionaries of TEXT columns by column position
+    dictionaries: dict[int, Dictionary]
+    # zone maps of data[i * BLOCK_ROWS : (i + 1) * BLOCK_ROWS]
+    blocks: list[Block]
+    # estimated bytes held by values of each column, by row lists, by zone maps
+    column_bytes: list[int]
+    row_bytes: int
+    block_bytes: int
+    # live[rowid] is 0 for deleted rows, scans skip them with itertools.compress
+    live: bytearray
+    tombstones: int
+    # copy of the table without deleted rows built by compact(),
+    # moved[rowid] is the position of a copied row in it or -1
+    shadow: "Table | None"
+    moved: "array.array[int]"
+    # one per savepoint the table was part of, innermost last
+    snapshots: list[Snapshot]
+    # storage is shared with a fork until own() copies it,
+    # rows before sharedrows may be shared even after that
+    shared: bool
+    sharedrows: int
+    # position of the rowid, the INTEGER PRIMARY KEY or a hidden last column,
+    # rows are kept in rowid order
+    key: int | None
+    # position of a PRIMARY KEY of another type, unique through an index
+    primary: int | None
+    # declared columns come first, the hidden rowid is not part of SELECT *
+    width: int
+
+    # attributes taken over from the shadow when compaction completes
+    STORAGE = (
+        "data",
+        "ordered",
+        "indexes",
+        "dictionaries",
+        "blocks",
+        "column_bytes",
+        "row_bytes",
+        "block_bytes",
+        "live",
+        "tombstones",
+    )
 
-    def __init__(self, tablename: str, columns: list[str]):
+    def __init__(
+        self,
+        tablename: str,
+        columns: list[str],
+        types: list[str] | None = None,
+        key: int | None = None,
+        width: int | None = None,
+    ):
         self.tablename = tablename
         self.columns = columns
+        self.types = types or [""] * len(columns)
         self.data = []
+        self.version = 0
+        self.ordered = [True] * len(columns)
+        self.indexes = []
+        self.dictionaries = {
+            i: Dictionary() for i, t in enumerate(types or []) if istext(t)
+        }
+        self.blocks = []
+        self.column_bytes = [0] * len(columns)
+        self.row_bytes = 0
+        self.block_bytes = 0
+        self.live = bytearray()
+        self.tombstones = 0
+        self.shadow = None
+        self.moved = array.array("q")
+        self.snapshots = []
+        self.shared = False
+        self.sharedrows = 0
+        self.key = key
+        self.primary = None
+        self.width = len(columns) if width is None else width
+
+    def fork(self) -> "Table":
+        "Table sharing the storage of this one until either of them is written"
+        table = copy.copy(self)
+        table.shadow = None
+        table.moved = array.array("q")
+        table.snapshots = []
+        self.shared = table.shared = True
+        self.sharedrows = table.sharedrows = len(self.data)
+        return table
+
+    def own(self) -> None:
+        """
+        Copies the containers of storage shared with forks before a write.
+        Rows, values and index buckets stay shared until they are changed
+        """
+        if not self.shared:
+            return
+        self.shared = False
+        self.data = list(self.data)
+        self.live = bytearray(self.live)
+        self.ordered = list(self.ordered)
+        self.column_bytes = list(self.column_bytes)
+        self.blocks = [block.copy() for block in self.blocks]
+        self.dictionaries = {i: d.copy() for i, d in self.dictionaries.items()}
+        self.indexes = [index.copy() for index in self.indexes]
 
     def insert_row(self, row: list[Value]) -> None:
+        "Appends the row, rows with a key below the last one are merged in"
+        if (
+            self.key is not None
+            and self.data
+            and sortkey(row[self.key].val) < sortkey(self.data[-1][self.key].val)
+        ):
+            self.merge([row])
+            return
+        self.own()
+        if self.data:
+            last = self.data[-1]
+            for i, ordered in enumerate(self.ordered):
+                if ordered and sortkey(row[i].val) < sortkey(last[i].val):
+                    self.ordered[i] = False
+
+        if not self.blocks or self.blocks[-1].rows == BLOCK_ROWS:
+            self.blocks.append(Block(len(self.columns)))
+            self.block_bytes += self.blocks[-1].bytes()
+        for index in self.indexes:
+            index.insert(row[index.position].val, len(self.data))
+        self.append(row)
+        self.blocks[-1].add(row)
+        self.version += 1
+
+    def insert_rows(self, rows: list[list[Value]]) -> None:
+        "Inserts rows in key order, the ones below the last key in one merge"
+        pos = self.key
+        if pos is None:
+            for row in rows:
+                self.insert_row(row)
+            return
+
+        def key(row: list[Value]) -> tuple[int, Any]:
+            return sortkey(row[pos].val)
+
+        rows = sorted(rows, key=key)
+        split = 0
+        if self.data:
+            split = bisect.bisect_left(rows, key(self.data[-1]), key=key)
+        if split:
+            self.merge(rows[:split])
+        for row in rows[split:]:
+            self.insert_row(row)
+
+    def append(self, row: list[Value]) -> None:
+        "Stores a new row last, dictionary encoded, and counts its bytes"
+        for i, value in enumerate(row):
+            dictionary = self.dictionaries.get(i)
+            if dictionary is None:
+                self.column_bytes[i] += valuesize(value)
+                continue
+            before = dictionary.bytes()
+            row[i] = dictionary.encode(value)
+            self.column_bytes[i] += dictionary.bytes() - before
+            if dictionary.full():
+                # the values stay shared by the rows already inserted
+                self.column_bytes[i] -= dictionary.bytes() - dictionary.valuebytes
+                del self.dictionaries[i]
+        self.row_bytes += sys.getsizeof(row) + POINTER_BYTES
         self.data.append(row)
+        self.live.append(1)
 
+    def merge(self, rows: list[list[Value]]) -> None:
+        """
+        Inserts rows sorted by key, all below the last key, at their key
+        positions. Later rows move up, so their blocks are copied for
+        savepoints first and zone maps are rebuilt from the first one on
+        """
+        pos = self.key
+        assert pos is not None
 
-class Engine:
-    _tables: dict[str, Table]
+        def key(row: list[Value]) -> tuple[int, Any]:
+            return sortkey(row[pos].val)
+
+        self.own()
+        # rows[j] goes before the row now at points[j]
+        points = []
+        lo = 0
+        for row in rows:
+            lo = bisect.bisect_right(self.data, key(row), lo=lo, key=key)
+            points.append(lo)
+        start = points[0]
+        for k in range(start // BLOCK_ROWS, len(self.blocks)):
+            self.touch(k * BLOCK_ROWS)
+        # compaction renumbers rows, it starts over
+        self.shadow = None
+        self.moved = array.array("q")
+
+        nrows = len(self.data)
+        for row in rows:
+            self.append(row)
+        # positions of the rows from start on in their new order,
+        # the new ones were appended after the nrows old ones
+        order: list[int] = []
+        for j, point in enumerate(points):
+            order.extend(range(start if j == 0 else points[j - 1], point))
+            order.append(nrows + j)
+        order.extend(range(points[-1], nrows))
+        self.data[start:] = [self.data[i] for i in order]
+        self.live[start:] = bytes([self.live[i] for i in order])
+        for dictionary in self.dictionaries.values():
+            codes = dictionary.codes
+            codes[start:] = array.array("I", [codes[i] for i in order])
+
+        inserted = [point + j for j, point in enumerate(points)]
+        for index in self.indexes:
+            index.renumber(start, points)
+            for rowid in inserted:
+                index.insert(self.data[rowid][index.position].val, rowid)
+        self.checkorder(inserted)
+        self.rezone(start // BLOCK_ROWS)
+        if self.sharedrows:
+            # positions of shared rows moved
+            self.sharedrows = len(self.data)
+        self.version += len(rows)
+
+    def checkorder(self, rowids: list[int]) -> None:
+        "Clears the ordered flags of columns whose values at rowids are out of order"
+        for i, ordered in enumerate(self.ordered):
+            if not ordered:
+                continue
+            for rowid in rowids:
+                val = sortkey(self.data[rowid][i].val)
+                if (rowid and sortkey(self.data[rowid - 1][i].val) > val) or (
+                    rowid + 1 < len(self.data)
+                    and val > sortkey(self.data[rowid + 1][i].val)
+                ):
+                    self.ordered[i] = False
+                    break
+
+    def rezone(self, first: int) -> None:
+        "Builds the zone maps from block first on again, after rows moved"
+        self.block_bytes -= sum(block.bytes() for block in self.blocks[first:])
+        del self.blocks[first:]
+        for lo in range(first * BLOCK_ROWS, len(self.data), BLOCK_ROWS):
+            block = Block(len(self.columns))
+            for row in self.data[lo : lo + BLOCK_ROWS]:
+                block.add(row)
+            self.blocks.append(block)
+            self.block_bytes += block.bytes()
+
+    def delete_row(self, rowid: int) -> None:
+        "Marks the row deleted, its memory is reclaimed by compact()"
+        if not self.live[rowid]:
+            return
+        self.own()
+        self.touch(rowid)
+        row = self.data[rowid]
+        for index in self.indexes:
+            index.remove(row[index.position].val, rowid)
+        self.live[rowid] = 0
+        self.tombstones += 1
+        if (moved := self.movedrowid(rowid)) is not None:
+            self.shadow.delete_row(moved)  # type: ignore[union-attr]
+        self.version += 1
+
+    def update_row(self, rowid: int, changes: dict[int, Value]) -> None:
+        "Replaces values of the row in place, changes are by column position"
+        self.own()
+        self.touch(rowid)
+        row = self.data[rowid]
+        if rowid < self.sharedrows:
+            row = self.data[rowid] = list(row)
+        block = self.blocks[rowid // BLOCK_ROWS]
+        for i, value in changes.items():
+            old = row[i]
+            dictionary = self.dictionaries.get(i)
+            if dictionary is None:
+                self.column_bytes[i] += valuesize(value) - valuesize(old)
+            else:
+                before = dictionary.bytes()
+                value = dictionary.recode(rowid, value)
+                self.column_bytes[i] += dictionary.bytes() - before
+                if dictionary.full():
+                    self.column_bytes[i] -= dictionary.bytes() - dictionary.valuebytes
+                    del self.dictionaries[i]
+
+            for index in self.indexes:
+                if index.position == i:
+                    index.remove(old.val, rowid)
+                    index.insert(value.val, rowid)
+            block.replace(i, old, value)
+            if sortkey(value.val) != sortkey(old.val):
+                self.ordered[i] = False
+            row[i] = value
+
+        if (moved := self.movedrowid(rowid)) is not None:
+            self.shadow.update_row(moved, changes)  # type: ignore[union-attr]
+        self.version += 1
+
+    def rows(self) -> Iterable[list[Value]]:
+        "Rows that are not deleted, in rowid order"
+        if not self.tombstones:
+            return self.data
+        return itertools.compress(self.data, self.live)
+
+    def rowrange(self, lo: int, hi: int) -> Iterable[list[Value]]:
+        if not self.tombstones:
+            return self.data[lo:hi]
+        return itertools.compress(self.data[lo:hi], self.live[lo:hi])
+
+    def count(self) -> int:
+        return len(self.data) - self.tombstones
+
+    def movedrowid(self, rowid: int) -> int | None:
+        "Position in the shadow of a row compaction already copied"
+        if self.shadow is None or rowid >= len(self.moved) or self.moved[rowid] < 0:
+            return None
+        return self.moved[rowid]
+
+    def compact(self, max_rows: int | None = None) -> bool:
+        """
+        Copies up to max_rows more live rows into a shadow table, then
+        replaces the storage with the shadow once all rows are copied.
+        Writes to copied rows are repeated on the shadow, rows inserted
+        meanwhile are copied by later steps. True when compaction is done,
+        it does not run inside transactions
+        """
+        if self.snapshots:
+            return False
+        if self.shadow is None:
+            if not self.tombstones:
+                return True
+            self.shadow = Table(self.tablename, self.columns)
+            self.shadow.dictionaries = {i: Dictionary() for i in self.dictionaries}
+            for index in self.indexes:
+                self.shadow.create_index(index.indexname, index.column)
+            self.moved = array.array("q")
+
+        shadow = self.shadow
+        start = len(self.moved)
+        end = len(self.data)
+        if max_rows is not None:
+            end = min(end, start + max_rows)
+        for rowid in range(start, end):
+            if self.live[rowid]:
+                self.moved.append(len(shadow.data))
+                # rows are copied, updates must not reach the other table
+                shadow.insert_row(list(self.data[rowid]))
+            else:
+                self.moved.append(-1)
+        if end < len(self.data):
+            return False
+
+        for name in self.STORAGE:
+            setattr(self, name, getattr(shadow, name))
+        # the shadow copied every row
+        self.shared = False
+        self.sharedrows = 0
+        self.shadow = None
+        self.moved = array.array("q")
+        return True
+
+    def savepoint(self) -> Snapshot:
+        # a rollback must not bring back storage shared with a fork
+        self.own()
+        # compaction renumbers rows, it starts over after the transaction
+        self.shadow = None
+        self.moved = array.array("q")
+        snapshot = Snapshot(self)
+        self.snapshots.append(snapshot)
+        return snapshot
+
+    def touch(self, rowid: int) -> None:
+        "Copies the block of a row before its first change since each savepoint"
+        k = rowid // BLOCK_ROWS
+        chunk = None
+        for snapshot in reversed(self.snapshots):
+            # outer savepoints have every chunk inner ones have,
+            # and all of them have fewer rows
+            if k in snapshot.chunks or k * BLOCK_ROWS >= snapshot.nrows:
+                break
+            if chunk is None:
+                lo, hi = k * BLOCK_ROWS, (k + 1) * BLOCK_ROWS
+                chunk = Chunk(
+                    [list(row) for row in self.data[lo:hi]],
+                    bytes(self.live[lo:hi]),
+                    self.blocks[k].copy(),
+                    {
+                        pos: dictionary.codes[lo:hi]
+                        for pos, dictionary in self.snapshots[0].dictionaries.items()
+                    },
+                )
+            snapshot.chunks[k] = chunk
+
+    def reindex(self, lo: int, hi: int, add: bool) -> None:
+        "Adds live rows in [lo, hi) to the indexes or removes them"
+        for index in self.indexes:
+            for rowid in itertools.compress(range(lo, hi), self.live[lo:hi]):
+                val = self.data[rowid][index.position].val
+                if add:
+                    index.insert(val, rowid)
+                else:
+                    index.remove(val, rowid)
+
+    def rollback(self, snapshot: Snapshot) -> None:
+        "Restores the table to snapshot, which stays active, inner ones are dropped"
+        while self.snapshots[-1] is not snapshot:
+            self.snapshots.pop()
+        self.indexes = list(snapshot.indexes)
+        self.dictionaries = dict(snapshot.dictionaries)
+
+        for k, chunk in snapshot.chunks.items():
+            lo, hi = k * BLOCK_ROWS, k * BLOCK_ROWS + len(chunk.rows)
+            self.reindex(lo, hi, add=False)
+            # chunks stay valid for another rollback, so they are copied again
+            self.data[lo:hi] = [list(row) for row in chunk.rows]
+            self.live[lo:hi] = chunk.live
+            self.blocks[k] = chunk.block.copy()
+            for pos, codes in chunk.codes.items():
+                if pos in self.dictionaries:
+                    self.dictionaries[pos].codes[lo : lo + len(codes)] = codes
+            self.reindex(lo, hi, add=True)
+
+        nrows = snapshot.nrows
+        self.reindex(nrows, len(self.data), add=False)
+        del self.data[nrows:]
+        del self.live[nrows:]
+        for dictionary in self.dictionaries.values():
+            del dictionary.codes[nrows:]
+        del self.blocks[snapshot.nblocks :]
+        if snapshot.lastblock is not None:
+            self.blocks[-1] = snapshot.lastblock.copy()
+
+        self.tombstones = snapshot.tombstones
+        self.ordered = list(snapshot.ordered)
+        self.column_bytes = list(snapshot.column_bytes)
+        self.row_bytes = snapshot.row_bytes
+        self.block_bytes = snapshot.block_bytes
+        # results cached during the transaction are stale
+        self.version += 1
+
+    def release(self, snapshot: Snapshot) -> None:
+        "Keeps the changes since snapshot, drops it and inner ones"
+        while self.snapshots.pop() is not snapshot:
+            pass
+
+    def rowsize(self, row: list[Value]) -> int:
+        "Bytes a row would add before dictionary encoding, as if every key was new"
+        size = sys.getsizeof(row) + POINTER_BYTES + sum(map(valuesize, row))
+        size += len(self.indexes) * (ROWID_BYTES + BUCKET_BYTES + POINTER_BYTES)
+        # share of a zone map block
+        return size + Block(len(self.columns)).bytes() // BLOCK_ROWS + 1
+
+    def bytes(self) -> int:
+        total = sum(self.column_bytes) + self.row_bytes + self.block_bytes
+        return total + sum(index.bytes for index in self.indexes)
+
+    def memory_usage(self) -> dict[str, Any]:
+        "Estimated bytes, tracked as rows are inserted"
+        return {
+            "columns": dict(zip(self.columns, self.column_bytes)),
+            "indexes": {index.indexname: index.bytes for index in self.indexes},
+            "rows": self.row_bytes,
+            "zone_maps": self.block_bytes,
+            "total": self.bytes(),
+        }
+
+    def create_index(self, indexname: str, column: str) -> Index:
+        if column not in self.columns:
+            raise EngineError(f"no such column: {column}")
+        self.own()
+        index = Index(indexname, column, self.columns.index(column))
+        for rowid, row in enumerate(self.data):
+            if self.live[rowid]:
+                index.insert(row[index.position].val, rowid)
+        self.indexes.append(index)
+        if self.shadow is not None:
+            self.shadow.create_index(indexname, column)
+        return index
+
+    def index_on(self, column: str) -> Index | None:
+        for index in self.indexes:
+            if index.column == column:
+                return index
+        return None
+
+    def keylookup(self, val: Any) -> list[int]:
+        "Positions of the live rows whose key is val"
+        return self.keyrange(sortkey(val), sortkey(val) + (1,))
 
+    def keyrange(self, lo: tuple[Any, ...], hi: tuple[Any, ...]) -> list[int]:
+        "Positions of the live rows whose key has a sortkey in [lo, hi), in key order"
+        pos = self.key
+        assert pos is not None
+
+        def key(row: list[Value]) -> tuple[int, Any]:
+            return sortkey(row[pos].val)
+
+        start = bisect.bisect_left(self.data, lo, key=key)
+        end = bisect.bisect_left(self.data, hi, key=key)
+        return list(itertools.compress(range(start, end), self.live[start:end]))
+
+    def maxkey(self) -> Any:
+        "Largest key of the live rows, None if there are none"
+        assert self.key is not None
+        for rowid in range(len(self.data) - 1, -1, -1):
+            if self.live[rowid]:
+                return self.data[rowid][self.key].val
+        return None
+
+    def holders(self, pos: int, val: Any) -> list[int]:
+        "Positions of the live rows with val in the key or primary key column pos"
+        if pos == self.key:
+            if not self.data or sortkey(val) > sortkey(self.data[-1][pos].val):
+                # past the last key, as for most inserts
+                return []
+            return self.keylookup(val)
+        index = self.index_on(self.columns[pos])
+        assert index is not None
+        return index.lookup(val)
+
+    def orderedrows(self, column: str) -> Iterable[list[Value]] | None:
+        "Rows in order of column values if that needs no sorting, else None"
+        if self.ordered[self.columns.index(column)]:
+            return self.rows()
+
+        index = self.index_on(column)
+        if index is None:
+            return None
+        return (
+            self.data[rowid]
+            for key in index.sortedkeys()
+            for rowid in index.buckets[key]
+        )
+
+
+class PartitionedTable:
+    """
+    Table split by the values of one column into partitions,
+    each a Table of its own. RANGE partition i holds the values below
+    bounds[i] and not below bounds[i - 1], in sortkey order, so NULLs go
+    to the first one. HASH partitions are picked by stablehash()
+    """
+
+    def __init__(
+        self,
+        tablename: str,
+        columns: list[str],
+        types: list[str],
+        column: str,
+        names: list[str],
+        bounds: list[tuple[int, Any]] | None = None,
+    ):
+        if column not in columns:
+            raise EngineError(f"no such column: {column}")
+        self.tablename = tablename
+        self.columns = columns
+        self.types = types
+        self.column = column
+        self.position = columns.index(column)
+        self.names = names
+        # sortkeys of the RANGE bounds, shorter by one with MAXVALUE,
+        # None for HASH
+        self.bounds = bounds
+        self.partitions = [Table(tablename, columns, types) for _ in names]
+        # partitioned tables have no rowid
+        self.width = len(columns)
+        # version changes not made by writes to the partitions
+        self.bumps = 0
+
+    @property
+    def version(self) -> int:
+        return self.bumps + sum(part.version for part in self.partitions)
+
+    @version.setter
+    def version(self, val: int) -> None:
+        self.bumps += val - self.version
+
+    @property
+    def indexes(self) -> list[Index]:
+        return self.partitions[0].indexes
+
+    def locate(self, val: Any) -> int | None:
+        "Partition of a value, None if no RANGE partition takes it"
+        if self.bounds is None:
+            return stablehash(val) % len(self.partitions)
+        pos = bisect.bisect_right(self.bounds, sortkey(val))
+        return pos if pos < len(self.partitions) else None
+
+    def partition(self, val: Any) -> Table:
+        pos = self.locate(val)
+        if pos is None:
+            raise EngineError(
+                f"table {self.tablename} has no partition for value {val}"
+            )
+        return self.partitions[pos]
+
+    def fork(self) -> "PartitionedTable":
+        table = copy.copy(self)
+        table.partitions = [part.fork() for part in self.partitions]
+        return table
+
+    def merged(self) -> Table:
+        "Rows of every partition in one Table with the same indexes, for joins"
+        table = Table(self.tablename, self.columns, self.types)
+        for row in self.rows():
+            table.insert_row(list(row))
+        for index in self.indexes:
+            table.create_index(index.indexname, index.column)
+        return table
+
+    def insert_row(self, row: list[Value]) -> None:
+        self.partition(row[self.position].val).insert_row(row)
+
+    def insert_rows(self, rows: list[list[Value]]) -> None:
+        for row in rows:
+            self.insert_row(row)
+
+    def rows(self) -> Iterable[list[Value]]:
+        return itertools.chain.from_iterable(part.rows() for part in self.partitions)
+
+    def count(self) -> int:
+        return sum(part.count() for part in self.partitions)
+
+    def rowsize(self, row: list[Value]) -> int:
+        return self.partitions[0].rowsize(row)
+
+    def bytes(self) -> int:
+        return sum(part.bytes() for part in self.partitions)
+
+    def memory_usage(self) -> dict[str, Any]:
+        "Sums over the partitions, and the total of each partition"
+        usage: dict[str, Any] = {
+            "columns": dict.fromkeys(self.columns, 0),
+            "indexes": {index.indexname: 0 for index in self.indexes},
+            "rows": 0,
+            "zone_maps": 0,
+            "total": 0,
+            "partitions": {},
+        }
+        for name, part in zip(self.names, self.partitions):
+            found = part.memory_usage()
+            for kind in ("columns", "indexes"):
+                for key, val in found[kind].items():
+                    usage[kind][key] += val
+            for kind in ("rows", "zone_maps", "total"):
+                usage[kind] += found[kind]
+            usage["partitions"][name] = found["total"]
+        return usage
+
+    def create_index(self, indexname: str, column: str) -> Index:
+        indexes = [part.create_index(indexname, column) for part in self.partitions]
+        return indexes[0]
+
+
+def uniques(table: Table) -> list[int]:
+    "Positions of the columns of table whose values must be unique"
+    return [pos for pos in (table.key, table.primary) if pos is not None]
+
+
+def parts(table: "Table | PartitionedTable") -> list[Table]:
+    "Tables holding the rows of a table, its partitions if it has them"
+    if isinstance(table, PartitionedTable):
+        return table.partitions
+    return [table]
+
+
+class Accumulator(abc.ABC):
+    @abc.abstractmethod
+    def step(self, val: Any) -> bool:
+        "Consume one value, True means the result now comes from this row"
+
+    @abc.abstractmethod
+    def final(self) -> Any:
+        pass
+
+
+class CountAcc(Accumulator):
+    def __init__(self) -> None:
+        self.count = 0
+
+    def step(self, val: Any) -> bool:
+        if val is not None:
+            self.count += 1
+        return False
+
+    def final(self) -> Any:
+        return self.count
+
+
+class SumAcc(Accumulator):
+    def __init__(self) -> None:
+        self.total: Any = None
+
+    def step(self, val: Any) -> bool:
+        if val is not None:
+            self.total = val if self.total is None else self.total + val
+        return False
+
+    def final(self) -> Any:
+        return self.total
+
+
+class AvgAcc(Accumulator):
+    def __init__(self) -> None:
+        self.total: Any = 0
+        self.count = 0
+
+    def step(self, val: Any) -> bool:
+        if val is not None:
+            self.total += val
+            self.count += 1
+        return False
+
+    def final(self) -> Any:
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+
+class MinAcc(Accumulator):
+    def __init__(self) -> None:
+        self.best: Any = None
+
+    def step(self, val: Any) -> bool:
+        if val is not None and (self.best is None or sortkey(val) < sortkey(self.best)):
+            self.best = val
+            return True
+        return False
+
+    def final(self) -> Any:
+        return self.best
+
+
+class MaxAcc(Accumulator):
     def __init__(self) -> None:
+        self.best: Any = None
+
+    def step(self, val: Any) -> bool:
+        if val is not None and (self.best is None or sortkey(val) > sortkey(self.best)):
+            self.best = val
+            return True
+        return False
+
+    def final(self) -> Any:
+        return self.best
+
+
+class DistinctAcc(Accumulator):
+    def __init__(self, inner: Accumulator) -> None:
+        self.inner = inner
+        self.seen: set[Any] = set()
+
+    def step(self, val: Any) -> bool:
+        if val in self.seen:
+            return False
+        self.seen.add(val)
+        return self.inner.step(val)
+
+    def final(self) -> Any:
+        return self.inner.final()
+
+
+AGGREGATES: dict[str, type[Accumulator]] = {
+    "COUNT": CountAcc,
+    "SUM": SumAcc,
+    "AVG": AvgAcc,
+    "MIN": MinAcc,
+    "MAX": MaxAcc,
+}
+
+
+def isaggregate(node: parser.Expr) -> bool:
+    return isinstance(node, parser.FunctionCall) and node.name in AGGREGATES
+
+
+@dataclass
+class Group:
+    key: tuple[Any, ...]
+    accs: list[Accumulator]
+    # row the bare columns of the group are taken from
+    row: list[Value]
+
+
+NewGroup = Callable[[tuple[Any, ...], list[Value]], Group]
+StepGroup = Callable[[Group, list[Value], dict[str, Value]], None]
+
+
+def transform(node: Any, fn: Callable[[Any], Any]) -> Any:
+    """
+    Copy of a statement or expression tree, fn returns the replacement
+    of a part or None to copy its parts. Unchanged parts are shared
+    """
+    new = fn(node)
+    if new is not None:
+        return new
+    if isinstance(node, list):
+        items = [transform(item, fn) for item in node]
+        return items if any(a is not b for a, b in zip(items, node)) else node
+    if is_dataclass(node) and not isinstance(node, type):
+        changes = {}
+        for field in fields(node):
+            val = getattr(node, field.name)
+            if (newval := transform(val, fn)) is not val:
+                changes[field.name] = newval
+        return replace(node, **changes) if changes else node
+    return node
+
+
+def qualifies(nodes: Iterable[parser.Expr | None]) -> bool:
+    "Whether a column reference in nodes is qualified by its table name"
+    return any(
+        isinstance(ref, parser.BindParameter) and "." in ref.ident
+        for node in nodes
+        if node is not None
+        for ref in parser.walk(node)
+    )
+
+
+def constant(value: Value) -> parser.Expr:
+    node = literal(value.val)
+    if node is None:
+        raise EngineError("BLOB values cannot be bound into a correlated subquery")
+    return node
+
+
+def membership(
+    elementval: Any, values: frozenset[Any], null: bool, isnot: bool
+) -> Value:
+    "Value of IN given the non NULL values of its container and if it has NULLs"
+    if not values and not null:
+        return IntegerValue(isnot)
+    if elementval is None:
+        return NullValue(None)
+    if elementval in values:
+        return IntegerValue(not isnot)
+    if null:
+        return NullValue(None)
+    return IntegerValue(isnot)
+
+
+def bindrefs(node: Any, values: dict[str, parser.Expr]) -> Any:
+    "node with the column references named in values replaced by their constants"
+
+    def bound(part: Any) -> Any:
+        if isinstance(part, parser.BindParameter):
+            return values.get(part.ident, part)
+        if isinstance(part, parser.InSelect | parser.Exists):
+            # a nested subquery sees the values only where they are outer to it
+            inner = {r.ident: values[r.ident] for r in part.refs if r.ident in values}
+            refs = [r for r in part.refs if r.ident not in inner]
+            part = replace(part, stmt=bindrefs(part.stmt, inner), refs=refs)
+            if isinstance(part, parser.InSelect):
+                part = replace(part, element=transform(part.element, bound))
+            return part
+        return None
+
+    return transform(node, bound)
+
+
+@dataclass
+class Materialized:
+    "Result of a subquery of IN or EXISTS"
+
+    # distinct non NULL values of its column, hashed for IN
+    values: frozenset[Any]
+    null: bool
+    rows: int
+
+
+KeyFunc = Callable[[list[Value]], tuple[Any, ...] | None]
+
+
+@dataclass
+class JoinInput:
+    "What every join operator needs besides its inputs"
+
+    matches: Callable[[list[Value]], bool]
+    isleft: bool
+    padding: list[Value]
+
+
+class Scope:
+    "Names under which the columns of (possibly joined) rows are visible"
+
+    def __init__(
+        self,
+        tablenames: list[str],
+        tables: Sequence[Table | PartitionedTable],
+        qualified: bool,
+    ):
+        self.tablenames = tablenames
+        self.tables = tables
+        self.qualified = qualified
+        self.columns = [c for t in tables for c in t.columns]
+        # positions of the declared columns, the ones SELECT * returns
+        self.visible: list[int] = []
+        offset = 0
+        for t in tables:
+            self.visible += range(offset, offset + t.width)
+            offset += len(t.columns)
+        self.keys = list(self.columns)
+        if qualified:
+            self.keys += [
+                f"{name}.{c}" for name, t in zip(tablenames, tables) for c in t.columns
+            ]
+
+    def join(self, other: "Scope") -> "Scope":
+        return Scope(
+            self.tablenames + other.tablenames, [*self.tables, *other.tables], True
+        )
+
+    def context(self, row: list[Value]) -> dict[str, Value]:
+        if self.qualified:
+            return dict(zip(self.keys, row * 2))
+        return dict(zip(self.keys, row))
+
+    def index(self, name: str) -> int:
+        if name not in self.keys:
+            raise EngineError(f"no such column: {name}")
+        return self.keys.index(name) % len(self.columns)
+
+    def ambiguous(self) -> set[str]:
+        "Bare column names present in more than one table"
+        seen: set[str] = set()
+        ambiguous: set[str] = set()
+        for table in self.tables:
+            for column in set(table.columns):
+                if column in seen:
+                    ambiguous.add(column)
+                seen.add(column)
+        return ambiguous
+
+    def covers(self, node: parser.Expr) -> bool:
+        "Whether every column referenced by node comes from this scope"
+        refs = [n for n in parser.walk(node) if isinstance(n, parser.BindParameter)]
+        return bool(refs) and all(n.ident in self.keys for n in refs)
+
+
+class Watchdog:
+    """
+    Stops the running statement on interrupt, past its deadline
+    or when the progress handler returns true.
+    Scan loops count rows and call check() every step() rows
+    """
+
+    # rows between checks of the interrupt flag and the deadline
+    CHECK_ROWS = 1000
+
+    def __init__(self) -> None:
+        self.interrupted = threading.Event()
+        self.deadline: float | None = None
+        self.handler: Callable[[], Any] | None = None
+        self.handler_rows = 0
+        self.counted = 0
+
+    def start(self, timeout: float | None) -> None:
+        self.interrupted.clear()
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.counted = 0
+
+    def step(self) -> int:
+        if self.handler is None:
+            return self.CHECK_ROWS
+        return min(self.CHECK_ROWS, self.handler_rows)
+
+    def check(self, rows: int) -> None:
+        if self.interrupted.is_set():
+            raise Interrupted("interrupted")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise QueryTimeout("query timed out")
+        if self.handler is not None:
+            self.counted += rows
+            if self.counted >= self.handler_rows:
+                self.counted = 0
+                if self.handler():
+                    raise Interrupted("interrupted")
+
+
+# statements allowed on engines made by Engine.snapshot()
+READONLY_STMTS = (parser.SelectStmt, parser.ExplainStmt, parser.PragmaStmt)
+# statements whose subqueries are resolved and conditions optimized before they run
+REWRITTEN_STMTS = (
+    parser.SelectStmt,
+    parser.ExplainStmt,
+    parser.DeleteStmt,
+    parser.UpdateStmt,
+)
+TRANSACTION_STMTS = (
+    parser.BeginStmt,
+    parser.CommitStmt,
+    parser.RollbackStmt,
+    parser.SavepointStmt,
+    parser.ReleaseStmt,
+)
+
+
+@dataclass
+class Savepoint:
+    # None for the savepoint started by BEGIN
+    name: str | None
+    tables: dict[str, "Table | PartitionedTable"]
+    snapshots: list[tuple[Table, Snapshot]]
+    # writes of the transaction made before the savepoint
+    logged: int = 0
+
+
+class Engine:
+    _tables: dict[str, Table | PartitionedTable]
+    result_cache: ResultCache | None
+    metrics: Metrics
+
+    def __init__(
+        self,
+        result_cache: ResultCache | None = None,
+        metrics: Metrics | None = None,
+        timeout: float | None = None,
+        memory_budget: int | None = None,
+        spill_dir: str | None = None,
+        memory_limit: int | None = None,
+    ) -> None:
         self._tables = {}
+        self.result_cache = result_cache
+        self.metrics = Metrics() if metrics is None else metrics
+        # default seconds a statement may run, None is unlimited
+        self.timeout = timeout
+        self.watchdog = Watchdog()
+        # bytes sort and DISTINCT may hold before spilling to files in spill_dir
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        # bytes the tables may hold, larger INSERTs fail, None is unlimited
+        self.memory_limit = memory_limit
+        # savepoints of the open transaction, innermost last
+        self.savepoints: list[Savepoint] = []
+        # set on engines made by snapshot()
+        self.readonly = False
+        # committed writes are appended to log, see replication.py
+        self.log: StatementLog | None = None
+        # writes of the open transaction, logged once it commits
+        self.uncommitted: list[tuple[parser.Stmt, str]] = []
+        # results of the subqueries of the running statement, see subquery()
+        self.subqueries: dict[
+            int, tuple[parser.SelectStmt, dict[tuple[Any, ...], Materialized]]
+        ] = {}
+        self.optimizer = Optimizer(lambda node: self.expr(node, {}).val)
+
+    def fork(self) -> "Engine":
+        """
+        Independent engine with the same tables and settings, in time
+        proportional to the number of tables. Table storage is shared
+        until one of the engines writes to the table
+        """
+        if self.savepoints:
+            raise EngineError("cannot fork within a transaction")
+        cache = self.result_cache
+        engine = Engine(
+            None if cache is None else ResultCache(cache.max_entries, cache.max_bytes),
+            Metrics(self.metrics.slow_query_seconds, self.metrics.slow_log.maxlen or 0),
+            self.timeout,
+            self.memory_budget,
+            self.spill_dir,
+            self.memory_limit,
+        )
+        engine._tables = {name: table.fork() for name, table in self._tables.items()}
+        return engine
 
-    def inserttable(self, table: Table) -> None:
+    def snapshot(self) -> "Engine":
+        "Read-only fork, which can be forked again into writable engines"
+        engine = self.fork()
+        engine.readonly = True
+        return engine
+
+    def interrupt(self) -> None:
+        "Stops the statement running in another thread, like sqlite3"
+        self.watchdog.interrupted.set()
+
+    def set_progress_handler(
+        self, handler: Callable[[], Any] | None, n: int = 1000
+    ) -> None:
+        """
+        handler is called every n rows scanned by a statement,
+        a true return value stops the statement. None removes it
+        """
+        if n <= 0:
+            handler = None
+        self.watchdog.handler = handler
+        self.watchdog.handler_rows = n
+
+    def checked(self, rows: Iterable[list[Value]]) -> Iterator[list[Value]]:
+        "Rows of a scan loop, the running statement may be stopped between them"
+        watchdog = self.watchdog
+        step = watchdog.step()
+        count = 0
+        for row in rows:
+            count += 1
+            if count == step:
+                watchdog.check(count)
+                count = 0
+            yield row
+
+    def inserttable(self, table: Table | PartitionedTable) -> None:
+        old = self._tables.get(table.tablename.lower())
+        if old is not None:
+            # results cached from the replaced table are stale
+            old.version += 1
         self._tables[table.tablename.lower()] = table
 
-    def gettable(self, tablename: str) -> Table:
+    def gettable(self, tablename: str) -> Table | PartitionedTable:
         return self._tables[tablename.lower()]
 
     def hastable(self, tablename: str) -> bool:
@@ -75,31 +1565,81 @@ class Engine:
                 return TextValue(val)
             case parser.ConstInt(val):
                 return IntegerValue(val)
+            case parser.ConstReal(val):
+                return RealValue(val)
+            case parser.ConstNull():
+                return NullValue(None)
             case parser.BindParameter(val):
                 return context[node.ident]
+            case parser.FunctionCall(name):
+                # aggregates are computed per group and placed into context
+                if repr(node) in context:
+                    return context[repr(node)]
+                if name in AGGREGATES:
+                    raise EngineError(f"misuse of aggregate function {name}()")
+                raise EngineError(f"no such function: {name}")
+            # InSet is an InExpr, it must match first
+            case InSet(element, _, isnot, values, null):
+                elementval = self.expr(element, context).val
+                return membership(elementval, values, null, isnot)
             case parser.InExpr(element, container, isnot):
                 elementval = self.expr(element, context).val
                 containerval = [self.expr(e, context).val for e in container]
+                if elementval is None or (
+                    elementval not in containerval and None in containerval
+                ):
+                    return NullValue(None)
                 if isnot:
                     return IntegerValue(elementval not in containerval)
                 else:
                     return IntegerValue(elementval in containerval)
+            case parser.InSelect(element, _, isnot):
+                found = self.subquery(node, context)
+                elementval = self.expr(element, context).val
+                return membership(elementval, found.values, found.null, isnot)
+            case parser.Exists():
+                return IntegerValue(self.subquery(node, context).rows > 0)
             case parser.LikeExpr(element, pattern, isnot):
                 elementval = self.expr(element, context).val
                 patternval = self.expr(pattern, context).val
-                modified_pattern = patternval.replace("%", ".*").replace("_", ".")
-                regex_pattern = re.compile(modified_pattern, re.IGNORECASE)
-                return IntegerValue(regex_pattern.fullmatch(elementval) is not None)
+                if elementval is None or patternval is None:
+                    return NullValue(None)
+                matched = compile_like(str(patternval))(str(elementval))
+                return IntegerValue(matched != isnot)
             case parser.UnaryOperator(expr, op):
                 expr = self.expr(expr, context)
+                if expr.val is None:
+                    return NullValue(None)
                 if op == TT.NOT:
                     return IntegerValue(not expr.val)
                 else:
                     raise EngineError(f"Unary op {op} is not implemented")
             case parser.BinaryOperator(lhs, op, rhs):
                 lhsval = self.expr(lhs, context).val
+                # the right side is not evaluated if the left one decides
+                if op == TT.OR and lhsval == 1:
+                    return IntegerValue(1)
+                if op == TT.AND and lhsval is not None and lhsval != 1:
+                    return IntegerValue(0)
                 rhsval = self.expr(rhs, context).val
 
+                if op == TT.OR:
+                    if rhsval == 1:
+                        return IntegerValue(1)
+                    if lhsval is None or rhsval is None:
+                        return NullValue(None)
+                    return IntegerValue(0)
+                elif op == TT.AND:
+                    if lhsval is None or rhsval is None:
+                        other = rhsval if lhsval is None else lhsval
+                        if other is not None and other != 1:
+                            return IntegerValue(0)
+                        return NullValue(None)
+                    return IntegerValue(lhsval == 1 and rhsval == 1)
+
+                if lhsval is None or rhsval is None:
+                    return NullValue(None)
+
                 if op == TT.EQUAL:
                     return IntegerValue(lhsval == rhsval)
                 elif op == TT.NOT_EQUAL:
@@ -112,17 +1652,21 @@ class Engine:
                     return IntegerValue(lhsval > rhsval)
                 elif op == TT.GE:
                     return IntegerValue(lhsval >= rhsval)
-                elif op == TT.OR:
-                    return IntegerValue(lhsval == 1 or rhsval == 1)
-                elif op == TT.AND:
-                    return IntegerValue(lhsval == 1 and rhsval == 1)
                 else:
                     raise EngineError(f"{op} operator is not implemented")
 
+            case parser.IsExpr(lhs, rhs, isnot):
+                lhsval = self.expr(lhs, context).val
+                rhsval = self.expr(rhs, context).val
+                if isnot:
+                    return IntegerValue(lhsval != rhsval)
+                return IntegerValue(lhsval == rhsval)
             case parser.Between(expr, lower, upper, isnot):
                 exprval = self.expr(expr, context).val
                 lowerval = self.expr(lower, context).val
                 upperval = self.expr(upper, context).val
+                if None in (exprval, lowerval, upperval):
+                    return NullValue(None)
                 output = lowerval <= exprval <= upperval
                 if isnot:
                     output = not output
@@ -131,86 +1675,1841 @@ class Engine:
                 raise EngineError(f"Not implemented expr {node}")
 
     def createstmt(self, stmt: parser.CreateStmt) -> None:
-        table = Table(stmt.tablename, [cd.column_name for cd in stmt.columndefs])
-        self.inserttable(table)
+        columns = [cd.column_name for cd in stmt.columndefs]
+        types = [cd.type_name for cd in stmt.columndefs]
+        keys = [i for i, cd in enumerate(stmt.columndefs) if cd.primary_key]
+        if len(keys) > 1:
+            raise EngineError(f'table "{stmt.tablename}" has more than one primary key')
+        partition_by = stmt.partition_by
+        if partition_by is None:
+            self.inserttable(self.newtable(stmt.tablename, columns, types, keys))
+            return
+        if keys:
+            raise EngineError("PRIMARY KEY is not supported on partitioned tables")
+
+        if partition_by.method == TT.HASH:
+            if partition_by.count < 1:
+                raise EngineError("number of partitions must be at least 1")
+            names = [f"p{i}" for i in range(partition_by.count)]
+            self.inserttable(
+                PartitionedTable(
+                    stmt.tablename, columns, types, partition_by.column, names
+                )
+            )
+            return
+
+        names = [p.name for p in partition_by.ranges]
+        if len({name.lower() for name in names}) < len(names):
+            raise EngineError("duplicate partition name")
+        bounds: list[tuple[int, Any]] = []
+        for i, p in enumerate(partition_by.ranges):
+            if p.bound is None:
+                if i != len(names) - 1:
+                    raise EngineError("MAXVALUE can only be used in last partition")
+                continue
+            if isinstance(p.bound, parser.ConstNull):
+                raise EngineError("partition bound cannot be NULL")
+            bound = sortkey(p.bound.val)  # type: ignore[attr-defined]
+            if bounds and bound <= bounds[-1]:
+                raise EngineError("VALUES LESS THAN must be strictly increasing")
+            bounds.append(bound)
+        self.inserttable(
+            PartitionedTable(
+                stmt.tablename, columns, types, partition_by.column, names, bounds
+            )
+        )
+
+    def newtable(
+        self, tablename: str, columns: list[str], types: list[str], keys: list[int]
+    ) -> Table:
+        """
+        Table keyed by its INTEGER PRIMARY KEY or else by a hidden rowid
+        column named like the first of ROWID_NAMES that is not declared.
+        Other primary keys get an index, as in sqlite
+        """
+        width = len(columns)
+        if keys and types[keys[0]].upper() == "INTEGER":
+            return Table(tablename, columns, types, keys[0])
+        free = [name for name in ROWID_NAMES if name not in columns]
+        if free:
+            columns, types = columns + free[:1], types + ["INTEGER"]
+        table = Table(tablename, columns, types, width if free else None, width)
+        if keys:
+            table.primary = keys[0]
+            table.create_index(f"sqlite_autoindex_{tablename}_1", columns[keys[0]])
+        return table
+
+    def createindexstmt(self, stmt: parser.CreateIndexStmt) -> None:
+        for table in self._tables.values():
+            for index in table.indexes:
+                if index.indexname.lower() == stmt.indexname.lower():
+                    raise EngineError(f"index {stmt.indexname} already exists")
+        self.gettable(stmt.tablename).create_index(stmt.indexname, stmt.column)
 
     def insertstmt(self, stmt: parser.InsertStmt) -> None:
         table = self.gettable(stmt.tablename)
+        rows = []
         for row in stmt.values:
+            if len(row.exprs) != table.width:
+                raise EngineError(
+                    f"table {table.tablename} has {table.width} columns "
+                    f"but {len(row.exprs)} values were supplied"
+                )
             row_values: list[Value] = []
             for expr in row.exprs:
                 if isinstance(expr, parser.ConstInt):
                     row_values.append(IntegerValue(expr.val))
                 elif isinstance(expr, parser.ConstString):
                     row_values.append(TextValue(expr.val))
+                elif isinstance(expr, parser.ConstReal):
+                    row_values.append(RealValue(expr.val))
+                elif isinstance(expr, parser.ConstNull):
+                    row_values.append(NullValue(None))
                 else:
                     raise EngineError("expr error")
+            rows.append(row_values)
+        self.insertrows(table, rows)
+
+    def insertrows(
+        self, table: Table | PartitionedTable, rows: list[list[Value]]
+    ) -> None:
+        "Inserts all of rows, or raises before any is inserted"
+        if isinstance(table, Table):
+            if len(table.columns) > table.width:
+                # the hidden rowid, assigned by checkkeys()
+                for row_values in rows:
+                    row_values.append(NullValue(None))
+            self.checkkeys(table, rows)
+
+        if self.memory_limit is not None:
+            # the whole statement is rejected, no row is inserted
+            used = sum(t.bytes() for t in self._tables.values())
+            needed = sum(map(table.rowsize, rows))
+            if used + needed > self.memory_limit:
+                raise MemoryLimitExceeded(
+                    f"INSERT into {table.tablename} needs about {needed} bytes, "
+                    f"{used} of the {self.memory_limit} byte memory limit are in use"
+                )
+
+        if isinstance(table, PartitionedTable):
+            # raises before any row is inserted if one has no partition
+            for row_values in rows:
+                table.partition(row_values[table.position].val)
+
+        table.insert_rows(rows)
+
+    def checkkeys(self, table: Table, rows: list[list[Value]]) -> None:
+        """
+        Raises before any of rows is inserted if a key or primary key is
+        taken, rowids are made integers and NULL ones get the largest plus one
+        """
+        for pos in uniques(table):
+            seen: set[Any] = set()
+            # largest rowid so far, looked up for the first NULL rowid
+            top: Any = None
+            known = False
+            for row in rows:
+                val = row[pos].val
+                if pos == table.key:
+                    if val is None:
+                        if not known:
+                            top = max([table.maxkey(), *seen], key=sortkey)
+                            known = True
+                        val = 1 if top is None else top + 1
+                    val = rowidvalue(val)
+                    row[pos] = IntegerValue(val)
+                    if known and (top is None or val > top):
+                        top = val
+                if val is None:
+                    # NULLs are distinct from each other
+                    continue
+                if val in seen or table.holders(pos, val):
+                    column = table.columns[pos]
+                    raise EngineError(
+                        f"UNIQUE constraint failed: {table.tablename}.{column}"
+                    )
+                seen.add(val)
+
+    def checkupdatedkeys(
+        self, table: Table, changes: list[tuple[int, dict[int, Value]]]
+    ) -> None:
+        "Raises before any row is updated if the keys would not be unique"
+        updated = {rowid for rowid, _ in changes}
+        for pos in uniques(table):
+            seen: set[Any] = set()
+            for _, change in changes:
+                if pos not in change:
+                    continue
+                val = change[pos].val
+                if pos == table.key:
+                    if val is None:
+                        raise EngineError("datatype mismatch")
+                    change[pos] = IntegerValue(rowidvalue(val))
+                    val = change[pos].val
+                if val is None:
+                    continue
+                # updated rows give up their old keys
+                holders = table.holders(pos, val)
+                if val in seen or any(r not in updated for r in holders):
+                    column = table.columns[pos]
+                    raise EngineError(
+                        f"UNIQUE constraint failed: {table.tablename}.{column}"
+                    )
+                seen.add(val)
+
+    def deletestmt(self, stmt: parser.DeleteStmt) -> None:
+        table = self.gettable(stmt.tablename)
+        for part in self.prunedparts(table, stmt.where):
+            for rowid in self.whererowids(part, stmt.where):
+                part.delete_row(rowid)
+
+    def updatestmt(self, stmt: parser.UpdateStmt) -> None:
+        table = self.gettable(stmt.tablename)
+        exprs = [stmt.where] + [a.expr for a in stmt.assignments]
+        scope = Scope([table.tablename], parts(table)[:1], qualifies(exprs))
+        positions = []
+        for assignment in stmt.assignments:
+            if assignment.column not in table.columns:
+                raise EngineError(f"no such column: {assignment.column}")
+            positions.append(table.columns.index(assignment.column))
+
+        # rows are found before any is changed, moved rows are not seen again
+        updates = []
+        for part in self.prunedparts(table, stmt.where):
+            for rowid in self.whererowids(part, stmt.where):
+                # every expression sees the row as it was before the update
+                context = scope.context(part.data[rowid])
+                values = [self.expr(a.expr, context) for a in stmt.assignments]
+                changes = dict(zip(positions, values))
+                target = part
+                if isinstance(table, PartitionedTable) and table.position in changes:
+                    target = table.partition(changes[table.position].val)
+                updates.append((part, rowid, changes, target))
+
+        if isinstance(table, Table) and set(uniques(table)) & set(positions):
+            self.checkupdatedkeys(table, [(u[1], u[2]) for u in updates])
+
+        # rows move to the partition of their new value or to the position
+        # of their new key, they are inserted once every row is updated
+        moved: dict[Table, list[list[Value]]] = {}
+        for part, rowid, changes, target in updates:
+            row = part.data[rowid]
+            key = part.key
+            if target is part and (
+                key is None or key not in changes or changes[key].val == row[key].val
+            ):
+                part.update_row(rowid, changes)
+                continue
+            moved.setdefault(target, []).append(
+                [changes.get(i, value) for i, value in enumerate(row)]
+            )
+            part.delete_row(rowid)
+        for target, rows in moved.items():
+            target.insert_rows(rows)
+
+    def whererowids(self, table: Table, where: parser.Expr | None) -> list[int]:
+        "Positions of the live rows matching WHERE, found like the rows of a SELECT"
+        scope = Scope([table.tablename], [table], qualifies([where]))
+        found = self.keyrowids(table, scope, where)
+        if found is None:
+            found = self.dictrowids(table, scope, where)
+        rowids: list[int] | None
+        if found is not None:
+            rowids, where = found
+        else:
+            rowids = self.likerowids(table, where)
+        if rowids is None:
+            ranges = self.blockranges(table, scope, where) or [(0, len(table.data))]
+            rowids = [
+                rowid
+                for lo, hi in ranges
+                for rowid in itertools.compress(range(lo, hi), table.live[lo:hi])
+            ]
+        self.metrics.rows_scanned += len(rowids)
+        if where is None:
+            return rowids
+        rows = self.checked(table.data[rowid] for rowid in rowids)
+        keep = Filter(where, self.expr)
+        return [rowid for rowid, row in zip(rowids, rows) if keep(scope.context(row))]
+
+    def storage(self) -> Iterator[Table]:
+        "Every Table holding rows, partitions in place of partitioned tables"
+        for table in self._tables.values():
+            yield from parts(table)
+
+    def prunedparts(
+        self, table: Table | PartitionedTable, where: parser.Expr | None
+    ) -> list[Table]:
+        "Tables that may hold rows of table matching WHERE"
+        if not isinstance(table, PartitionedTable):
+            return [table]
+        scope = Scope([table.tablename], [table.partitions[0]], False)
+        found = set(range(len(table.partitions)))
+        for pred in conjuncts(where):
+            possible = self.partitioncheck(table, scope, pred)
+            if possible is not None:
+                found &= possible
+        return [table.partitions[i] for i in sorted(found)]
+
+    def partitioncheck(
+        self, table: PartitionedTable, scope: Scope, pred: parser.Expr
+    ) -> set[int] | None:
+        """
+        Partitions that may hold rows satisfying pred, None if pred is not
+        supported. HASH partitions are pruned by = and IN only
+        """
+        consts = (parser.ConstInt, parser.ConstReal, parser.ConstString)
+        flipped = {TT.LT: TT.GT, TT.LE: TT.GE, TT.GT: TT.LT, TT.GE: TT.LE}
+        bounds = table.bounds
+        last = len(table.partitions) - 1
+
+        def oncolumn(node: parser.Expr) -> bool:
+            return (
+                isinstance(node, parser.BindParameter)
+                and scope.index(node.ident) == table.position
+            )
+
+        def located(values: list[Any]) -> set[int]:
+            found = {table.locate(val) for val in values}
+            return {pos for pos in found if pos is not None}
+
+        match pred:
+            case parser.BinaryOperator(lhs, op, rhs) if op in (TT.EQUAL, *flipped):
+                if isinstance(lhs, consts):
+                    lhs, rhs, op = rhs, lhs, flipped.get(op, op)
+                if not oncolumn(lhs) or not isinstance(rhs, consts):
+                    return None
+                if op == TT.EQUAL:
+                    return located([rhs.val])
+                if bounds is None:
+                    return None
+                key = sortkey(rhs.val)
+                if op == TT.LT:
+                    return set(range(min(bisect.bisect_left(bounds, key), last) + 1))
+                elif op == TT.LE:
+                    return set(range(min(bisect.bisect_right(bounds, key), last) + 1))
+                return set(range(bisect.bisect_right(bounds, key), last + 1))
+            case parser.Between(lhs, lower, upper, False) if oncolumn(lhs):
+                if bounds is None:
+                    return None
+                if not isinstance(lower, consts) or not isinstance(upper, consts):
+                    return None
+                first = bisect.bisect_right(bounds, sortkey(lower.val))
+                end = bisect.bisect_right(bounds, sortkey(upper.val))
+                return set(range(first, min(end, last) + 1))
+            case parser.InExpr(lhs, container, False) if oncolumn(lhs):
+                if not all(isinstance(e, consts) for e in container):
+                    return None
+                return located([e.val for e in container])  # type: ignore[attr-defined]
+            case parser.IsExpr(lhs, parser.ConstNull(), False) if oncolumn(lhs):
+                return located([None])
+        return None
+
+    def compact(self, max_rows: int | None = None) -> bool:
+        """
+        One step of compaction of every table with enough deleted rows,
+        up to max_rows rows copied per table, None runs it to completion.
+        True when no compaction is left in progress
+        """
+        done = True
+        for table in self.storage():
+            deleted = table.tombstones / max(len(table.data), 1)
+            if table.shadow is not None or deleted > COMPACT_RATIO:
+                done = table.compact(max_rows) and done
+        return done
+
+    def savepoint(self, name: str | None) -> None:
+        snapshots = [(table, table.savepoint()) for table in self.storage()]
+        logged = len(self.uncommitted)
+        self.savepoints.append(Savepoint(name, dict(self._tables), snapshots, logged))
+
+    def findsavepoint(self, name: str) -> int:
+        for i in reversed(range(len(self.savepoints))):
+            found = self.savepoints[i].name
+            if found is not None and found.lower() == name.lower():
+                return i
+        raise EngineError(f"no such savepoint: {name}")
+
+    def rollbackto(self, i: int) -> None:
+        "Undoes changes since savepoint i, which stays open"
+        savepoint = self.savepoints[i]
+        del self.savepoints[i + 1 :]
+        del self.uncommitted[savepoint.logged :]
+        for table in self._tables.values():
+            if table.tablename.lower() not in savepoint.tables:
+                # results cached from tables created since are stale
+                table.version += 1
+        self._tables = dict(savepoint.tables)
+        for table, snapshot in savepoint.snapshots:
+            table.rollback(snapshot)
+
+    def releaseto(self, i: int) -> None:
+        "Keeps changes since savepoint i, closes it and the ones inside it"
+        for table, snapshot in self.savepoints[i].snapshots:
+            table.release(snapshot)
+        del self.savepoints[i:]
+        if not self.savepoints and self.uncommitted:
+            # the transaction committed
+            if self.log is not None:
+                self.log.append(self.uncommitted)
+            self.uncommitted = []
+
+    def beginstmt(self, stmt: parser.BeginStmt) -> None:
+        if self.savepoints:
+            raise EngineError("cannot start a transaction within a transaction")
+        self.savepoint(None)
+
+    def commitstmt(self, stmt: parser.CommitStmt) -> None:
+        if not self.savepoints:
+            raise EngineError("cannot commit - no transaction is active")
+        self.releaseto(0)
 
-            table.insert_row(row_values)
+    def rollbackstmt(self, stmt: parser.RollbackStmt) -> None:
+        if stmt.savepoint is not None:
+            self.rollbackto(self.findsavepoint(stmt.savepoint))
+            return
+        if not self.savepoints:
+            raise EngineError("cannot rollback - no transaction is active")
+        self.rollbackto(0)
+        self.releaseto(0)
+
+    def savepointstmt(self, stmt: parser.SavepointStmt) -> None:
+        "Outside of a transaction SAVEPOINT starts one, like in sqlite"
+        self.savepoint(stmt.name)
+
+    def releasestmt(self, stmt: parser.ReleaseStmt) -> None:
+        self.releaseto(self.findsavepoint(stmt.name))
+
+    def selecttables(
+        self, stmt: parser.SelectStmt
+    ) -> list[Table | PartitionedTable] | None:
+        tablenames = [] if stmt.tablename is None else [stmt.tablename]
+        tablenames += [j.tablename for j in stmt.joins]
+        for tablename in tablenames:
+            if not self.hastable(tablename):
+                print(f"OperationalError (SQLITE_ERROR): no such table: {tablename}")
+                return None
+
+        if stmt.tablename is None:
+            raise EngineError("What to do if there is no tablename?")
+
+        return [self.gettable(name) for name in tablenames]
 
     def selectstmt(self, stmt: parser.SelectStmt) -> Any:
-        if stmt.tablename is not None and not self.hastable(stmt.tablename):
-            print(f"OperationalError (SQLITE_ERROR): no such table: {stmt.tablename}")
+        tables = self.selecttables(stmt)
+        if tables is None:
             return None
 
+        if self.result_cache is None:
+            return self.runselect(stmt, tables)
+
+        # dataclass repr is independent of whitespace and keyword case
+        # and includes every literal of the statement
+        key = repr(stmt)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            return cached
+
+        output = self.runselect(stmt, tables)
+        deps = tables + [
+            t for sub in parser.subselects(stmt) for t in self.subtables(sub)
+        ]
+        self.result_cache.put(key, deps, output)
+        return output
+
+    def subtables(self, stmt: parser.SelectStmt) -> list[Table | PartitionedTable]:
+        "Tables of a SELECT nested in an expression"
         if stmt.tablename is None:
-            raise EngineError("What to do if there is no tablename?")
+            raise EngineError("subqueries without FROM are not supported")
+        tablenames = [stmt.tablename] + [j.tablename for j in stmt.joins]
+        for tablename in tablenames:
+            if not self.hastable(tablename):
+                raise EngineError(f"no such table: {tablename}")
+        return [self.gettable(name) for name in tablenames]
 
-        table = self.gettable(stmt.tablename)
+    def outerrefs(self, stmt: parser.SelectStmt) -> list[parser.BindParameter]:
+        "Column references of a resolved subquery to enclosing queries"
+        assert stmt.tablename is not None
+        names = [stmt.tablename] + [j.tablename for j in stmt.joins]
+        own = set(Scope(names, self.subtables(stmt), True).keys)
+        refs: dict[str, parser.BindParameter] = {}
+        for node in self.columnrefs(stmt):
+            if node.ident not in own:
+                refs.setdefault(node.ident, node)
+        return list(refs.values())
 
-        column_ids: list[int] = []
-        for rcol in stmt.result_columns:
-            if rcol == "*":
-                column_ids.extend(range(len(table.columns)))
+    def resolve(self, stmt: Any) -> Any:
+        """
+        stmt with the outer column references of its subqueries listed in
+        their refs, where every analysis of the enclosing query sees them
+        """
+
+        def resolved(node: Any) -> Any:
+            if isinstance(node, parser.InSelect | parser.Exists):
+                inner = self.resolve(node.stmt)
+                node = replace(node, stmt=inner, refs=self.outerrefs(inner))
+                if isinstance(node, parser.InSelect):
+                    node = replace(node, element=transform(node.element, resolved))
+                return node
+            return None
+
+        return transform(stmt, resolved)
+
+    def rewrite(self, stmt: Any) -> Any:
+        "stmt with rowid names replaced, resolved subqueries and optimized conditions"
+        stmt = self.rowidrefs(stmt, {})
+        if any(parser.subselects(stmt)):
+            stmt = self.resolve(stmt)
+        return self.optimizer.stmt(stmt)
+
+    def rowidrefs(self, stmt: Any, outer: dict[str, str]) -> Any:
+        """
+        stmt with the names in ROWID_NAMES that are not columns replaced by
+        the column holding the rowid. Bare names are replaced when there is
+        one table, qualified ones also in nested SELECTs. outer maps the
+        names of enclosing queries
+        """
+        if isinstance(stmt, parser.ExplainStmt):
+            return replace(stmt, stmt=self.rowidrefs(stmt.stmt, outer))
+        names = [] if stmt.tablename is None else [stmt.tablename]
+        if isinstance(stmt, parser.SelectStmt):
+            names += [join.tablename for join in stmt.joins]
+        mapping = {name: column for name, column in outer.items() if "." in name}
+        mapping |= self.rowidnames(names)
+
+        def renamed(node: Any) -> Any:
+            if isinstance(node, parser.SelectStmt) and node is not stmt:
+                return self.rowidrefs(node, mapping)
+            if isinstance(node, parser.BindParameter) and node.ident in mapping:
+                return replace(node, ident=mapping[node.ident])
+            return None
+
+        stmt = transform(stmt, renamed)
+        if isinstance(stmt, parser.UpdateStmt):
+            assignments = [
+                replace(a, column=mapping.get(a.column, a.column))
+                for a in stmt.assignments
+            ]
+            stmt = replace(stmt, assignments=assignments)
+        if (
+            isinstance(stmt, parser.SelectStmt)
+            and (term := stmt.orderingterm) is not None
+            and term.ident in mapping
+            # ORDER BY may name a result column instead
+            and self.aliasposition(stmt, term.ident) is None
+        ):
+            term = replace(term, ident=mapping[term.ident])
+            stmt = replace(stmt, orderingterm=term)
+        return stmt
+
+    def rowidnames(self, tablenames: list[str]) -> dict[str, str]:
+        "Columns holding the rowid of tables by the rowid names that are not columns"
+        mapping = {}
+        for name in tablenames:
+            table = self._tables.get(name.lower())
+            if not isinstance(table, Table) or table.key is None:
+                continue
+            column = table.columns[table.key]
+            for alias in ROWID_NAMES:
+                if alias in table.columns:
+                    continue
+                mapping[f"{name}.{alias}"] = f"{name}.{column}"
+                if len(tablenames) == 1:
+                    mapping[alias] = column
+        return mapping
+
+    def subquery(
+        self, node: parser.InSelect | parser.Exists, context: dict[str, Value]
+    ) -> Materialized:
+        """
+        Result of the subquery of IN or EXISTS. It runs once per statement,
+        or once per distinct value of its outer references if it has any
+        """
+        stmt = node.stmt
+        try:
+            outer = [context[r.ident] for r in node.refs]
+        except KeyError as e:
+            raise EngineError(f"no such column: {e.args[0]}") from None
+        entry = self.subqueries.get(id(stmt))
+        if entry is None or entry[0] is not stmt:
+            entry = self.subqueries[id(stmt)] = (stmt, {})
+        key = tuple((type(value), value.val) for value in outer)
+        if (found := entry[1].get(key)) is not None:
+            return found
+
+        if node.refs:
+            values = {r.ident: constant(v) for r, v in zip(node.refs, outer)}
+            stmt = bindrefs(stmt, values)
+        tables = self.subtables(stmt)
+        exists = isinstance(node, parser.Exists)
+        if exists and stmt.limit is None:
+            # one row decides EXISTS
+            stmt = replace(stmt, limit=parser.Limit(1, 0))
+        elif not exists and len(names := self.resultnames(stmt, tables)) != 1:
+            raise EngineError(f"sub-select returns {len(names)} columns - expected 1")
+
+        rows = self.runselect(stmt, tables)
+        column = [] if exists else [row[0] for row in rows]
+        distinct = frozenset(val for val in column if val is not None)
+        found = Materialized(distinct, None in column, len(rows))
+        entry[1][key] = found
+        return found
+
+    def explainstmt(self, stmt: parser.ExplainStmt) -> Any:
+        "Runs the SELECT bypassing the cache, returns its stages instead of rows"
+        tables = self.selecttables(stmt.stmt)
+        if tables is None:
+            return None
+
+        profile = Profile()
+        self.runselect(stmt.stmt, tables, profile)
+        return profile.rows()
+
+    def pragmastmt(self, stmt: parser.PragmaStmt) -> Any:
+        "PRAGMA memory_usage: (table, kind, name, bytes) rows of memory_usage()"
+        if stmt.name.lower() != "memory_usage":
+            raise EngineError(f"unknown pragma: {stmt.name}")
+
+        usage = self.memory_usage()
+        output: list[tuple[Any, ...]] = []
+        for tablename, table in usage["tables"].items():
+            output += [(tablename, "column", k, v) for k, v in table["columns"].items()]
+            output += [(tablename, "index", k, v) for k, v in table["indexes"].items()]
+            output.append((tablename, "rows", None, table["rows"]))
+            output.append((tablename, "zone_maps", None, table["zone_maps"]))
+            partitions = table.get("partitions", {}).items()
+            output += [(tablename, "partition", k, v) for k, v in partitions]
+        output.append((None, "cache", None, usage["cache"]))
+        output.append((None, "total", None, usage["total"]))
+        return output
+
+    def runselect(
+        self,
+        stmt: parser.SelectStmt,
+        tables: list[Table | PartitionedTable],
+        profile: Profile | None = None,
+    ) -> list[Any]:
+        assert stmt.tablename is not None
+        table = tables[0]
+        if profile is None:
+            profile = Profile(enabled=False)
+
+        # ORDER BY either names a result column alias
+        # or is computed as an extra hidden last column
+        orderpos = None
+        if stmt.orderingterm is not None:
+            orderpos = self.aliasposition(stmt, stmt.orderingterm.ident)
+            if orderpos is None:
+                hidden = parser.ResultColumn(
+                    parser.BindParameter(stmt.orderingterm.ident)
+                )
+                stmt = replace(stmt, result_columns=stmt.result_columns + [hidden])
+
+        if self.iscountstar(stmt):
+            # row count is known without scanning
+            with profile.measure("count", table.count()) as stats:
+                output: Iterable[tuple[Any, ...]] = [
+                    tuple(table.count() for _ in stmt.result_columns)
+                ]
+                stats.rows_out = 1
+        else:
+            qualified = bool(stmt.joins) or any(
+                "." in node.ident for node in self.columnrefs(stmt)
+            )
+            assert stmt.tablename is not None
+            names = [stmt.tablename] + [j.tablename for j in stmt.joins]
+            scope = Scope(names, tables, qualified)
+            ambiguous = scope.ambiguous()
+            for node in self.columnrefs(stmt):
+                if node.ident in ambiguous:
+                    raise EngineError(f"ambiguous column name: {node.ident}")
+
+            ordered = False
+            where = stmt.where
+            rows: Iterable[list[Value]]
+            source = "scan"
+            # index nested loop joins read only the matching rows,
+            # every other operator reads its inputs in full
+            scanned = sum(len(part.data) for t in tables for part in parts(t))
+            if stmt.joins:
+                joined = [
+                    t.merged() if isinstance(t, PartitionedTable) else t for t in tables
+                ]
+                scope, rows, where = self.fromclause(stmt, joined)
+                source = "join"
+            elif isinstance(table, PartitionedTable):
+                # WHERE is applied in each partition, after its own access path
+                rows, scanned = self.partitionrows(table, scope, where)
+                where = None
+                source = "partition scan"
+            elif stmt.group_by and self.groupcolumn(table, stmt.group_by):
+                # rows read in key order allow streaming aggregation
+                column = self.groupcolumn(table, stmt.group_by)
+                assert column is not None
+                orderedrows = table.orderedrows(column)
+                ordered = orderedrows is not None
+                rows = table.rows() if orderedrows is None else orderedrows
+                if ordered and not table.ordered[table.columns.index(column)]:
+                    source = "index scan"
             else:
-                column_ids.append(table.columns.index(rcol))
-
-        output: list[Any] = []
-        for row in table.data:
-            context = {}
-            for k, v in zip(table.columns, row):
-                context[k] = v
-
-            if stmt.where:
-                incl = self.expr(stmt.where, context).val == 1
-                if incl:
-                    outputrow = tuple(row[c_id].val for c_id in column_ids)
-                    output.append(outputrow)
+                rows, where, source, scanned = self.accesspath(table, scope, where)
+            self.metrics.rows_scanned += scanned
+            rows = profile.stream(source, self.checked(rows))
+
+            if where is not None:
+                rows = profile.stream("filter", self.filterrows(scope, rows, where))
+
+            if stmt.group_by or self.aggregates(stmt):
+                groups = self.aggregate(stmt, scope, rows, ordered)
+                output = profile.stream("aggregate", groups)
             else:
-                outputrow = tuple(row[c_id].val for c_id in column_ids)
-                output.append(outputrow)
+                output = profile.stream("project", self.project(stmt, scope, rows))
 
+        budget, spill_dir = self.memory_budget, self.spill_dir
         if stmt.distinct:
-            output = list(set(output))
+            # keeps first occurrences in order, like sqlite
+            key = None
+            if stmt.orderingterm is not None and orderpos is None:
+                key = operator.itemgetter(slice(None, -1))
+            output = profile.stream(
+                "distinct", external_distinct(output, key, budget, spill_dir)
+            )
+
+        if stmt.orderingterm is not None:
+            pos = -1 if orderpos is None else orderpos
 
-        if stmt.orderingterm:
-            output = sorted(output)
+            def orderkey(row: tuple[Any, ...]) -> tuple[int, Any]:
+                return sortkey(row[pos])
+
+            reverse = not stmt.orderingterm.asc
+            if stmt.limit:
+                # only the first rows are kept while sorting
+                n = stmt.limit.offset + stmt.limit.limitval
+                output = topn(output, n, orderkey, reverse, budget, spill_dir)
+            else:
+                output = external_sort(output, orderkey, reverse, budget, spill_dir)
+            if orderpos is None:
+                output = (row[:-1] for row in output)
+            output = profile.stream("sort", output)
 
         if stmt.limit:
             offset = stmt.limit.offset
             limit = stmt.limit.limitval
+            output = profile.stream(
+                "limit", itertools.islice(output, offset, offset + limit)
+            )
+
+        return list(output)
 
-            output = output[offset : offset + limit]
+    def accesspath(
+        self, table: Table, scope: Scope, where: parser.Expr | None
+    ) -> tuple[Iterable[list[Value]], parser.Expr | None, str, int]:
+        "Rows that may match WHERE, the rest of WHERE, source name, rows read"
+        if (found := self.keyrowids(table, scope, where)) is not None:
+            rowids, where = found
+            rows = (table.data[rowid] for rowid in rowids)
+            return rows, where, "primary key search", len(rowids)
+        elif (found := self.dictrowids(table, scope, where)) is not None:
+            rowids, where = found
+            rows = (table.data[rowid] for rowid in rowids)
+            return rows, where, "dictionary scan", len(table.data)
+        elif (indexed := self.likerowids(table, where)) is not None:
+            rows = (table.data[rowid] for rowid in indexed)
+            return rows, where, "index range scan", len(indexed)
+        elif (ranges := self.blockranges(table, scope, where)) is not None:
+            rows = (row for lo, hi in ranges for row in table.rowrange(lo, hi))
+            return rows, where, "zone map scan", sum(hi - lo for lo, hi in ranges)
+        return table.rows(), where, "scan", len(table.data)
+
+    def partitionrows(
+        self, table: PartitionedTable, scope: Scope, where: parser.Expr | None
+    ) -> tuple[Iterable[list[Value]], int]:
+        "Rows matching WHERE from the partitions that may hold them, rows read"
+        outputs = []
+        scanned = 0
+        for part in self.prunedparts(table, where):
+            rows, rest, _, count = self.accesspath(part, scope, where)
+            if rest is not None:
+                rows = self.filterrows(scope, rows, rest)
+            outputs.append(rows)
+            scanned += count
+        return itertools.chain.from_iterable(outputs), scanned
+
+    def keyrowids(
+        self, table: Table, scope: Scope, where: parser.Expr | None
+    ) -> tuple[list[int], parser.Expr | None] | None:
+        """
+        Positions of the rows matching the conjuncts of WHERE comparing the
+        rowid with constants, in rowid order, and the rest of WHERE. Rows are
+        found by binary search, text constants that look like numbers are
+        compared as numbers like sqlite does. None if no conjunct uses the rowid
+        """
+        if table.key is None:
+            return None
+        consts = (parser.ConstInt, parser.ConstReal, parser.ConstString)
+        flipped = {TT.LT: TT.GT, TT.LE: TT.GE, TT.GT: TT.LT, TT.GE: TT.LE}
+        # INTEGER affinity is applied to text
+        convert = fromtext("INTEGER")
+
+        def iskey(node: parser.Expr) -> bool:
+            return (
+                isinstance(node, parser.BindParameter)
+                and scope.index(node.ident) == table.key
+            )
+
+        def value(node: parser.Expr) -> Any:
+            if isinstance(node, parser.ConstString):
+                return convert(node.val).val
+            return node.val  # type: ignore[attr-defined]
+
+        def key(node: parser.Expr) -> tuple[Any, ...]:
+            return sortkey(value(node))
+
+        # sortkeys of matching keys are in [lo, hi), key + (1,) is just past key
+        lo: tuple[Any, ...] = (-1,)
+        hi: tuple[Any, ...] = (5,)
+        points: list[Any] | None = None
+        used = []
+        for pred in conjuncts(where):
+            match pred:
+                case parser.BinaryOperator(lhs, op, rhs) if op in flipped or (
+                    op == TT.EQUAL
+                ):
+                    if isinstance(lhs, consts):
+                        lhs, rhs, op = rhs, lhs, flipped.get(op, op)
+                    if not iskey(lhs) or not isinstance(rhs, consts):
+                        continue
+                    if op in (TT.EQUAL, TT.GE):
+                        lo = max(lo, key(rhs))
+                    if op == TT.GT:
+                        lo = max(lo, key(rhs) + (1,))
+                    if op in (TT.EQUAL, TT.LE):
+                        hi = min(hi, key(rhs) + (1,))
+                    if op == TT.LT:
+                        hi = min(hi, key(rhs))
+                case parser.Between(element, lower, upper, False) if iskey(element):
+                    if not isinstance(lower, consts) or not isinstance(upper, consts):
+                        continue
+                    lo, hi = max(lo, key(lower)), min(hi, key(upper) + (1,))
+                case parser.InExpr(element, container, False) if iskey(element):
+                    if not all(isinstance(e, consts) for e in container):
+                        continue
+                    vals = [value(e) for e in container]
+                    if points is not None:
+                        keys = {sortkey(v) for v in vals}
+                        vals = [v for v in points if sortkey(v) in keys]
+                    points = vals
+                case _:
+                    continue
+            used.append(pred)
+
+        if not used:
+            return None
+        rest = andall([p for p in conjuncts(where) if all(p is not u for u in used)])
+        if points is None:
+            return (table.keyrange(lo, hi) if lo < hi else []), rest
+        # one lookup per distinct key, in key order
+        distinct = {sortkey(v): v for v in points if lo <= sortkey(v) < hi}
+        rowids = [
+            rowid for k in sorted(distinct) for rowid in table.keylookup(distinct[k])
+        ]
+        return rowids, rest
+
+    def dictrowids(
+        self, table: Table, scope: Scope, where: parser.Expr | None
+    ) -> tuple[list[int], parser.Expr | None] | None:
+        """
+        Positions of the rows matching the conjuncts of WHERE on a single
+        dictionary encoded column, and the rest of WHERE.
+        Such conjuncts are evaluated once per distinct value of the column,
+        rows are then picked by their codes
+        """
+        used = []
+        rowids: Iterable[int] | None = None
+        for pred in conjuncts(where):
+            refs = [
+                n.ident
+                for n in parser.walk(pred)
+                if isinstance(n, parser.BindParameter)
+            ]
+            positions = {scope.index(ident) for ident in refs}
+            if len(positions) != 1:
+                continue
+            pos = positions.pop()
+            dictionary = table.dictionaries.get(pos)
+            if dictionary is None:
+                continue
+
+            names = [key for key in scope.keys if scope.index(key) == pos]
+            matching = bytearray(
+                self.expr(pred, dict.fromkeys(names, value)).val == 1
+                for value in dictionary.values
+            )
+            if rowids is None:
+                selectors = map(matching.__getitem__, dictionary.codes)
+                if table.tombstones:
+                    selectors = map(operator.and_, selectors, table.live)
+                rowids = itertools.compress(range(len(table.data)), selectors)
+            else:
+                rowids = [i for i in rowids if matching[dictionary.codes[i]]]
+            used.append(pred)
+
+        if rowids is None:
+            return None
+        rest = andall([p for p in conjuncts(where) if all(p is not u for u in used)])
+        return list(rowids), rest
 
+    def blockranges(
+        self, table: Table, scope: Scope, where: parser.Expr | None
+    ) -> list[tuple[int, int]] | None:
+        """
+        Row ranges of the blocks that may hold rows matching WHERE,
+        judged by their zone maps and conjuncts comparing a column
+        with constants. None if no conjunct can rule out a block
+        """
+        checks = [
+            check
+            for pred in conjuncts(where)
+            if (check := self.blockcheck(scope, pred)) is not None
+        ]
+        if not checks or len(table.blocks) < 2:
+            return None
+
+        ranges: list[tuple[int, int]] = []
+        for i, block in enumerate(table.blocks):
+            if not all(check(block) for check in checks):
+                continue
+            start = i * BLOCK_ROWS
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], start + block.rows)
+            else:
+                ranges.append((start, start + block.rows))
+        if ranges == [(0, len(table.data))]:
+            # nothing skipped
+            return None
+        return ranges
+
+    def blockcheck(
+        self, scope: Scope, pred: parser.Expr
+    ) -> Callable[[Block], bool] | None:
+        "Whether a block may hold rows satisfying pred, None if pred is not supported"
+        consts = (parser.ConstInt, parser.ConstReal, parser.ConstString)
+        flipped = {TT.LT: TT.GT, TT.LE: TT.GE, TT.GT: TT.LT, TT.GE: TT.LE}
+        tests: dict[TT, Callable[[Any, Any, Any], bool]] = {
+            TT.EQUAL: lambda low, high, k: low <= k <= high,
+            TT.LT: lambda low, high, k: low < k,
+            TT.LE: lambda low, high, k: low <= k,
+            TT.GT: lambda low, high, k: high > k,
+            TT.GE: lambda low, high, k: high >= k,
+        }
+
+        def key(node: parser.Expr) -> tuple[int, Any]:
+            return sortkey(node.val)  # type: ignore[attr-defined]
+
+        match pred:
+            case parser.BinaryOperator(lhs, op, rhs) if op in tests:
+                if isinstance(lhs, consts):
+                    lhs, rhs, op = rhs, lhs, flipped.get(op, op)
+                if not isinstance(lhs, parser.BindParameter):
+                    return None
+                if not isinstance(rhs, consts):
+                    return None
+                pos, k, test = scope.index(lhs.ident), key(rhs), tests[op]
+
+                def compare(block: Block) -> bool:
+                    low, high = block.mins[pos], block.maxs[pos]
+                    return low is not None and test(low, high, k)
+
+                return compare
+            case parser.Between(parser.BindParameter(ident), lower, upper, False):
+                if not isinstance(lower, consts) or not isinstance(upper, consts):
+                    return None
+                pos, lo, hi = scope.index(ident), key(lower), key(upper)
+                return lambda block: block.overlaps(pos, lo, hi)
+            case parser.InExpr(parser.BindParameter(ident), container, False):
+                if not all(isinstance(e, consts) for e in container):
+                    return None
+                pos, keys = scope.index(ident), [key(e) for e in container]
+                return lambda block: any(block.overlaps(pos, k, k) for k in keys)
+            case parser.IsExpr(parser.BindParameter(ident), parser.ConstNull(), isnot):
+                pos = scope.index(ident)
+                if isnot:
+                    return lambda block: block.nulls[pos] < block.rows
+                return lambda block: block.nulls[pos] > 0
+        return None
+
+    def likerowids(self, table: Table, where: parser.Expr | None) -> list[int] | None:
+        """
+        Positions of the rows that may match a LIKE 'prefix%' conjunct of WHERE,
+        read from ranges of an index on its column, in table order.
+        Numbers and blobs are always included, LIKE matches their text form
+        """
+        for pred in conjuncts(where):
+            if not (
+                isinstance(pred, parser.LikeExpr)
+                and not pred.isnot
+                and isinstance(pred.element, parser.BindParameter)
+                and isinstance(pred.pattern, parser.ConstString)
+            ):
+                continue
+            index = table.index_on(pred.element.ident)
+            ranges = prefix_ranges(pred.pattern.val)
+            if index is None or ranges is None:
+                continue
+
+            keys = index.keyrange((1, float("-inf")), (2, ""))
+            keys += index.keyrange((3, b""), (4, b""))
+            for lo, hi in ranges:
+                keys += index.keyrange((2, lo), (2, hi))
+            rowids = [rowid for key in keys for rowid in index.buckets[key]]
+            rowids.sort()
+            return rowids
+        return None
+
+    def aliasposition(self, stmt: parser.SelectStmt, name: str) -> int | None:
+        if any(isinstance(r.expr, parser.Star) for r in stmt.result_columns):
+            return None
+        for i, rcol in enumerate(stmt.result_columns):
+            if rcol.alias == name:
+                return i
+        return None
+
+    def columnrefs(self, stmt: parser.SelectStmt) -> Iterator[parser.BindParameter]:
+        exprs = [r.expr for r in stmt.result_columns] + stmt.group_by
+        exprs += [e for e in (stmt.where, stmt.having) if e is not None]
+        exprs += [j.on for j in stmt.joins if j.on is not None]
+        aliases = {r.alias for r in stmt.result_columns}
+        for expr in exprs:
+            for node in parser.walk(expr):
+                if isinstance(node, parser.BindParameter) and node.ident not in aliases:
+                    yield node
+
+    def fromclause(
+        self, stmt: parser.SelectStmt, tables: list[Table]
+    ) -> tuple[Scope, Iterable[list[Value]], parser.Expr | None]:
+        """
+        Joined rows of the FROM clause and the part of WHERE left to apply.
+        WHERE conjuncts are moved into the first inner join
+        where all of their tables are available
+        """
+        assert stmt.tablename is not None
+        names = [stmt.tablename] + [j.tablename for j in stmt.joins]
+        scopes = [Scope([name], [table], True) for name, table in zip(names, tables)]
+
+        if len(tables) >= 3 and not any(j.left for j in stmt.joins):
+            return self.reorderedjoins(stmt, scopes, tables)
+
+        preds = conjuncts(stmt.where)
+        owners = self.predowners(preds, scopes)
+        left, rows, leftbase, applied = self.firstinput(
+            preds, owners, scopes, tables, 0
+        )
+
+        joined = {0}
+        for i, clause in enumerate(stmt.joins, start=1):
+            joined.add(i)
+            on = clause.on
+            if not clause.left:
+                step = [
+                    p for p, o in enumerate(owners) if p not in applied and o <= joined
+                ]
+                applied.update(step)
+                on = andall(conjuncts(on) + [preds[p] for p in step])
+            rows = self.join(
+                left, rows, scopes[i], tables[i], on, clause.left, leftbase
+            )
+            left = left.join(scopes[i])
+            leftbase = None
+
+        where = andall([preds[p] for p in range(len(preds)) if p not in applied])
+        return left, rows, where
+
+    def predowners(
+        self, preds: list[parser.Expr], scopes: list[Scope]
+    ) -> list[set[int]]:
+        "Positions of the tables each predicate references"
+        owners: list[set[int]] = []
+        for pred in preds:
+            owner: set[int] = set()
+            for node in parser.walk(pred):
+                if isinstance(node, parser.BindParameter):
+                    found = [i for i, sc in enumerate(scopes) if node.ident in sc.keys]
+                    # -1 marks references resolved only after the join
+                    owner.add(found[0] if found else -1)
+            owners.append(owner)
+        return owners
+
+    def firstinput(
+        self,
+        preds: list[parser.Expr],
+        owners: list[set[int]],
+        scopes: list[Scope],
+        tables: list[Table],
+        first: int,
+    ) -> tuple[Scope, Iterable[list[Value]], Table | None, set[int]]:
+        "Rows of the first joined table, filtered by predicates on it alone"
+        left = scopes[first]
+        table = tables[first]
+        rows: Iterable[list[Value]] = self.checked(table.rows())
+        local = {p for p, o in enumerate(owners) if o == {first}}
+        if not local:
+            return left, rows, table, local
+        where = andall([preds[p] for p in sorted(local)])
+        assert where is not None
+        ranges = self.blockranges(table, left, where)
+        if ranges is not None:
+            rows = self.checked(
+                row for lo, hi in ranges for row in table.rowrange(lo, hi)
+            )
+        rows = self.filterrows(left, rows, where)
+        return left, rows, None, local
+
+    def reorderedjoins(
+        self, stmt: parser.SelectStmt, scopes: list[Scope], tables: list[Table]
+    ) -> tuple[Scope, Iterable[list[Value]], parser.Expr | None]:
+        """
+        Inner joins of 3+ tables in the order picked greedily by row estimates:
+        start from the smallest table, then add the smallest table
+        connected to the joined ones by some condition.
+        ON and WHERE conjuncts are applied as soon as their tables are joined
+        """
+        preds = [c for j in stmt.joins for c in conjuncts(j.on)]
+        preds += conjuncts(stmt.where)
+        owners = self.predowners(preds, scopes)
+
+        def rowcount(i: int) -> float:
+            # every filter on the table alone is guessed to keep a quarter of rows
+            local = sum(1 for o in owners if o == {i})
+            return tables[i].count() * 0.25**local
+
+        order = [min(range(len(tables)), key=rowcount)]
+        while len(order) < len(tables):
+            rest = [i for i in range(len(tables)) if i not in order]
+            connected = [
+                i
+                for i in rest
+                if any(i in o and o - {i} and o - {i} <= set(order) for o in owners)
+            ]
+            order.append(min(connected or rest, key=rowcount))
+
+        first = order[0]
+        left, rows, leftbase, applied = self.firstinput(
+            preds, owners, scopes, tables, first
+        )
+
+        joined = {first}
+        for i in order[1:]:
+            joined.add(i)
+            step = [p for p, o in enumerate(owners) if p not in applied and o <= joined]
+            applied.update(step)
+            on = andall([preds[p] for p in step])
+            rows = self.join(left, rows, scopes[i], tables[i], on, False, leftbase)
+            left = left.join(scopes[i])
+            leftbase = None
+
+        # restore the column layout of the FROM clause
+        offsets: dict[int, int] = {}
+        offset = 0
+        for i in order:
+            offsets[i] = offset
+            offset += len(tables[i].columns)
+        perm = [
+            offsets[i] + c
+            for i in range(len(tables))
+            for c in range(len(tables[i].columns))
+        ]
+        rows = ([row[p] for p in perm] for row in rows)
+
+        scope = scopes[0]
+        for sc in scopes[1:]:
+            scope = scope.join(sc)
+        where = andall([preds[p] for p in range(len(preds)) if p not in applied])
+        return scope, rows, where
+
+    def join(
+        self,
+        left: Scope,
+        rows: Iterable[list[Value]],
+        right: Scope,
+        table: Table,
+        on: parser.Expr | None,
+        isleft: bool,
+        leftbase: Table | None = None,
+    ) -> Iterator[list[Value]]:
+        """
+        Picks the join operator:
+        sort-merge if both inputs can be read in key order without sorting,
+        index nested loop if the right table has an index on the key,
+        hash join on other equality keys, nested loop without them.
+        leftbase is the table the left rows come from unchanged, if any
+        """
+        combined = left.join(right)
+        padding: list[Value] = [NullValue(None)] * len(right.columns)
+        lkeys, rkeys, residual = self.splitjoin(on, left, right)
+
+        # conditions on the right table alone filter it before matching
+        rfilter = andall([c for c in conjuncts(residual) if right.covers(c)])
+        residual = andall([c for c in conjuncts(residual) if not right.covers(c)])
+
+        rkeep = None if rfilter is None else Filter(rfilter, self.expr)
+        keep = None if residual is None else Filter(residual, self.expr)
+
+        def rightok(rrow: list[Value]) -> bool:
+            return rkeep is None or rkeep(right.context(rrow))
+
+        def matches(row: list[Value]) -> bool:
+            return keep is None or keep(combined.context(row))
+
+        join = JoinInput(matches, isleft, padding)
+        if not lkeys:
+            rrows = [r for r in self.checked(table.rows()) if rightok(r)]
+            return self.nestedloopjoin(join, rows, rrows)
+
+        lkey = self.joinkey(left, lkeys)
+        rkey = self.joinkey(right, rkeys)
+
+        lcolumn = self.keycolumn(left, lkeys)
+        rcolumn = self.keycolumn(right, rkeys)
+        if leftbase is not None and lcolumn is not None and rcolumn is not None:
+            lordered = leftbase.orderedrows(lcolumn)
+            rordered = table.orderedrows(rcolumn)
+            if lordered is not None and rordered is not None:
+                lrows = self.checked(lordered)
+                rsorted = (r for r in self.checked(rordered) if rightok(r))
+                return self.mergejoin(join, lrows, rsorted, lkey, rkey)
+
+        index = None if rcolumn is None else table.index_on(rcolumn)
+        if index is not None:
+            return self.indexjoin(join, rows, table, index, lkey, rightok)
+
+        rrows = [r for r in self.checked(table.rows()) if rightok(r)]
+        return self.hashjoin(join, rows, rrows, lkey, rkey)
+
+    def keycolumn(self, scope: Scope, keys: list[parser.Expr]) -> str | None:
+        "Column name of a single column key of a single table scope"
+        if len(scope.tables) != 1 or len(keys) != 1:
+            return None
+        if not isinstance(keys[0], parser.BindParameter):
+            return None
+        return scope.columns[scope.index(keys[0].ident)]
+
+    def nestedloopjoin(
+        self, join: JoinInput, rows: Iterable[list[Value]], rrows: list[list[Value]]
+    ) -> Iterator[list[Value]]:
+        for lrow in rows:
+            matched = False
+            for rrow in self.checked(rrows):
+                if join.matches(lrow + rrow):
+                    matched = True
+                    yield lrow + rrow
+            if join.isleft and not matched:
+                yield lrow + join.padding
+
+    def indexjoin(
+        self,
+        join: JoinInput,
+        rows: Iterable[list[Value]],
+        table: Table,
+        index: Index,
+        lkey: KeyFunc,
+        rightok: Callable[[list[Value]], bool],
+    ) -> Iterator[list[Value]]:
+        "Probes the index of the right table with every left row"
+        for lrow in rows:
+            matched = False
+            key = lkey(lrow)
+            for rowid in index.lookup(key[0]) if key is not None else ():
+                rrow = table.data[rowid]
+                if rightok(rrow) and join.matches(lrow + rrow):
+                    matched = True
+                    yield lrow + rrow
+            if join.isleft and not matched:
+                yield lrow + join.padding
+
+    def mergejoin(
+        self,
+        join: JoinInput,
+        lrows: Iterable[list[Value]],
+        rrows: Iterable[list[Value]],
+        lkey: KeyFunc,
+        rkey: KeyFunc,
+    ) -> Iterator[list[Value]]:
+        "Both inputs must come sorted by key, output is in key order"
+
+        def runs() -> Iterator[tuple[tuple[Any, ...], list[list[Value]]]]:
+            runkey: tuple[Any, ...] | None = None
+            run: list[list[Value]] = []
+            for rrow in rrows:
+                key = rkey(rrow)
+                if key is None:
+                    continue
+                if run and key != runkey:
+                    assert runkey is not None
+                    yield runkey, run
+                    run = []
+                runkey = key
+                run.append(rrow)
+            if run:
+                assert runkey is not None
+                yield runkey, run
+
+        rruns = runs()
+        current = next(rruns, None)
+        for lrow in lrows:
+            matched = False
+            key = lkey(lrow)
+            if key is not None:
+                sk = tuple(map(sortkey, key))
+                while current is not None and tuple(map(sortkey, current[0])) < sk:
+                    current = next(rruns, None)
+                if current is not None and current[0] == key:
+                    for rrow in current[1]:
+                        if join.matches(lrow + rrow):
+                            matched = True
+                            yield lrow + rrow
+            if join.isleft and not matched:
+                yield lrow + join.padding
+
+    def hashjoin(
+        self,
+        join: JoinInput,
+        rows: Iterable[list[Value]],
+        rrows: list[list[Value]],
+        lkey: KeyFunc,
+        rkey: KeyFunc,
+    ) -> Iterator[list[Value]]:
+        "Builds on the smaller input, output keeps the order of the left input"
+        leftrows = list(rows)
+        if len(rrows) <= len(leftrows):
+            # build on the right input, probe with the left one
+            built: dict[tuple[Any, ...], list[list[Value]]] = {}
+            for rrow in rrows:
+                key = rkey(rrow)
+                if key is not None:
+                    built.setdefault(key, []).append(rrow)
+
+            for lrow in leftrows:
+                matched = False
+                key = lkey(lrow)
+                for rrow in built.get(key, ()) if key is not None else ():
+                    if join.matches(lrow + rrow):
+                        matched = True
+                        yield lrow + rrow
+                if join.isleft and not matched:
+                    yield lrow + join.padding
+            return
+
+        # build on the left input, probe with the right one
+        positions: dict[tuple[Any, ...], list[int]] = {}
+        for i, lrow in enumerate(leftrows):
+            key = lkey(lrow)
+            if key is not None:
+                positions.setdefault(key, []).append(i)
+
+        found: dict[int, list[list[Value]]] = {}
+        for rrow in rrows:
+            key = rkey(rrow)
+            for i in positions.get(key, ()) if key is not None else ():
+                if join.matches(leftrows[i] + rrow):
+                    found.setdefault(i, []).append(leftrows[i] + rrow)
+
+        for i, lrow in enumerate(leftrows):
+            if i in found:
+                yield from found[i]
+            elif join.isleft:
+                yield lrow + join.padding
+
+    def splitjoin(
+        self, on: parser.Expr | None, left: Scope, right: Scope
+    ) -> tuple[list[parser.Expr], list[parser.Expr], parser.Expr | None]:
+        "Split ON into left keys, right keys and the residual condition"
+        lkeys: list[parser.Expr] = []
+        rkeys: list[parser.Expr] = []
+        rest: list[parser.Expr] = []
+        for conjunct in conjuncts(on):
+            if isinstance(conjunct, parser.BinaryOperator) and conjunct.op == TT.EQUAL:
+                lhs, rhs = conjunct.lhs, conjunct.rhs
+                if left.covers(lhs) and right.covers(rhs):
+                    lkeys.append(lhs)
+                    rkeys.append(rhs)
+                    continue
+                if left.covers(rhs) and right.covers(lhs):
+                    lkeys.append(rhs)
+                    rkeys.append(lhs)
+                    continue
+            rest.append(conjunct)
+
+        return lkeys, rkeys, andall(rest)
+
+    def joinkey(self, scope: Scope, exprs: list[parser.Expr]) -> KeyFunc:
+        "Join key function, key is None if any part is NULL and so never matches"
+        if all(isinstance(e, parser.BindParameter) for e in exprs):
+            positions = [scope.index(e.ident) for e in exprs]  # type: ignore[attr-defined]
+
+            def bypositions(row: list[Value]) -> tuple[Any, ...] | None:
+                key = tuple(row[i].val for i in positions)
+                return None if None in key else key
+
+            return bypositions
+
+        def byexprs(row: list[Value]) -> tuple[Any, ...] | None:
+            context = scope.context(row)
+            key = tuple(self.expr(e, context).val for e in exprs)
+            return None if None in key else key
+
+        return byexprs
+
+    def filterrows(
+        self, scope: Scope, rows: Iterable[list[Value]], where: parser.Expr
+    ) -> Iterator[list[Value]]:
+        keep = Filter(where, self.expr)
+        for row in rows:
+            if keep(scope.context(row)):
+                yield row
+
+    def project(
+        self, stmt: parser.SelectStmt, scope: Scope, rows: Iterable[list[Value]]
+    ) -> Iterator[tuple[Any, ...]]:
+        # plain column references are read by index, without building a context
+        column_ids: list[int | None] = []
+        exprs: list[parser.Expr] = []
+        for rcol in stmt.result_columns:
+            if isinstance(rcol.expr, parser.Star):
+                column_ids.extend(scope.visible)
+                exprs.extend([rcol.expr] * len(scope.visible))
+            elif isinstance(rcol.expr, parser.BindParameter):
+                column_ids.append(scope.index(rcol.expr.ident))
+                exprs.append(rcol.expr)
+            else:
+                column_ids.append(None)
+                exprs.append(rcol.expr)
+
+        if None not in column_ids:
+            for row in rows:
+                yield tuple(row[c_id].val for c_id in column_ids)  # type: ignore[index]
+            return
+
+        for row in rows:
+            context = scope.context(row)
+            yield tuple(
+                row[c_id].val if c_id is not None else self.expr(e, context).val
+                for c_id, e in zip(column_ids, exprs)
+            )
+
+    def aggregates(self, stmt: parser.SelectStmt) -> list[parser.FunctionCall]:
+        "Distinct aggregate calls used by result columns and HAVING"
+        exprs = [r.expr for r in stmt.result_columns]
+        if stmt.having is not None:
+            exprs.append(stmt.having)
+
+        found: dict[str, parser.FunctionCall] = {}
+        for expr in exprs:
+            for node in parser.walk(expr):
+                if isaggregate(node):
+                    assert isinstance(node, parser.FunctionCall)
+                    found.setdefault(repr(node), node)
+        return list(found.values())
+
+    def iscountstar(self, stmt: parser.SelectStmt) -> bool:
+        if stmt.where is not None or stmt.group_by or stmt.having is not None:
+            return False
+        if stmt.joins:
+            return False
+        return all(
+            r.expr == parser.FunctionCall("COUNT", [parser.Star()])
+            for r in stmt.result_columns
+        )
+
+    def aggregate(
+        self,
+        stmt: parser.SelectStmt,
+        scope: Scope,
+        rows: Iterable[list[Value]],
+        ordered: bool,
+    ) -> Iterator[tuple[Any, ...]]:
+        aggs = self.aggregates(stmt)
+        for agg in aggs:
+            if len(agg.args) != 1:
+                raise EngineError(f"wrong number of arguments to function {agg.name}()")
+
+        # sqlite takes bare columns from the row holding the single MIN/MAX
+        minmax = len(aggs) == 1 and aggs[0].name in ("MIN", "MAX")
+
+        def newgroup(key: tuple[Any, ...], row: list[Value]) -> Group:
+            accs: list[Accumulator] = []
+            for agg in aggs:
+                acc = AGGREGATES[agg.name]()
+                accs.append(DistinctAcc(acc) if agg.distinct else acc)
+            return Group(key, accs, row)
+
+        def step(group: Group, row: list[Value], context: dict[str, Value]) -> None:
+            for agg, acc in zip(aggs, group.accs):
+                arg = agg.args[0]
+                val = 1 if isinstance(arg, parser.Star) else self.expr(arg, context).val
+                if acc.step(val) and minmax:
+                    group.row = row
+            if not minmax:
+                group.row = row
+
+        groups: Iterable[Group]
+        if not stmt.group_by:
+            group = newgroup((), [NullValue(None)] * len(scope.columns))
+            for row in rows:
+                step(group, row, scope.context(row))
+            groups = [group]
+        elif ordered:
+            groups = self.streamgroups(scope, rows, stmt.group_by, newgroup, step)
+        else:
+            groups = self.hashgroups(scope, rows, stmt.group_by, newgroup, step)
+
+        for group in groups:
+            context = scope.context(group.row)
+            for agg, acc in zip(aggs, group.accs):
+                context[repr(agg)] = tovalue(acc.final())
+
+            outputrow: list[Any] = []
+            for rcol in stmt.result_columns:
+                if isinstance(rcol.expr, parser.Star):
+                    outputrow.extend(group.row[i].val for i in scope.visible)
+                    continue
+
+                val = self.expr(rcol.expr, context)
+                if rcol.alias is not None:
+                    context[rcol.alias] = val
+                outputrow.append(val.val)
+
+            if stmt.having is not None and self.expr(stmt.having, context).val != 1:
+                continue
+
+            yield tuple(outputrow)
+
+    def groupcolumn(self, table: Table, group_by: list[parser.Expr]) -> str | None:
+        "Column the rows are grouped by, if grouping is by a single column"
+        if len(group_by) != 1 or not isinstance(group_by[0], parser.BindParameter):
+            return None
+        if group_by[0].ident not in table.columns:
+            return None
+        return group_by[0].ident
+
+    def hashgroups(
+        self,
+        scope: Scope,
+        rows: Iterable[list[Value]],
+        group_by: list[parser.Expr],
+        newgroup: NewGroup,
+        step: StepGroup,
+    ) -> list[Group]:
+        groups: dict[tuple[Any, ...], Group] = {}
+        for row in rows:
+            context = scope.context(row)
+            key = tuple(self.expr(e, context).val for e in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = newgroup(key, row)
+            step(group, row, context)
+
+        # sqlite emits groups in key order
+        return sorted(groups.values(), key=lambda g: tuple(sortkey(v) for v in g.key))
+
+    def streamgroups(
+        self,
+        scope: Scope,
+        rows: Iterable[list[Value]],
+        group_by: list[parser.Expr],
+        newgroup: NewGroup,
+        step: StepGroup,
+    ) -> Iterator[Group]:
+        group: Group | None = None
+        for row in rows:
+            context = scope.context(row)
+            key = tuple(self.expr(e, context).val for e in group_by)
+            if group is None or group.key != key:
+                if group is not None:
+                    yield group
+                group = newgroup(key, row)
+            step(group, row, context)
+
+        if group is not None:
+            yield group
+
+    def parse(self, cmd: str) -> list[parser.Stmt]:
+        start = time.perf_counter()
+        stmts = parser.parse(cmd)
+        self.metrics.parse_latency.observe(time.perf_counter() - start)
+        return stmts
+
+    def run(self, stmt: parser.Stmt, sql: str, timeout: float | None = None) -> Any:
+        stmtname = stmt.__class__.__name__.lower()
+        method = getattr(self, stmtname)
+        if self.readonly and not isinstance(stmt, READONLY_STMTS):
+            raise EngineError("attempt to write a readonly database")
+        self.subqueries.clear()
+        if isinstance(stmt, REWRITTEN_STMTS):
+            stmt = self.rewrite(stmt)
+        self.watchdog.start(self.timeout if timeout is None else timeout)
+        start = time.perf_counter()
+        output = method(stmt)
+        elapsed = time.perf_counter() - start
+        if self.log is not None:
+            self.logwrite(stmt, sql)
+
+        if isinstance(stmt, parser.SelectStmt) and output is not None:
+            self.metrics.rows_returned += len(output)
+        self.metrics.record(stmtname.removesuffix("stmt"), elapsed, sql)
+        # bounded step between statements instead of one long pause
+        self.compact(COMPACT_ROWS)
         return output
 
-    def execute(self, cmd: str) -> Any:
+    def logwrite(self, stmt: parser.Stmt, sql: str) -> None:
+        "Logs a statement that changed the database, in a transaction on commit"
+        if isinstance(stmt, READONLY_STMTS + TRANSACTION_STMTS):
+            return
+        if self.savepoints:
+            self.uncommitted.append((stmt, sql))
+        else:
+            self.log.append([(stmt, sql)])  # type: ignore[union-attr]
+
+    def execute(self, cmd: str, timeout: float | None = None) -> Any:
+        "timeout overrides the default of the engine for this statement"
         cmd = cmd + ";"
-        for stmt in parser.parse(cmd):
-            stmtname = stmt.__class__.__name__.lower()
-            method = getattr(self, stmtname)
-            output = method(stmt)
+        for stmt in self.parse(cmd):
+            output = self.run(stmt, cmd, timeout)
             if output is None:
                 return []
             else:
                 return output
         return []
 
+    def columns(self, cmd: str, batch_rows: int = BATCH_ROWS) -> Iterator[Batch]:
+        """
+        Result of a SELECT as batches of columns, see columnar.py.
+        Column references of a query on one table without aggregates, DISTINCT
+        or ORDER BY are read from the matching rows straight into arrays,
+        other queries run as usual and their rows are transposed.
+        Changes made while the batches are read may or may not be seen
+        """
+        stmts = self.parse(cmd + ";")
+        if len(stmts) != 1 or not isinstance(stmts[0], parser.SelectStmt):
+            raise EngineError("columns() runs a single SELECT")
+        stmt = stmts[0]
+        tables = self.selecttables(stmt)
+        if tables is None:
+            return
+        self.subqueries.clear()
+        stmt = self.rewrite(stmt)
+
+        self.watchdog.start(self.timeout)
+        names = self.resultnames(stmt, tables)
+        positions = self.columnpositions(stmt, tables)
+        if positions is None:
+            rows = self.runselect(stmt, tables)
+            self.metrics.rows_returned += len(rows)
+            for start in range(0, max(len(rows), 1), batch_rows):
+                chunk = rows[start : start + batch_rows]
+                values = list(zip(*chunk)) if chunk else [()] * len(names)
+                yield Batch([build(n, list(v)) for n, v in zip(names, values)])
+            return
+
+        table = tables[0]
+        assert isinstance(table, Table)
+        rowids = self.whererowids(table, stmt.where)
+        if stmt.limit:
+            offset = stmt.limit.offset
+            rowids = rowids[offset : offset + stmt.limit.limitval]
+        self.metrics.rows_returned += len(rowids)
+        # without WHERE rows are in storage order
+        ascending = stmt.where is None
+        for start in range(0, max(len(rowids), 1), batch_rows):
+            chunk = rowids[start : start + batch_rows]
+            yield Batch(
+                [
+                    self.tablecolumn(table, name, pos, chunk, ascending)
+                    for name, pos in zip(names, positions)
+                ]
+            )
+
+    def resultnames(
+        self, stmt: parser.SelectStmt, tables: list[Table | PartitionedTable]
+    ) -> list[str]:
+        names: list[str] = []
+        for rcol in stmt.result_columns:
+            if isinstance(rcol.expr, parser.Star):
+                names += [c for t in tables for c in t.columns[: t.width]]
+            elif rcol.alias is not None:
+                names.append(rcol.alias)
+            elif isinstance(rcol.expr, parser.BindParameter):
+                names.append(rcol.expr.ident.split(".")[-1])
+            else:
+                names.append(f"column{len(names) + 1}")
+        return names
+
+    def columnpositions(
+        self, stmt: parser.SelectStmt, tables: list[Table | PartitionedTable]
+    ) -> list[int] | None:
+        "Table column of every result column, if the query only picks columns"
+        assert stmt.tablename is not None
+        if stmt.joins or stmt.group_by or stmt.distinct or self.aggregates(stmt):
+            return None
+        if stmt.orderingterm is not None or isinstance(tables[0], PartitionedTable):
+            return None
+
+        table = tables[0]
+        qualified = any("." in node.ident for node in self.columnrefs(stmt))
+        scope = Scope([stmt.tablename], tables, qualified)
+        positions: list[int] = []
+        for rcol in stmt.result_columns:
+            if isinstance(rcol.expr, parser.Star):
+                positions += range(table.width)
+            elif isinstance(rcol.expr, parser.BindParameter):
+                positions.append(scope.index(rcol.expr.ident))
+            else:
+                return None
+        return positions
+
+    def tablecolumn(
+        self, table: Table, name: str, pos: int, rowids: list[int], ascending: bool
+    ) -> Column:
+        """
+        Values of a column in the given rows. Dictionary encoded columns
+        keep their codes, NULL is then one of the dictionary values
+        """
+        dictionary = table.dictionaries.get(pos)
+        if dictionary is None:
+            data = table.data
+            return build(name, [data[rowid][pos].val for rowid in rowids])
+
+        codes = dictionary.codes
+        values = [value.val for value in dictionary.values]
+        if ascending and rowids and rowids[-1] - rowids[0] == len(rowids) - 1:
+            # no deleted rows in between, the codes are copied as one slice
+            return Column(name, codes[rowids[0] : rowids[-1] + 1], None, values)
+        return Column(
+            name, array.array("I", map(codes.__getitem__, rowids)), None, values
+        )
+
     def eval(self, line: str) -> None:
-        for stmt in parser.parse(line):
-            stmtname = stmt.__class__.__name__.lower()
-            method = getattr(self, stmtname)
-            method(stmt)
+        for stmt in self.parse(line):
+            self.run(stmt, line)
+
+    def import_csv(
+        self, path: str, tablename: str, delimiter: str = ",", skip: int = 0
+    ) -> int:
+        """
+        Inserts the records of a CSV file into a table without going through
+        SQL, IMPORT_ROWS at a time, and returns their number. Fields are
+        converted by the declared types of the columns. A missing table is
+        created with TEXT columns named by the first record, as .import of
+        sqlite does. Batches inserted before an error stay, unless the
+        import runs in a transaction that is rolled back
+        """
+        if self.readonly:
+            raise EngineError("attempt to write a readonly database")
+        start = time.perf_counter()
+        sql = f".import {path} {tablename}"
+        count = 0
+        with open(path, newline="", encoding="utf-8") as file:
+            records = csv.reader(file, delimiter=delimiter)
+            for _ in range(skip):
+                next(records, None)
+            if not self.hastable(tablename):
+                header = next(records, None)
+                if not header:
+                    raise EngineError(f"{path}: no header to name the columns")
+                columndefs = [parser.ColumnDef(name, "TEXT") for name in header]
+                self.run(parser.CreateStmt(tablename, columndefs), sql)
+
+            table = self.gettable(tablename)
+            converters = [fromtext(t) for t in table.types[: table.width]]
+            ncolumns = len(converters)
+            while batch := list(itertools.islice(records, IMPORT_ROWS)):
+                rows: list[list[Value]] = []
+                for record in batch:
+                    if not record:
+                        # blank line
+                        continue
+                    if len(record) != ncolumns:
+                        raise EngineError(
+                            f"{path}: record {count + len(rows) + 1} has "
+                            f"{len(record)} fields, expected {ncolumns}"
+                        )
+                    rows.append([f(field) for f, field in zip(converters, record)])
+                self.insertrows(table, rows)
+                if self.log is not None:
+                    # followers insert the same rows, keys assigned here included
+                    values = [
+                        parser.Row([constant(v) for v in row[: table.width]])
+                        for row in rows
+                    ]
+                    self.logwrite(parser.InsertStmt(tablename, values), sql)
+                count += len(rows)
+        self.metrics.record("import", time.perf_counter() - start, sql)
+        return count
+
+    def export_csv(
+        self, path: str, tablename: str, delimiter: str = ",", header: bool = True
+    ) -> int:
+        """
+        Writes the rows of a table to a CSV file as they are read, after
+        a record of the column names if header, and returns their number.
+        NULL is written as an empty field, as sqlite does
+        """
+        if not self.hastable(tablename):
+            raise EngineError(f"no such table: {tablename}")
+        table = self.gettable(tablename)
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file, delimiter=delimiter)
+            if header:
+                writer.writerow(table.columns[: table.width])
+            for part in parts(table):
+                writer.writerows(
+                    [value.val for value in row[: table.width]] for row in part.rows()
+                )
+                count += part.count()
+        return count
+
+    def stats(self) -> dict[str, Any]:
+        "Metrics as plain data, see also prometheus() and metrics.serve()"
+        cache = None if self.result_cache is None else self.result_cache.stats()
+        return self.metrics.as_dict(cache)
+
+    def prometheus(self) -> str:
+        cache = None if self.result_cache is None else self.result_cache.stats()
+        return self.metrics.prometheus(cache)
+
+    def memory_usage(self) -> dict[str, Any]:
+        """
+        Estimated bytes per table, column and index and of the result cache.
+        Counters are updated on insert, nothing is walked here
+        """
+        tables = {t.tablename: t.memory_usage() for t in self._tables.values()}
+        cache = 0 if self.result_cache is None else self.result_cache.stats().bytes
+        total = sum(usage["total"] for usage in tables.values())
+        return {
+            "tables": tables,
+            "cache": cache,
+            "total": total + cache,
+            "limit": self.memory_limit,
+        }
+
+
+def dotcommand(engine: Engine, line: str) -> None:
+    ".import FILE TABLE and .export FILE TABLE, fields of .tsv files are tab separated"
+    try:
+        args = shlex.split(line)
+        if len(args) != 3 or args[0] not in (".import", ".export"):
+            print("usage: .import FILE TABLE or .export FILE TABLE")
+            return
+        command, path, tablename = args
+        delimiter = "\t" if path.lower().endswith((".tsv", ".tab")) else ","
+        if command == ".import":
+            engine.import_csv(path, tablename, delimiter)
+        else:
+            engine.export_csv(path, tablename, delimiter)
+    except (OSError, ValueError, csv.Error, EngineError) as e:
+        # unbalanced quotes, bad files and tables are reported, so the
+        # shell goes on reading commands
+        print(f"Error: {e}")
 
 
 def main() -> None:
@@ -224,7 +3523,10 @@ def main() -> None:
         except KeyboardInterrupt:
             break
 
-        engine.eval(line)
+        if line.startswith("."):
+            dotcommand(engine, line)
+        else:
+            engine.eval(line)
 
 
 if __name__ == "__main__":
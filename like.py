@@ -0,0 +1,78 @@
+import functools
+import itertools
+import re
+from collections.abc import Callable
+
+Matcher = Callable[[str], bool]
+
+# like sqlite, LIKE ignores the case of ascii letters only
+FOLD = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+# index ranges scanned for the case variants of a prefix, longer prefixes
+# are cut to the letters whose variants fit
+MAX_VARIANTS = 64
+
+
+def fold(text: str) -> str:
+    if text.isascii():
+        return text.lower()
+    return text.translate(FOLD)
+
+
+def charclass(c: str) -> str:
+    if c.isascii() and c.isalpha():
+        return f"[{c.lower()}{c.upper()}]"
+    return re.escape(c)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_like(pattern: str) -> Matcher:
+    """
+    Matcher of text by a LIKE pattern.
+    Patterns with % only at their ends are matched with str methods,
+    others with a regex where every other character is escaped
+    """
+    folded = fold(pattern)
+    body = folded.strip("%")
+    if "_" not in folded and "%" not in body:
+        if "%" not in folded:
+            return lambda text: fold(text) == folded
+        elif folded.startswith("%") and folded.endswith("%"):
+            return lambda text: body in fold(text)
+        elif folded.endswith("%"):
+            return lambda text: fold(text).startswith(body)
+        else:
+            return lambda text: fold(text).endswith(body)
+
+    regex = "".join(
+        ".*" if c == "%" else "." if c == "_" else charclass(c) for c in pattern
+    )
+    compiled = re.compile(regex, re.DOTALL)
+    return lambda text: compiled.fullmatch(text) is not None
+
+
+def prefix_ranges(pattern: str) -> list[tuple[str, str]] | None:
+    """
+    Ranges [lo, hi) of text that may match the pattern, one per case variant
+    of its literal prefix. The prefix is cut before the letter that would
+    make more than MAX_VARIANTS variants, matches are checked again anyway.
+    None if there is no prefix
+    """
+    prefix = re.split("[%_]", pattern, maxsplit=1)[0]
+    choices: list[list[str]] = []
+    count = 1
+    for c in prefix:
+        choice = sorted({c.lower(), c.upper()}) if c.isascii() else [c]
+        if count * len(choice) > MAX_VARIANTS:
+            break
+        count *= len(choice)
+        choices.append(choice)
+    if not choices:
+        return None
+
+    ranges = []
+    for variant in map("".join, itertools.product(*choices)):
+        # the smallest text greater than every text starting with variant
+        upper = variant[:-1] + chr(min(ord(variant[-1]) + 1, 0x10FFFF))
+        ranges.append((variant, upper))
+    return ranges
@@ -0,0 +1,229 @@
+import collections
+import dataclasses
+import json
+import logging
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from cache import CacheStats
+from tokenizer import TT, TokenizerError, tokenize
+
+logger = logging.getLogger("engine.slowquery")
+
+# upper bounds in seconds, the last bucket is +Inf
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+SYMBOLS = {
+    TT.LCOLON: "(",
+    TT.RCOLON: ")",
+    TT.STAR: "*",
+    TT.COMMA: ",",
+    TT.SEMICOLON: ";",
+    TT.DOT: ".",
+    TT.EQUAL: "=",
+    TT.NOT_EQUAL: "!=",
+    TT.LT: "<",
+    TT.LE: "<=",
+    TT.GT: ">",
+    TT.GE: ">=",
+}
+LITERALS = {TT.STRING_LITERAL, TT.INT_LITERAL, TT.REAL_LITERAL, TT.NULL}
+
+
+def normalize(sql: str) -> str:
+    "SQL with literals replaced by ? and keywords uppercased"
+    try:
+        tokens = tokenize(sql)
+    except (TokenizerError, IndexError):
+        return " ".join(sql.split())
+
+    parts = []
+    for tok in tokens:
+        if tok.ttype in LITERALS:
+            parts.append("?")
+        elif tok.ttype == TT.IDENTIFIER:
+            parts.append(tok.val)
+        elif tok.ttype in SYMBOLS:
+            parts.append(SYMBOLS[tok.ttype])
+        else:
+            parts.append(tok.ttype.name)
+
+    text = " ".join(parts)
+    for before, after in ((" ,", ","), ("( ", "("), (" )", ")"), (" . ", ".")):
+        text = text.replace(before, after)
+    return text.removesuffix(" ;")
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        # one more counter for +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, val: float) -> None:
+        pos = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if val <= bound:
+                pos = i
+                break
+        self.counts[pos] += 1
+        self.sum += val
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        "(le, count) pairs as in prometheus, every count includes smaller buckets"
+        output = []
+        total = 0
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            output.append((bound, total))
+        return output
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "buckets": dict(self.cumulative()),
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+
+@dataclasses.dataclass
+class SlowQuery:
+    sql: str
+    stmttype: str
+    seconds: float
+
+
+class Metrics:
+    """
+    Counters of an Engine.
+    Statements at least slow_query_seconds long are kept in slow_log
+    with literals stripped from their SQL, None disables the log
+    """
+
+    def __init__(
+        self, slow_query_seconds: float | None = None, slow_log_size: int = 100
+    ):
+        self.slow_query_seconds = slow_query_seconds
+        self.statements: collections.Counter[str] = collections.Counter()
+        self.parse_latency = Histogram()
+        self.execute_latency: dict[str, Histogram] = {}
+        self.rows_scanned = 0
+        self.rows_returned = 0
+        self.slow_queries = 0
+        self.slow_log: collections.deque[SlowQuery] = collections.deque(
+            maxlen=slow_log_size
+        )
+
+    def record(self, stmttype: str, seconds: float, sql: str) -> None:
+        self.statements[stmttype] += 1
+        self.execute_latency.setdefault(stmttype, Histogram()).observe(seconds)
+
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            query = SlowQuery(normalize(sql), stmttype, seconds)
+            self.slow_queries += 1
+            self.slow_log.append(query)
+            logger.warning("slow %s %.3fs: %s", stmttype, seconds, query.sql)
+
+    def as_dict(self, cache: CacheStats | None = None) -> dict[str, Any]:
+        data: dict[str, Any] = {
+            "statements": dict(self.statements),
+            "parse_seconds": self.parse_latency.as_dict(),
+            "execute_seconds": {
+                name: hist.as_dict() for name, hist in self.execute_latency.items()
+            },
+            "rows_scanned": self.rows_scanned,
+            "rows_returned": self.rows_returned,
+            "slow_queries": self.slow_queries,
+            "slow_log": [dataclasses.asdict(q) for q in self.slow_log],
+        }
+        if cache is not None:
+            data["cache"] = {**dataclasses.asdict(cache), "hit_rate": cache.hit_rate}
+        return data
+
+    def prometheus(self, cache: CacheStats | None = None) -> str:
+        lines = ["# TYPE engine_statements_total counter"]
+        for name, count in sorted(self.statements.items()):
+            lines.append(f'engine_statements_total{{type="{name}"}} {count}')
+
+        lines.append("# TYPE engine_parse_seconds histogram")
+        lines += histogram_lines("engine_parse_seconds", "", self.parse_latency)
+        lines.append("# TYPE engine_execute_seconds histogram")
+        for name, hist in sorted(self.execute_latency.items()):
+            lines += histogram_lines("engine_execute_seconds", f'type="{name}"', hist)
+
+        counters = {
+            "engine_rows_scanned_total": self.rows_scanned,
+            "engine_rows_returned_total": self.rows_returned,
+            "engine_slow_queries_total": self.slow_queries,
+        }
+        if cache is not None:
+            counters |= {
+                "engine_cache_hits_total": cache.hits,
+                "engine_cache_misses_total": cache.misses,
+                "engine_cache_evictions_total": cache.evictions,
+                "engine_cache_invalidations_total": cache.invalidations,
+            }
+        for name, val in counters.items():
+            lines += [f"# TYPE {name} counter", f"{name} {val}"]
+
+        if cache is not None:
+            lines += [
+                "# TYPE engine_cache_hit_ratio gauge",
+                f"engine_cache_hit_ratio {cache.hit_rate}",
+                "# TYPE engine_cache_bytes gauge",
+                f"engine_cache_bytes {cache.bytes}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def histogram_lines(name: str, labels: str, hist: Histogram) -> list[str]:
+    sep = "," if labels else ""
+    lines = [
+        f'{name}_bucket{{{labels}{sep}le="{le}"}} {count}'
+        for le, count in hist.cumulative()
+    ]
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {hist.sum}")
+    lines.append(f"{name}_count{suffix} {hist.count}")
+    return lines
+
+
+def serve(
+    export: Callable[[], dict[str, Any]],
+    text: Callable[[], str],
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ThreadingHTTPServer:
+    """
+    Serves /metrics in prometheus text format and /metrics.json
+    from a daemon thread, shut it down with server.shutdown()
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/metrics":
+                body = text().encode()
+                ctype = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body = json.dumps(export()).encode()
+                ctype = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,345 @@
+"""
+Rewrites of the conditions of a statement before it runs: constant
+subexpressions are folded, literal IN lists become hashed sets, NOT is
+pushed into comparisons and conditions that always hold are dropped.
+Filter then tries the remaining conjuncts of a condition cheapest and
+most selective first, and reorders them by the pass rates it observes
+"""
+
+import dataclasses
+from collections.abc import Callable
+from typing import Any
+
+import parser
+from tokenizer import TT, TokenType
+
+CONSTS = (parser.ConstInt, parser.ConstReal, parser.ConstString, parser.ConstNull)
+
+# the comparison NOT turns each one into
+NEGATED = {
+    TT.EQUAL: TT.NOT_EQUAL,
+    TT.NOT_EQUAL: TT.EQUAL,
+    TT.LT: TT.GE,
+    TT.GE: TT.LT,
+    TT.GT: TT.LE,
+    TT.LE: TT.GT,
+}
+
+# nodes folded into a constant when all of their operands are constants,
+# function calls are left alone as aggregates are looked up by their repr
+FOLDABLE = (
+    parser.UnaryOperator,
+    parser.BinaryOperator,
+    parser.IsExpr,
+    parser.Between,
+    parser.LikeExpr,
+    parser.InExpr,
+)
+
+Evaluate = Callable[[parser.Expr, dict[str, Any]], Any]
+
+
+@dataclasses.dataclass
+class InSet(parser.InExpr):
+    "IN over a literal list, matched by hashing"
+
+    # the non NULL values of container
+    values: frozenset[Any] = frozenset()
+    null: bool = False
+
+
+def split(node: parser.Expr | None, op: TokenType) -> list[parser.Expr]:
+    if node is None:
+        return []
+    if isinstance(node, parser.BinaryOperator) and node.op == op:
+        return split(node.lhs, op) + split(node.rhs, op)
+    return [node]
+
+
+def combine(nodes: list[parser.Expr], op: TokenType) -> parser.Expr | None:
+    output: parser.Expr | None = None
+    for node in nodes:
+        output = node if output is None else parser.BinaryOperator(output, op, node)
+    return output
+
+
+def conjuncts(node: parser.Expr | None) -> list[parser.Expr]:
+    "Split an expression on top level ANDs"
+    return split(node, TT.AND)
+
+
+def andall(nodes: list[parser.Expr]) -> parser.Expr | None:
+    "Join expressions with AND, None for an empty list"
+    return combine(nodes, TT.AND)
+
+
+def literal(val: Any) -> parser.Expr | None:
+    "Constant node of a value, None for blobs which have none"
+    if val is None:
+        return parser.ConstNull()
+    elif isinstance(val, int):
+        return parser.ConstInt(int(val))
+    elif isinstance(val, float):
+        return parser.ConstReal(val)
+    elif isinstance(val, str):
+        return parser.ConstString(val)
+    return None
+
+
+def constval(node: parser.Expr) -> Any:
+    return None if isinstance(node, parser.ConstNull) else getattr(node, "val", None)
+
+
+def istrue(node: parser.Expr) -> bool:
+    return isinstance(node, CONSTS) and constval(node) == 1
+
+
+def isfalse(node: parser.Expr) -> bool:
+    "Constant that is neither true nor NULL"
+    return isinstance(node, CONSTS) and constval(node) not in (None, 1)
+
+
+def isboolean(node: parser.Expr) -> bool:
+    "Whether the value of node is always 0, 1 or NULL"
+    match node:
+        case parser.BinaryOperator(_, op, _):
+            return op in NEGATED or op in (TT.AND, TT.OR)
+        case parser.UnaryOperator(_, op):
+            return op == TT.NOT
+    return isinstance(
+        node,
+        parser.InExpr
+        | parser.InSelect
+        | parser.Exists
+        | parser.LikeExpr
+        | parser.IsExpr
+        | parser.Between,
+    )
+
+
+def negate(node: parser.Expr) -> parser.Expr | None:
+    "Node equal to NOT node without the NOT, None if there is none"
+    match node:
+        case parser.BinaryOperator(lhs, op, rhs) if op in NEGATED:
+            return parser.BinaryOperator(lhs, NEGATED[op], rhs)
+        case parser.BinaryOperator(lhs, TT.AND | TT.OR, rhs):
+            if not (isboolean(lhs) and isboolean(rhs)):
+                return None
+            op = TT.OR if node.op == TT.AND else TT.AND
+            lhs = negate(lhs) or parser.UnaryOperator(lhs, TT.NOT)
+            rhs = negate(rhs) or parser.UnaryOperator(rhs, TT.NOT)
+            return parser.BinaryOperator(lhs, op, rhs)
+        case parser.UnaryOperator(inner, TT.NOT) if isboolean(inner):
+            return inner
+        case (
+            parser.InExpr()
+            | parser.InSelect()
+            | parser.LikeExpr()
+            | parser.IsExpr()
+            | parser.Between()
+        ):
+            return dataclasses.replace(node, isnot=not node.isnot)
+    return None
+
+
+class Optimizer:
+    """
+    Rewrites statements into equivalent ones that are cheaper to run.
+    evaluate computes the value of an expression without columns
+    """
+
+    def __init__(self, evaluate: Callable[[parser.Expr], Any]):
+        self.evaluate = evaluate
+
+    def stmt(self, stmt: Any) -> Any:
+        match stmt:
+            case parser.SelectStmt():
+                joins = [
+                    dataclasses.replace(j, on=self.predicate(j.on)) for j in stmt.joins
+                ]
+                return dataclasses.replace(
+                    stmt,
+                    joins=joins,
+                    where=self.predicate(stmt.where),
+                    having=self.predicate(stmt.having),
+                )
+            case parser.ExplainStmt():
+                return dataclasses.replace(stmt, stmt=self.stmt(stmt.stmt))
+            case parser.DeleteStmt() | parser.UpdateStmt():
+                return dataclasses.replace(stmt, where=self.predicate(stmt.where))
+        return stmt
+
+    def predicate(self, node: parser.Expr | None) -> parser.Expr | None:
+        "Condition of WHERE, ON or HAVING, None if it always holds"
+        if node is None:
+            return None
+        node = self.condition(self.expr(node))
+        return None if istrue(node) else node
+
+    def condition(self, node: parser.Expr) -> parser.Expr:
+        """
+        Simplifications valid where only a true value counts,
+        NULL and false reject alike
+        """
+        match node:
+            case parser.BinaryOperator(_, TT.AND, _):
+                parts = [self.condition(c) for c in split(node, TT.AND)]
+                if any(isinstance(p, CONSTS) and not istrue(p) for p in parts):
+                    return parser.ConstInt(0)
+                return andall([p for p in parts if not istrue(p)]) or parser.ConstInt(1)
+            case parser.BinaryOperator(_, TT.OR, _):
+                parts = [self.condition(d) for d in split(node, TT.OR)]
+                if any(istrue(p) for p in parts):
+                    return parser.ConstInt(1)
+                parts = [p for p in parts if not isinstance(p, CONSTS)]
+                return combine(parts, TT.OR) or parser.ConstInt(0)
+            case parser.IsExpr(lhs, rhs, isnot) if lhs == rhs:
+                # IS compares NULLs as equal, so this holds for every row
+                return parser.ConstInt(not isnot)
+        return node
+
+    def expr(self, node: parser.Expr) -> parser.Expr:
+        "Equivalent expression, with its operands rewritten first"
+        if isinstance(node, (parser.FunctionCall, parser.BindParameter, *CONSTS)):
+            return node
+        if isinstance(node, parser.InSelect | parser.Exists):
+            node = dataclasses.replace(node, stmt=self.stmt(node.stmt))
+
+        changes: dict[str, Any] = {}
+        for field in dataclasses.fields(node):  # type: ignore[arg-type]
+            val = getattr(node, field.name)
+            if isinstance(val, parser.Expr):
+                changes[field.name] = self.expr(val)
+            elif field.name == "container":
+                changes[field.name] = [self.expr(e) for e in val]
+        node = dataclasses.replace(node, **changes)  # type: ignore[type-var]
+        return self.simplify(node)
+
+    def simplify(self, node: parser.Expr) -> parser.Expr:
+        match node:
+            case parser.UnaryOperator(inner, TT.NOT) if isboolean(inner):
+                node = negate(inner) or node
+            case parser.BinaryOperator(lhs, TT.AND, rhs):
+                # false whatever the other side is
+                if isfalse(lhs) or isfalse(rhs):
+                    return parser.ConstInt(0)
+            case parser.BinaryOperator(lhs, TT.OR, rhs):
+                if istrue(lhs) or istrue(rhs):
+                    return parser.ConstInt(1)
+            case parser.InExpr(element, container, isnot) if not isinstance(
+                node, InSet
+            ):
+                if all(isinstance(e, CONSTS) for e in container):
+                    values = [constval(e) for e in container]
+                    found = frozenset(v for v in values if v is not None)
+                    null = None in values
+                    node = InSet(element, container, isnot, found, null)
+
+        operands = [
+            getattr(node, field.name)
+            for field in dataclasses.fields(node)  # type: ignore[arg-type]
+        ]
+        operands += getattr(node, "container", [])
+        operands = [op for op in operands if isinstance(op, parser.Expr)]
+        if isinstance(node, FOLDABLE) and all(
+            isinstance(op, CONSTS) for op in operands
+        ):
+            return self.fold(node)
+        return node
+
+    def fold(self, node: parser.Expr) -> parser.Expr:
+        try:
+            val = self.evaluate(node)
+        except Exception:
+            # left to fail when it runs, if it does
+            return node
+        return literal(val) or node
+
+
+def cost(node: parser.Expr) -> float:
+    "Rough relative cost of evaluating node once"
+    total = 0.0
+    for part in parser.walk(node):
+        match part:
+            case InSet():
+                total += 1
+            case parser.InExpr(_, container, _):
+                total += len(container)
+            case parser.LikeExpr() | parser.FunctionCall():
+                total += 4
+            case parser.InSelect() | parser.Exists():
+                # uncorrelated results are reused, correlated ones may run again
+                total += 50 if part.refs else 2
+            case _:
+                total += 1
+    return total
+
+
+def selectivity(node: parser.Expr) -> float:
+    "Estimated fraction of rows for which node holds, System R defaults"
+    match node:
+        case parser.BinaryOperator(lhs, TT.AND, rhs):
+            return selectivity(lhs) * selectivity(rhs)
+        case parser.BinaryOperator(lhs, TT.OR, rhs):
+            lsel, rsel = selectivity(lhs), selectivity(rhs)
+            return lsel + rsel - lsel * rsel
+        case parser.BinaryOperator(_, TT.EQUAL, _):
+            return 0.1
+        case parser.BinaryOperator(_, TT.NOT_EQUAL, _):
+            return 0.9
+        case parser.BinaryOperator(_, op, _) if op in NEGATED:
+            return 1 / 3
+        case parser.UnaryOperator(inner, TT.NOT):
+            return 1 - selectivity(inner)
+        case parser.InExpr(_, container, isnot):
+            sel = min(0.5, 0.1 * len(container))
+            return 1 - sel if isnot else sel
+        case parser.IsExpr(_, _, isnot):
+            return 0.9 if isnot else 0.1
+        case parser.Between(_, _, _, isnot) | parser.LikeExpr(_, _, isnot):
+            return 0.75 if isnot else 0.25
+    return 0.5
+
+
+class Filter:
+    """
+    Condition over row contexts that tries its conjuncts in ascending
+    cost / (1 - pass rate) order, so that cheap conjuncts rejecting
+    many rows go first. Pass rates start from selectivity() and follow
+    the rates observed as rows are filtered
+    """
+
+    # rows between reorderings
+    ADAPT_ROWS = 1024
+    # weight of the estimated pass rate against the observed ones, in rows
+    PRIOR_ROWS = 16
+
+    def __init__(self, node: parser.Expr, evaluate: Evaluate):
+        self.conjuncts = conjuncts(node)
+        self.evaluate = evaluate
+        self.costs = [cost(c) for c in self.conjuncts]
+        self.estimates = [selectivity(c) for c in self.conjuncts]
+        self.tried = [0] * len(self.conjuncts)
+        self.passed = [0] * len(self.conjuncts)
+        self.rows = 0
+        self.order = list(range(len(self.conjuncts)))
+        self.reorder()
+
+    def passrate(self, i: int) -> float:
+        prior = self.PRIOR_ROWS
+        return (self.passed[i] + self.estimates[i] * prior) / (self.tried[i] + prior)
+
+    def reorder(self) -> None:
+        # sorting is stable, equal conjuncts stay in written order
+        self.order.sort(key=lambda i: self.costs[i] / max(1 - self.passrate(i), 0.01))
+
+    def __call__(self, context: dict[str, Any]) -> bool:
+        self.rows += 1
+        if self.rows % self.ADAPT_ROWS == 0:
+            self.reorder()
+        for i in self.order:
+            self.tried[i] += 1
+            if self.evaluate(self.conjuncts[i], context).val != 1:
+                return False
+            self.passed[i] += 1
+        return True
@@ -1,5 +1,7 @@
 import abc
 import dataclasses
+from collections.abc import Iterator
+from typing import Any
 
 from tokenizer import TT, Token, TokenType, tokenize
 
@@ -34,11 +36,33 @@ class ConstInt(Expr):
     val: int
 
 
+@dataclasses.dataclass
+class ConstReal(Expr):
+    val: float
+
+
+@dataclasses.dataclass
+class ConstNull(Expr):
+    pass
+
+
 @dataclasses.dataclass
 class BindParameter(Expr):
     ident: str
 
 
+@dataclasses.dataclass
+class Star(Expr):
+    pass
+
+
+@dataclasses.dataclass
+class FunctionCall(Expr):
+    name: str
+    args: list[Expr]
+    distinct: bool = False
+
+
 @dataclasses.dataclass
 class InExpr(Expr):
     element: Expr
@@ -66,6 +90,13 @@ class BinaryOperator(Expr):
     rhs: Expr
 
 
+@dataclasses.dataclass
+class IsExpr(Expr):
+    lhs: Expr
+    rhs: Expr
+    isnot: bool
+
+
 @dataclasses.dataclass
 class Between(Expr):
     expr: Expr
@@ -74,10 +105,39 @@ class Between(Expr):
     isnot: bool
 
 
+@dataclasses.dataclass
+class InSelect(Expr):
+    element: Expr
+    stmt: "SelectStmt"
+    isnot: bool
+    # columns of enclosing queries the subquery uses, set by the engine
+    refs: list["BindParameter"] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class Exists(Expr):
+    stmt: "SelectStmt"
+    refs: list["BindParameter"] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class ResultColumn:
+    expr: Expr
+    alias: str | None = None
+
+
+@dataclasses.dataclass
+class JoinClause:
+    tablename: str
+    on: Expr | None
+    left: bool
+
+
 @dataclasses.dataclass
 class ColumnDef:
     column_name: str
     type_name: str
+    primary_key: bool = False
 
 
 @dataclasses.dataclass
@@ -85,10 +145,35 @@ class Row:
     exprs: list[Expr]
 
 
+@dataclasses.dataclass
+class RangePartition:
+    name: str
+    # VALUES LESS THAN bound, None for MAXVALUE
+    bound: Expr | None
+
+
+@dataclasses.dataclass
+class PartitionBy:
+    # TT.RANGE or TT.HASH
+    method: TokenType
+    column: str
+    ranges: list[RangePartition]
+    # number of HASH partitions
+    count: int = 1
+
+
 @dataclasses.dataclass
 class CreateStmt(Stmt):
     tablename: str
     columndefs: list[ColumnDef]
+    partition_by: PartitionBy | None = None
+
+
+@dataclasses.dataclass
+class CreateIndexStmt(Stmt):
+    indexname: str
+    tablename: str
+    column: str
 
 
 @dataclasses.dataclass
@@ -97,16 +182,74 @@ class InsertStmt(Stmt):
     values: list[Row]
 
 
+@dataclasses.dataclass
+class DeleteStmt(Stmt):
+    tablename: str
+    where: Expr | None
+
+
+@dataclasses.dataclass
+class Assignment:
+    column: str
+    expr: Expr
+
+
+@dataclasses.dataclass
+class UpdateStmt(Stmt):
+    tablename: str
+    assignments: list[Assignment]
+    where: Expr | None
+
+
+@dataclasses.dataclass
+class BeginStmt(Stmt):
+    pass
+
+
+@dataclasses.dataclass
+class CommitStmt(Stmt):
+    pass
+
+
+@dataclasses.dataclass
+class RollbackStmt(Stmt):
+    # ROLLBACK TO savepoint, None rolls back the transaction
+    savepoint: str | None = None
+
+
+@dataclasses.dataclass
+class SavepointStmt(Stmt):
+    name: str
+
+
+@dataclasses.dataclass
+class ReleaseStmt(Stmt):
+    name: str
+
+
 @dataclasses.dataclass
 class SelectStmt(Stmt):
     tablename: str | None
-    result_columns: list[str]
+    joins: list[JoinClause]
+    result_columns: list[ResultColumn]
     where: Expr | None
+    group_by: list[Expr]
+    having: Expr | None
     distinct: bool
     orderingterm: OrderingTerm | None
     limit: Limit | None
 
 
+@dataclasses.dataclass
+class ExplainStmt(Stmt):
+    stmt: SelectStmt
+
+
+@dataclasses.dataclass
+class PragmaStmt(Stmt):
+    name: str
+
+
 class ParserError(Exception):
     pass
 
@@ -129,6 +272,16 @@ class Parser:
         else:
             raise ParserError(f"Expected {ttype} got {self.cur().ttype} at {self.i}")
 
+    def isword(self, word: str) -> bool:
+        "Whether the current token is the identifier word, a keyword only in places"
+        tok = self.cur()
+        return tok.ttype == TT.IDENTIFIER and tok.val.upper() == word
+
+    def expect_word(self, word: str) -> None:
+        if not self.isword(word):
+            raise ParserError(f"Expected {word} got {self.cur().ttype} at {self.i}")
+        self.skip()
+
     def expect_ident(self) -> str:
         tok = self.cur()
         self.expect(TokenType.IDENTIFIER)
@@ -152,6 +305,12 @@ class Parser:
         elif tok.ttype == TokenType.INT_LITERAL:
             self.skip()
             return ConstInt(int(tok.val))
+        elif tok.ttype == TT.REAL_LITERAL:
+            self.skip()
+            return ConstReal(float(tok.val))
+        elif tok.ttype == TT.NULL:
+            self.skip()
+            return ConstNull()
         else:
             raise ParserError(f"Wrong literal, got {tok.ttype}")
 
@@ -159,15 +318,60 @@ class Parser:
         tok = self.cur()
         if tok.ttype == TT.IDENTIFIER:
             self.skip()
+            if self.cur().ttype == TT.DOT:
+                self.skip()
+                return BindParameter(f"{tok.val}.{self.expect_ident()}")
             return BindParameter(tok.val)
         else:
             raise ParserError
 
+    def function_call(self) -> FunctionCall:
+        name = self.expect_ident().upper()
+        self.expect(TT.LCOLON)
+
+        if self.cur().ttype == TT.STAR:
+            self.skip()
+            self.expect(TT.RCOLON)
+            return FunctionCall(name, [Star()])
+
+        distinct = False
+        if self.cur().ttype == TT.DISTINCT:
+            self.skip()
+            distinct = True
+
+        args: list[Expr] = []
+        if self.cur().ttype != TT.RCOLON:
+            args.append(self.expr())
+            while self.cur().ttype == TT.COMMA:
+                self.skip()
+                args.append(self.expr())
+
+        self.expect(TT.RCOLON)
+        return FunctionCall(name, args, distinct)
+
     def value(self) -> Expr:
-        if self.cur().ttype in (TT.STRING_LITERAL, TT.INT_LITERAL):
+        if self.cur().ttype in (
+            TT.STRING_LITERAL,
+            TT.INT_LITERAL,
+            TT.REAL_LITERAL,
+            TT.NULL,
+        ):
             return self.literal_value()
         elif self.cur().ttype == TT.IDENTIFIER:
+            if self.tokens[self.i + 1].ttype == TT.LCOLON:
+                return self.function_call()
             return self.bind_parameter()
+        elif self.cur().ttype == TT.LCOLON:
+            self.skip()
+            expr = self.expr()
+            self.expect(TT.RCOLON)
+            return expr
+        elif self.cur().ttype == TT.EXISTS:
+            self.skip()
+            self.expect(TT.LCOLON)
+            stmt = self.select_stmt()
+            self.expect(TT.RCOLON)
+            return Exists(stmt)
         else:
             raise ParserError(str(self.cur().ttype))
 
@@ -189,6 +393,14 @@ class Parser:
             rhs = self.order_expr()
             return BinaryOperator(lhs, op, rhs)
 
+        if self.cur().ttype == TT.IS:
+            self.skip()
+            isnot = False
+            if self.cur().ttype == TT.NOT:
+                self.skip()
+                isnot = True
+            return IsExpr(lhs, self.order_expr(), isnot)
+
         isnot = False
         if self.cur().ttype == TT.NOT:
             isnot = True
@@ -204,6 +416,10 @@ class Parser:
         if self.cur().ttype == TT.IN:
             self.skip()
             self.expect(TT.LCOLON)
+            if self.cur().ttype == TT.SELECT:
+                stmt = self.select_stmt()
+                self.expect(TT.RCOLON)
+                return InSelect(lhs, stmt, isnot)
 
             exprs: list[Expr] = []
             exprs.append(self.expr())
@@ -217,7 +433,7 @@ class Parser:
 
         if self.cur().ttype == TT.LIKE:
             self.skip()
-            pattern = self.expr()
+            pattern = self.order_expr()
             return LikeExpr(lhs, pattern, isnot)
 
         return lhs
@@ -265,6 +481,29 @@ class Parser:
         self.expect(TokenType.RCOLON)
         return Row(exprs)
 
+    def column_def(self) -> ColumnDef:
+        column_name = self.expect_ident()
+        # type name is optional in sqlite
+        type_name = ""
+        if self.cur().ttype == TT.IDENTIFIER and not self.isword("PRIMARY"):
+            type_name = self.expect_ident()
+        primary_key = self.isword("PRIMARY")
+        if primary_key:
+            self.expect_word("PRIMARY")
+            self.expect_word("KEY")
+        return ColumnDef(column_name, type_name, primary_key)
+
+    def create_index_stmt(self) -> CreateIndexStmt:
+        self.expect(TT.CREATE)
+        self.expect(TT.INDEX)
+        indexname = self.expect_ident()
+        self.expect(TT.ON)
+        tablename = self.expect_ident()
+        self.expect(TT.LCOLON)
+        column = self.expect_ident()
+        self.expect(TT.RCOLON)
+        return CreateIndexStmt(indexname, tablename, column)
+
     def create_table_stmt(self) -> CreateStmt:
         self.expect(TokenType.CREATE)
         self.expect(TokenType.TABLE)
@@ -272,18 +511,63 @@ class Parser:
         columndefs = []
         self.expect(TokenType.LCOLON)
 
-        column_name = self.expect_ident()
-        type_name = self.expect_ident()
-        columndefs.append(ColumnDef(column_name, type_name))
+        columndefs.append(self.column_def())
 
         while self.cur().ttype == TokenType.COMMA:
             self.expect(TokenType.COMMA)
-            column_name = self.expect_ident()
-            type_name = self.expect_ident()
-            columndefs.append(ColumnDef(column_name, type_name))
+            columndefs.append(self.column_def())
         self.expect(TokenType.RCOLON)
 
-        return CreateStmt(tablename, columndefs)
+        partition_by = None
+        if self.isword("PARTITION"):
+            partition_by = self.partition_by()
+        return CreateStmt(tablename, columndefs, partition_by)
+
+    def partition_by(self) -> PartitionBy:
+        "PARTITION BY HASH (col) [PARTITIONS n] or RANGE (col) (PARTITION ...)"
+        self.expect_word("PARTITION")
+        self.expect(TT.BY)
+        methods = {"RANGE": TT.RANGE, "HASH": TT.HASH}
+        method = methods.get(self.cur().val.upper())
+        if self.cur().ttype != TT.IDENTIFIER or method is None:
+            raise ParserError(
+                f"Expected RANGE or HASH got {self.cur().ttype} at {self.i}"
+            )
+        self.skip()
+        self.expect(TT.LCOLON)
+        column = self.expect_ident()
+        self.expect(TT.RCOLON)
+
+        if method == TT.HASH:
+            count = 1
+            if self.isword("PARTITIONS"):
+                self.skip()
+                tok = self.cur()
+                self.expect(TT.INT_LITERAL)
+                count = int(tok.val)
+            return PartitionBy(method, column, [], count)
+
+        self.expect(TT.LCOLON)
+        ranges = [self.range_partition()]
+        while self.cur().ttype == TT.COMMA:
+            self.skip()
+            ranges.append(self.range_partition())
+        self.expect(TT.RCOLON)
+        return PartitionBy(method, column, ranges, len(ranges))
+
+    def range_partition(self) -> RangePartition:
+        self.expect_word("PARTITION")
+        name = self.expect_ident()
+        self.expect(TT.VALUES)
+        self.expect_word("LESS")
+        self.expect_word("THAN")
+        if self.isword("MAXVALUE"):
+            self.skip()
+            return RangePartition(name, None)
+        self.expect(TT.LCOLON)
+        bound = self.literal_value()
+        self.expect(TT.RCOLON)
+        return RangePartition(name, bound)
 
     def insert_stmt(self) -> InsertStmt:
         self.expect(TokenType.INSERT)
@@ -303,13 +587,96 @@ class Parser:
 
         return InsertStmt(tablename, values)
 
-    def result_column(self) -> str:
+    def delete_stmt(self) -> DeleteStmt:
+        self.expect(TT.DELETE)
+        self.expect(TT.FROM)
+        tablename = self.expect_ident()
+
+        where = None
+        if self.cur().ttype == TT.WHERE:
+            self.skip()
+            where = self.expr()
+        return DeleteStmt(tablename, where)
+
+    def assignment(self) -> Assignment:
+        column = self.expect_ident()
+        self.expect(TT.EQUAL)
+        return Assignment(column, self.expr())
+
+    def update_stmt(self) -> UpdateStmt:
+        self.expect(TT.UPDATE)
+        tablename = self.expect_ident()
+        self.expect(TT.SET)
+
+        assignments = [self.assignment()]
+        while self.cur().ttype == TT.COMMA:
+            self.skip()
+            assignments.append(self.assignment())
+
+        where = None
+        if self.cur().ttype == TT.WHERE:
+            self.skip()
+            where = self.expr()
+        return UpdateStmt(tablename, assignments, where)
+
+    def transaction_stmt(self) -> Stmt:
+        "BEGIN, COMMIT, ROLLBACK [TO name], SAVEPOINT name or RELEASE name"
+        tok = self.cur()
+        self.skip()
+        if tok.ttype == TT.SAVEPOINT:
+            return SavepointStmt(self.expect_ident())
+        if tok.ttype == TT.RELEASE:
+            if self.cur().ttype == TT.SAVEPOINT:
+                self.skip()
+            return ReleaseStmt(self.expect_ident())
+
+        if self.cur().ttype == TT.TRANSACTION:
+            self.skip()
+        if tok.ttype == TT.BEGIN:
+            return BeginStmt()
+        if tok.ttype == TT.COMMIT:
+            return CommitStmt()
+
+        if self.cur().ttype != TT.TO:
+            return RollbackStmt()
+        self.skip()
+        if self.cur().ttype == TT.SAVEPOINT:
+            self.skip()
+        return RollbackStmt(self.expect_ident())
+
+    def result_column(self) -> ResultColumn:
         if self.cur().ttype == TokenType.STAR:
             self.expect(TokenType.STAR)
-            return "*"
-        else:
-            column_name = self.expect_ident()
-            return column_name
+            return ResultColumn(Star())
+
+        expr = self.expr()
+        alias = None
+        if self.cur().ttype == TT.AS:
+            self.skip()
+            alias = self.expect_ident()
+        return ResultColumn(expr, alias)
+
+    def join_clause(self) -> JoinClause:
+        if self.cur().ttype == TT.COMMA:
+            self.skip()
+            return JoinClause(self.expect_ident(), None, False)
+
+        left = False
+        if self.cur().ttype == TT.INNER:
+            self.skip()
+        elif self.cur().ttype == TT.LEFT:
+            self.skip()
+            left = True
+            if self.cur().ttype == TT.OUTER:
+                self.skip()
+        self.expect(TT.JOIN)
+
+        tablename = self.expect_ident()
+        on = None
+        if self.cur().ttype == TT.ON:
+            self.skip()
+            on = self.expr()
+        return JoinClause(tablename, on, left)
 
     def select_stmt(self) -> SelectStmt:
         self.expect(TokenType.SELECT)
@@ -330,22 +697,39 @@ class Parser:
             cols.append(col)
 
         tablename = None
+        joins: list[JoinClause] = []
         if self.cur().ttype == TokenType.FROM:
             self.expect(TokenType.FROM)
             tablename = self.expect_ident()
+            while self.cur().ttype in (TT.JOIN, TT.INNER, TT.LEFT, TT.COMMA):
+                joins.append(self.join_clause())
 
         where = None
         if self.cur().ttype == TokenType.WHERE:
             self.expect(TokenType.WHERE)
             where = self.expr()
 
+        group_by: list[Expr] = []
+        having = None
+        if self.cur().ttype == TT.GROUP:
+            self.expect(TT.GROUP)
+            self.expect(TT.BY)
+            group_by.append(self.expr())
+            while self.cur().ttype == TT.COMMA:
+                self.skip()
+                group_by.append(self.expr())
+
+            if self.cur().ttype == TT.HAVING:
+                self.skip()
+                having = self.expr()
+
         orderingterm = None
         if self.cur().ttype == TT.ORDER:
             self.expect(TT.ORDER)
             self.expect(TT.BY)
 
             bind_param = self.bind_parameter()
-            orderingterm = OrderingTerm(bind_param.ident, False)
+            orderingterm = OrderingTerm(bind_param.ident, True)
 
             if self.cur().ttype == TT.ASC:
                 orderingterm.asc = True
@@ -367,16 +751,54 @@ class Parser:
 
             limit = Limit(limitval.val, offsetval)
 
-        return SelectStmt(tablename, cols, where, distinct, orderingterm, limit)
+        return SelectStmt(
+            tablename,
+            joins,
+            cols,
+            where,
+            group_by,
+            having,
+            distinct,
+            orderingterm,
+            limit,
+        )
+
+    def explain_stmt(self) -> ExplainStmt:
+        self.expect(TokenType.EXPLAIN)
+        self.expect(TokenType.ANALYZE)
+        return ExplainStmt(self.select_stmt())
+
+    def pragma_stmt(self) -> PragmaStmt:
+        self.expect(TokenType.PRAGMA)
+        return PragmaStmt(self.expect_ident())
 
     def sql_stmt(self) -> Stmt:
         stmt: Stmt
         if self.cur().ttype == TokenType.CREATE:
-            stmt = self.create_table_stmt()
+            if self.tokens[self.i + 1].ttype == TT.INDEX:
+                stmt = self.create_index_stmt()
+            else:
+                stmt = self.create_table_stmt()
         elif self.cur().ttype == TokenType.INSERT:
             stmt = self.insert_stmt()
         elif self.cur().ttype == TokenType.SELECT:
             stmt = self.select_stmt()
+        elif self.cur().ttype == TokenType.EXPLAIN:
+            stmt = self.explain_stmt()
+        elif self.cur().ttype == TokenType.PRAGMA:
+            stmt = self.pragma_stmt()
+        elif self.cur().ttype == TokenType.DELETE:
+            stmt = self.delete_stmt()
+        elif self.cur().ttype == TokenType.UPDATE:
+            stmt = self.update_stmt()
+        elif self.cur().ttype in (
+            TT.BEGIN,
+            TT.COMMIT,
+            TT.ROLLBACK,
+            TT.SAVEPOINT,
+            TT.RELEASE,
+        ):
+            stmt = self.transaction_stmt()
         else:
             raise ParserError(f"Unexpected token type {self.cur().ttype}")
 
@@ -398,6 +820,31 @@ def parse(source: str) -> list[Stmt]:
     return Parser(source).parse()
 
 
+def walk(node: Expr) -> Iterator[Expr]:
+    "Yield node and all of its subexpressions"
+    yield node
+    for field in dataclasses.fields(node):  # type: ignore[arg-type]
+        val = getattr(node, field.name)
+        if isinstance(val, Expr):
+            yield from walk(val)
+        elif isinstance(val, list):
+            for item in val:
+                if isinstance(item, Expr):
+                    yield from walk(item)
+
+
+def subselects(node: Any) -> Iterator[SelectStmt]:
+    "SELECTs nested in the expressions of a statement or expression, at any depth"
+    if isinstance(node, (InSelect, Exists)):
+        yield node.stmt
+    if isinstance(node, list):
+        for item in node:
+            yield from subselects(item)
+    elif dataclasses.is_dataclass(node) and not isinstance(node, type):
+        for field in dataclasses.fields(node):
+            yield from subselects(getattr(node, field.name))
+
+
 def test_create() -> None:
     line = "CREATE TABLE user (firstname TEXT, secondname TEXT);"
     stmts = parse(line)
@@ -413,6 +860,39 @@ def test_create() -> None:
     assert stmts == expected_stmts
 
 
+def test_create_partitioned() -> None:
+    stmts = parse(
+        "CREATE TABLE t (a INTEGER) PARTITION BY HASH (a) PARTITIONS 4;"
+        "CREATE TABLE t (a INTEGER) PARTITION BY RANGE (a) "
+        "(PARTITION p0 VALUES LESS THAN (10), PARTITION p1 VALUES LESS THAN MAXVALUE);"
+    )
+    columndefs = [ColumnDef("a", "INTEGER")]
+    ranges = [RangePartition("p0", ConstInt(10)), RangePartition("p1", None)]
+    assert stmts == [
+        CreateStmt("t", columndefs, PartitionBy(TT.HASH, "a", [], 4)),
+        CreateStmt("t", columndefs, PartitionBy(TT.RANGE, "a", ranges, 2)),
+    ]
+    # the words of PARTITION BY are keywords only there
+    stmts = parse("CREATE TABLE u (range INTEGER, hash TEXT, partitions, less);")
+    names = ["range", "hash", "partitions", "less"]
+    types = ["INTEGER", "TEXT", "", ""]
+    assert stmts == [CreateStmt("u", [ColumnDef(*c) for c in zip(names, types)])]
+
+
+def test_create_primary_key() -> None:
+    stmts = parse("CREATE TABLE t (id INTEGER PRIMARY KEY, s TEXT, k PRIMARY KEY);")
+    columndefs = [
+        ColumnDef("id", "INTEGER", True),
+        ColumnDef("s", "TEXT"),
+        ColumnDef("k", "", True),
+    ]
+    assert stmts == [CreateStmt("t", columndefs)]
+    # the words are keywords only after a column name
+    stmts = parse("CREATE TABLE t (key INTEGER, primary TEXT PRIMARY KEY);")
+    columndefs = [ColumnDef("key", "INTEGER"), ColumnDef("primary", "TEXT", True)]
+    assert stmts == [CreateStmt("t", columndefs)]
+
+
 def test_insert() -> None:
     line = 'INSERT INTO user VALUES ("alisher", "zhubanyshev"), ("john", "doe");'
     stmts = parse(line)
@@ -431,12 +911,133 @@ def test_insert() -> None:
 def test_select() -> None:
     line = "SELECT * FROM user;"
     stmts = parse(line)
-    expected_stmts = [SelectStmt("user", ["*"], None)]
+    expected_stmts = [
+        SelectStmt(
+            "user", [], [ResultColumn(Star())], None, [], None, False, None, None
+        )
+    ]
     assert stmts == expected_stmts
 
 
 def test_select_cols() -> None:
     line = "SELECT title, director FROM movies;"
     stmts = parse(line)
-    expected_stmts = [SelectStmt("movies", ["title", "director"], None)]
+    expected_stmts = [
+        SelectStmt(
+            "movies",
+            [],
+            [
+                ResultColumn(BindParameter("title")),
+                ResultColumn(BindParameter("director")),
+            ],
+            None,
+            [],
+            None,
+            False,
+            None,
+            None,
+        )
+    ]
+    assert stmts == expected_stmts
+
+
+def test_select_aggregate() -> None:
+    line = "SELECT role, COUNT(*) AS n FROM employees GROUP BY role HAVING n > 1;"
+    stmts = parse(line)
+    expected_stmts = [
+        SelectStmt(
+            "employees",
+            [],
+            [
+                ResultColumn(BindParameter("role")),
+                ResultColumn(FunctionCall("COUNT", [Star()]), "n"),
+            ],
+            None,
+            [BindParameter("role")],
+            BinaryOperator(BindParameter("n"), TT.GT, ConstInt(1)),
+            False,
+            None,
+            None,
+        )
+    ]
+    assert stmts == expected_stmts
+
+
+def test_select_join() -> None:
+    line = "SELECT title FROM movies LEFT JOIN boxoffice ON movies.id = movie_id;"
+    stmts = parse(line)
+    expected_stmts = [
+        SelectStmt(
+            "movies",
+            [
+                JoinClause(
+                    "boxoffice",
+                    BinaryOperator(
+                        BindParameter("movies.id"), TT.EQUAL, BindParameter("movie_id")
+                    ),
+                    True,
+                )
+            ],
+            [ResultColumn(BindParameter("title"))],
+            None,
+            [],
+            None,
+            False,
+            None,
+            None,
+        )
+    ]
     assert stmts == expected_stmts
+
+
+def test_explain() -> None:
+    stmts = parse("EXPLAIN ANALYZE SELECT a FROM t;")
+    select = SelectStmt(
+        "t", [], [ResultColumn(BindParameter("a"))], None, [], None, False, None, None
+    )
+    assert stmts == [ExplainStmt(select)]
+
+
+def test_delete_update() -> None:
+    stmts = parse("DELETE FROM t; UPDATE t SET a = 1, b = 'x' WHERE a IS NULL;")
+    where = IsExpr(BindParameter("a"), ConstNull(), False)
+    assignments = [
+        Assignment("a", ConstInt(1)),
+        Assignment("b", ConstString("x")),
+    ]
+    assert stmts == [DeleteStmt("t", None), UpdateStmt("t", assignments, where)]
+
+
+def test_transaction() -> None:
+    stmts = parse(
+        "BEGIN TRANSACTION; SAVEPOINT a; ROLLBACK TO SAVEPOINT a;"
+        "RELEASE a; ROLLBACK TO a; ROLLBACK; COMMIT;"
+    )
+    assert stmts == [
+        BeginStmt(),
+        SavepointStmt("a"),
+        RollbackStmt("a"),
+        ReleaseStmt("a"),
+        RollbackStmt("a"),
+        RollbackStmt(),
+        CommitStmt(),
+    ]
+
+
+def test_pragma() -> None:
+    assert parse("PRAGMA memory_usage;") == [PragmaStmt("memory_usage")]
+
+
+def test_subquery() -> None:
+    (stmt,) = parse(
+        "SELECT a FROM t WHERE a NOT IN (SELECT b FROM u)"
+        " AND NOT EXISTS (SELECT * FROM v WHERE v.c = t.a);"
+    )
+    assert isinstance(stmt, SelectStmt)
+    inner, exists = list(subselects(stmt))
+    assert stmt.where == BinaryOperator(
+        InSelect(BindParameter("a"), inner, True),
+        TT.AND,
+        UnaryOperator(Exists(exists), TT.NOT),
+    )
+    assert inner.tablename == "u" and exists.tablename == "v"
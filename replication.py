@@ -0,0 +1,232 @@
+"""
+Statement-log replication of an Engine to read-only followers.
+The leader appends every committed write to a StatementLog, followers
+connect to it over a socket, tail the log and apply the statements in order.
+Log positions double as read-your-writes tokens: a read passed the token
+of a write waits until the follower has applied it
+"""
+
+import dataclasses
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any
+
+import parser
+from engine import READONLY_STMTS, Engine, EngineError
+
+Address = tuple[str, int]
+
+# seconds between messages to an idle follower, which keep its lag current
+HEARTBEAT = 0.5
+
+
+class ReplicationTimeout(EngineError):
+    pass
+
+
+@dataclasses.dataclass
+class LogEntry:
+    # position in the log, counted from 1
+    lsn: int
+    # statements of one committed transaction, or a single write
+    stmts: list[tuple[parser.Stmt, str]]
+    # time.time() of the commit on the leader
+    committed: float
+
+
+class StatementLog:
+    "Committed writes of an Engine in commit order, kept from the start"
+
+    def __init__(self) -> None:
+        self.entries: list[LogEntry] = []
+        self.changed = threading.Condition()
+
+    @property
+    def lsn(self) -> int:
+        "Position of the last entry, 0 while the log is empty"
+        return len(self.entries)
+
+    def append(self, stmts: list[tuple[parser.Stmt, str]]) -> int:
+        with self.changed:
+            self.entries.append(LogEntry(self.lsn + 1, list(stmts), time.time()))
+            self.changed.notify_all()
+            return self.lsn
+
+    def since(self, lsn: int, timeout: float | None = None) -> list[LogEntry]:
+        "Entries after lsn, waiting up to timeout for one if there are none"
+        with self.changed:
+            self.changed.wait_for(lambda: self.lsn > lsn, timeout)
+            return self.entries[lsn:]
+
+
+class Leader:
+    """
+    Engine whose committed writes are served to followers on address,
+    port 0 picks a free one, see self.address
+    """
+
+    def __init__(
+        self,
+        authkey: bytes,
+        address: Address = ("127.0.0.1", 0),
+        engine: Engine | None = None,
+    ):
+        self.engine = Engine() if engine is None else engine
+        self.log = StatementLog()
+        self.engine.log = self.log
+        self.listener = Listener(address, authkey=authkey)
+        self.address: Address = self.listener.address
+        # last position each connected follower reported as applied
+        self.followers: dict[int, int] = {}
+        self.closed = False
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def execute(self, cmd: str, timeout: float | None = None) -> Any:
+        return self.engine.execute(cmd, timeout)
+
+    def token(self) -> int:
+        "Read-your-writes token covering every write committed so far"
+        return self.log.lsn
+
+    def accept(self) -> None:
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                # closed
+                return
+            threading.Thread(target=self.feed, args=(conn,), daemon=True).start()
+
+    def feed(self, conn: Connection) -> None:
+        "Sends log entries to one follower as they are committed"
+        key = id(conn)
+        try:
+            sent = applied = conn.recv()
+            while not self.closed:
+                self.followers[key] = applied
+                entries = self.log.since(sent, HEARTBEAT)
+                conn.send((entries, self.log.lsn))
+                if entries:
+                    sent = entries[-1].lsn
+                while conn.poll():
+                    applied = conn.recv()
+        except (EOFError, OSError):
+            pass
+        finally:
+            self.followers.pop(key, None)
+            conn.close()
+
+    def stats(self) -> dict[str, Any]:
+        lsn = self.log.lsn
+        return {
+            "lsn": lsn,
+            "followers": [
+                {"applied": applied, "lag_entries": lsn - applied}
+                for applied in list(self.followers.values())
+            ],
+        }
+
+    def close(self) -> None:
+        "Stops accepting followers, the connected ones are dropped within HEARTBEAT"
+        self.closed = True
+        self.listener.close()
+
+
+class Follower:
+    """
+    Read-only Engine kept up to date from the log of a leader.
+    Every entry is applied while reads wait, so they never see a
+    transaction in part
+    """
+
+    def __init__(self, address: Address, authkey: bytes, engine: Engine | None = None):
+        self.engine = Engine() if engine is None else engine
+        self.engine.readonly = True
+        # held while reading or applying an entry
+        self.lock = threading.Lock()
+        self.applied = threading.Condition()
+        self.applied_lsn = 0
+        self.leader_lsn = 0
+        # seconds between the commit on the leader and the apply here,
+        # of the last applied entry
+        self.lag_seconds = 0.0
+        self.apply_errors = 0
+        self.closed = False
+        self.conn = Client(address, authkey=authkey)
+        self.conn.send(self.applied_lsn)
+        self.thread = threading.Thread(target=self.tail, daemon=True)
+        self.thread.start()
+
+    def tail(self) -> None:
+        try:
+            self.receive()
+        finally:
+            self.conn.close()
+
+    def receive(self) -> None:
+        while not self.closed:
+            try:
+                entries, leader_lsn = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            for entry in entries:
+                self.apply(entry)
+            with self.applied:
+                self.leader_lsn = max(leader_lsn, self.applied_lsn)
+            if entries:
+                try:
+                    self.conn.send(self.applied_lsn)
+                except OSError:
+                    return
+
+    def apply(self, entry: LogEntry) -> None:
+        with self.lock:
+            self.engine.readonly = False
+            try:
+                for stmt, sql in entry.stmts:
+                    try:
+                        self.engine.run(stmt, sql)
+                    except EngineError:
+                        # the statement succeeded on the leader, the replica diverged
+                        self.apply_errors += 1
+            finally:
+                self.engine.readonly = True
+        with self.applied:
+            self.applied_lsn = entry.lsn
+            self.lag_seconds = time.time() - entry.committed
+            self.applied.notify_all()
+
+    def wait(self, token: int, timeout: float | None = None) -> None:
+        "Waits until the writes covered by a leader token are applied"
+        with self.applied:
+            if not self.applied.wait_for(lambda: self.applied_lsn >= token, timeout):
+                raise ReplicationTimeout(
+                    f"replica at {self.applied_lsn} did not reach {token} in time"
+                )
+
+    def execute(
+        self, cmd: str, token: int | None = None, timeout: float | None = None
+    ) -> Any:
+        "Reads, after the writes of token if given, timeout bounds the wait"
+        if any(not isinstance(s, READONLY_STMTS) for s in parser.parse(cmd + ";")):
+            raise EngineError("attempt to write a readonly database")
+        if token is not None:
+            self.wait(token, timeout)
+        with self.lock:
+            return self.engine.execute(cmd)
+
+    def stats(self) -> dict[str, Any]:
+        with self.applied:
+            return {
+                "applied_lsn": self.applied_lsn,
+                "leader_lsn": self.leader_lsn,
+                "lag_entries": self.leader_lsn - self.applied_lsn,
+                "lag_seconds": self.lag_seconds,
+                "apply_errors": self.apply_errors,
+            }
+
+    def close(self) -> None:
+        "Stops tailing, which waits for the next message of the leader"
+        self.closed = True
+        self.thread.join(HEARTBEAT * 4)
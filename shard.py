@@ -0,0 +1,474 @@
+"""
+Tables sharded by key over engines in other processes, see Coordinator
+
+    python shard.py --port 7001 --authkey secret
+
+serves an Engine on a socket for coordinators on other nodes,
+Coordinator.local(n) starts n such workers on this machine
+"""
+
+import argparse
+import heapq
+import itertools
+import multiprocessing
+import os
+import sys
+from dataclasses import replace
+from multiprocessing.connection import Client, Connection, Listener
+from multiprocessing.process import BaseProcess
+from typing import Any
+
+import parser
+from engine import (
+    Accumulator,
+    Engine,
+    EngineError,
+    MaxAcc,
+    MinAcc,
+    SumAcc,
+    isaggregate,
+    sortkey,
+    stablehash,
+    tovalue,
+)
+from optimizer import conjuncts
+from spill import external_distinct
+from tokenizer import TT
+
+Address = tuple[str, int]
+Row = tuple[Any, ...]
+
+CONSTS = (parser.ConstInt, parser.ConstReal, parser.ConstString, parser.ConstNull)
+# aggregates computed by every shard, by how their results are combined
+PARTIALS: dict[str, type[Accumulator]] = {
+    "COUNT": SumAcc,
+    "SUM": SumAcc,
+    "MIN": MinAcc,
+    "MAX": MaxAcc,
+}
+
+
+# statements every shard runs as they are
+BROADCAST = (
+    parser.CreateIndexStmt,
+    parser.DeleteStmt,
+    parser.BeginStmt,
+    parser.CommitStmt,
+    parser.RollbackStmt,
+    parser.SavepointStmt,
+    parser.ReleaseStmt,
+)
+
+
+def handle(engine: Engine, conn: Connection) -> bool:
+    "Runs the statements a coordinator sends, False once it stops the worker"
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return True
+        if request is None:
+            return False
+        stmts, sql = request
+        try:
+            output = [engine.run(stmt, sql) for stmt in stmts]
+        except Exception as e:  # noqa: BLE001
+            # raised again by the coordinator
+            conn.send(("error", e))
+        else:
+            conn.send(("ok", output))
+
+
+def serve(listener: Listener) -> None:
+    "Serves one coordinator at a time until one of them stops the worker"
+    engine = Engine()
+    with listener:
+        while True:
+            with listener.accept() as conn:
+                if not handle(engine, conn):
+                    return
+
+
+def worker(authkey: bytes, ready: Connection) -> None:
+    "Local worker, its address is sent through ready"
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    ready.send(listener.address)
+    ready.close()
+    serve(listener)
+
+
+def accumulators(partials: list[parser.FunctionCall]) -> list[Accumulator]:
+    "Accumulators combining the partial results of a group"
+    accs = [PARTIALS[p.name]() for p in partials]
+    for acc, partial in zip(accs, partials):
+        if partial.name == "COUNT":
+            # counts add up from 0, a SUM of nothing is NULL
+            acc.step(0)
+    return accs
+
+
+class Coordinator:
+    """
+    Engine-like front of shards. Rows of a table live on the shard picked
+    by stablehash() of their key column, the first column unless keys names
+    another. SELECTs on one table run on the shards with WHERE, projection,
+    ORDER BY and LIMIT pushed down, or with COUNT, SUM, MIN, MAX and AVG
+    computed per shard and group, and their results are merged here.
+    Other SELECTs run on a local Engine the rows of their tables are
+    gathered into
+    """
+
+    def __init__(
+        self,
+        addresses: list[Address],
+        authkey: bytes,
+        keys: dict[str, str] | None = None,
+    ):
+        self.conns = [Client(address, authkey=authkey) for address in addresses]
+        self.keys = {name.lower(): column for name, column in (keys or {}).items()}
+        # CREATE TABLE statements run through this coordinator
+        self.schemas: dict[str, parser.CreateStmt] = {}
+        # workers started by local(), stopped by close()
+        self.processes: list[BaseProcess] = []
+
+    @classmethod
+    def local(cls, nshards: int, keys: dict[str, str] | None = None) -> "Coordinator":
+        context = multiprocessing.get_context("spawn")
+        authkey = os.urandom(16)
+        addresses = []
+        processes: list[BaseProcess] = []
+        for _ in range(nshards):
+            ready, child = context.Pipe(duplex=False)
+            process = context.Process(target=worker, args=(authkey, child), daemon=True)
+            process.start()
+            child.close()
+            addresses.append(ready.recv())
+            processes.append(process)
+        coordinator = cls(addresses, authkey, keys)
+        coordinator.processes = processes
+        return coordinator
+
+    def close(self) -> None:
+        "Stops the workers started by local(), others keep serving"
+        for conn in self.conns:
+            if self.processes:
+                conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self) -> "Coordinator":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def scatter(
+        self, requests: dict[int, list[parser.Stmt]], sql: str
+    ) -> dict[int, list[Any]]:
+        """
+        Outputs of statements run on shards by shard number. Every shard gets
+        its request before any output is read, so the shards work in parallel
+        """
+        for shard, stmts in requests.items():
+            self.conns[shard].send((stmts, sql))
+        outputs = {}
+        error = None
+        for shard in requests:
+            status, output = self.conns[shard].recv()
+            if status == "error":
+                error = error or output
+            outputs[shard] = output
+        if error is not None:
+            raise error
+        return outputs
+
+    def gather(
+        self, stmt: parser.Stmt, sql: str, shards: list[int] | None = None
+    ) -> list[list[Any]]:
+        "Output of a statement run on the given shards, all by default"
+        if shards is None:
+            shards = list(range(len(self.conns)))
+        outputs = self.scatter({shard: [stmt] for shard in shards}, sql)
+        return [outputs[shard][0] or [] for shard in shards]
+
+    def execute(self, cmd: str) -> Any:
+        cmd = cmd + ";"
+        for stmt in parser.parse(cmd):
+            return self.run(stmt, cmd)
+        return []
+
+    def run(self, stmt: parser.Stmt, sql: str) -> Any:
+        if not isinstance(stmt, parser.SelectStmt) and any(parser.subselects(stmt)):
+            # every shard would see only its own rows of the subquery
+            raise EngineError("subqueries are only supported in SELECT on shards")
+        if isinstance(stmt, BROADCAST):
+            where = getattr(stmt, "where", None)
+            self.gather(
+                stmt, sql, self.shardsfor(getattr(stmt, "tablename", ""), where)
+            )
+            return []
+        method = getattr(self, stmt.__class__.__name__.lower(), None)
+        if method is None:
+            raise EngineError(f"{stmt.__class__.__name__} is not supported on shards")
+        return method(stmt, sql)
+
+    def keyposition(self, tablename: str) -> int:
+        schema = self.schemas.get(tablename.lower())
+        if schema is None:
+            raise EngineError(f"no such table: {tablename}")
+        columns = [cd.column_name for cd in schema.columndefs]
+        return columns.index(self.keys.get(tablename.lower(), columns[0]))
+
+    def shard(self, val: Any) -> int:
+        return stablehash(val) % len(self.conns)
+
+    def shardsfor(self, tablename: str, where: parser.Expr | None) -> list[int]:
+        "Shards that may hold rows of the table matching WHERE"
+        found = set(range(len(self.conns)))
+        schema = self.schemas.get(tablename.lower())
+        if schema is None:
+            return sorted(found)
+        key = schema.columndefs[self.keyposition(tablename)].column_name
+
+        def onkey(node: parser.Expr) -> bool:
+            return (
+                isinstance(node, parser.BindParameter)
+                and node.ident.split(".")[-1] == key
+            )
+
+        for pred in conjuncts(where):
+            match pred:
+                case parser.BinaryOperator(lhs, TT.EQUAL, rhs):
+                    if isinstance(lhs, CONSTS[:3]):
+                        lhs, rhs = rhs, lhs
+                    if onkey(lhs) and isinstance(rhs, CONSTS[:3]):
+                        found &= {self.shard(rhs.val)}
+                case parser.InExpr(lhs, container, False) if onkey(lhs):
+                    if all(isinstance(e, CONSTS[:3]) for e in container):
+                        found &= {self.shard(e.val) for e in container}  # type: ignore[attr-defined]
+        return sorted(found)
+
+    def createstmt(self, stmt: parser.CreateStmt, sql: str) -> Any:
+        columns = [cd.column_name for cd in stmt.columndefs]
+        key = self.keys.get(stmt.tablename.lower(), columns[0])
+        if key not in columns:
+            raise EngineError(f"no such column: {key}")
+        self.gather(stmt, sql)
+        self.schemas[stmt.tablename.lower()] = stmt
+        return []
+
+    def insertstmt(self, stmt: parser.InsertStmt, sql: str) -> Any:
+        pos = self.keyposition(stmt.tablename)
+        rows: dict[int, list[parser.Row]] = {}
+        for row in stmt.values:
+            if pos >= len(row.exprs) or not isinstance(row.exprs[pos], CONSTS):
+                raise EngineError("expr error")
+            val = getattr(row.exprs[pos], "val", None)
+            rows.setdefault(self.shard(val), []).append(row)
+        requests: dict[int, list[parser.Stmt]] = {
+            shard: [replace(stmt, values=r)] for shard, r in rows.items()
+        }
+        self.scatter(requests, sql)
+        return []
+
+    def updatestmt(self, stmt: parser.UpdateStmt, sql: str) -> Any:
+        schema = self.schemas.get(stmt.tablename.lower())
+        if schema is not None:
+            key = schema.columndefs[self.keyposition(stmt.tablename)].column_name
+            if any(a.column == key for a in stmt.assignments):
+                raise EngineError(f"cannot UPDATE shard key column {key}")
+        self.gather(stmt, sql, self.shardsfor(stmt.tablename, stmt.where))
+        return []
+
+    def selectstmt(self, stmt: parser.SelectStmt, sql: str) -> Any:
+        if stmt.tablename is None or stmt.joins or any(parser.subselects(stmt)):
+            return self.locally(stmt, sql)
+        aggregates = [
+            node
+            for rcol in stmt.result_columns
+            for node in parser.walk(rcol.expr)
+            if isaggregate(node)
+        ]
+        if stmt.group_by or aggregates:
+            output = self.aggregate(stmt, sql)
+        else:
+            output = self.pushdown(stmt, sql)
+        return self.locally(stmt, sql) if output is None else output
+
+    def orderposition(self, stmt: parser.SelectStmt) -> int | None:
+        "Result column ORDER BY names, like Engine.aliasposition()"
+        assert stmt.orderingterm is not None
+        ident = stmt.orderingterm.ident
+        if any(isinstance(r.expr, parser.Star) for r in stmt.result_columns):
+            return None
+        for i, rcol in enumerate(stmt.result_columns):
+            if rcol.alias == ident:
+                return i
+        return None
+
+    def pushdown(self, stmt: parser.SelectStmt, sql: str) -> list[Row] | None:
+        """
+        Every shard filters, projects, sorts and cuts its rows to the LIMIT,
+        sorted outputs are merged
+        """
+        shardstmt = stmt
+        pos = None
+        hidden = False
+        if stmt.orderingterm is not None:
+            pos = self.orderposition(stmt)
+            if pos is None:
+                if stmt.distinct:
+                    return None
+                # ORDER BY column is sent along and dropped after the merge
+                column = parser.ResultColumn(
+                    parser.BindParameter(stmt.orderingterm.ident)
+                )
+                shardstmt = replace(stmt, result_columns=stmt.result_columns + [column])
+                pos = -1
+                hidden = True
+        if stmt.limit:
+            limit = parser.Limit(stmt.limit.limitval + stmt.limit.offset, 0)
+            shardstmt = replace(shardstmt, limit=limit)
+
+        outputs = self.gather(
+            shardstmt, sql, self.shardsfor(stmt.tablename or "", stmt.where)
+        )
+        rows: Any
+        if stmt.orderingterm is None:
+            rows = itertools.chain.from_iterable(outputs)
+        else:
+
+            def orderkey(row: Row) -> tuple[int, Any]:
+                return sortkey(row[pos])  # type: ignore[index]
+
+            reverse = not stmt.orderingterm.asc
+            rows = heapq.merge(*outputs, key=orderkey, reverse=reverse)
+        if hidden:
+            rows = (row[:-1] for row in rows)
+        if stmt.distinct:
+            rows = external_distinct(rows)
+        if stmt.limit:
+            offset = stmt.limit.offset
+            rows = itertools.islice(rows, offset, offset + stmt.limit.limitval)
+        return list(rows)
+
+    def aggregate(self, stmt: parser.SelectStmt, sql: str) -> list[Row] | None:
+        """
+        Every shard aggregates its rows by group, AVG as SUM and COUNT,
+        and the partial results are combined by group.
+        None if a result column is neither an aggregate nor a grouped column
+        """
+        if stmt.having is not None or stmt.distinct:
+            return None
+        if not all(isinstance(e, parser.BindParameter) for e in stmt.group_by):
+            return None
+        groups = [e.ident for e in stmt.group_by]  # type: ignore[attr-defined]
+        partials: list[parser.FunctionCall] = []
+        # position in the group key, or aggregate name and positions of its partials
+        finals: list[tuple[str, list[int]]] = []
+        for rcol in stmt.result_columns:
+            expr = rcol.expr
+            if isinstance(expr, parser.BindParameter) and expr.ident in groups:
+                finals.append(("", [groups.index(expr.ident)]))
+                continue
+            if not isinstance(expr, parser.FunctionCall) or expr.distinct:
+                return None
+            if len(expr.args) != 1 or expr.name not in (*PARTIALS, "AVG"):
+                return None
+            if expr.name == "AVG":
+                finals.append((expr.name, [len(partials), len(partials) + 1]))
+                partials.append(parser.FunctionCall("SUM", expr.args))
+                partials.append(parser.FunctionCall("COUNT", expr.args))
+            else:
+                finals.append((expr.name, [len(partials)]))
+                partials.append(expr)
+
+        pos = None
+        if stmt.orderingterm is not None:
+            pos = self.orderposition(stmt)
+            if pos is None:
+                return None
+
+        columns = [parser.ResultColumn(e) for e in [*stmt.group_by, *partials]]
+        shardstmt = replace(stmt, result_columns=columns, orderingterm=None, limit=None)
+        shards = self.shardsfor(stmt.tablename or "", stmt.where)
+
+        merged: dict[Row, list[Accumulator]] = {}
+        for row in itertools.chain.from_iterable(self.gather(shardstmt, sql, shards)):
+            key = row[: len(groups)]
+            accs = merged.get(key)
+            if accs is None:
+                accs = merged[key] = accumulators(partials)
+            for acc, val in zip(accs, row[len(groups) :]):
+                acc.step(val)
+        if not groups and not merged:
+            # without GROUP BY there is one row even if no shard had rows
+            merged[()] = accumulators(partials)
+
+        rows = []
+        # groups in key order, like Engine
+        for key, accs in sorted(
+            merged.items(), key=lambda kv: tuple(map(sortkey, kv[0]))
+        ):
+            values: list[Any] = []
+            for name, positions in finals:
+                if not name:
+                    values.append(key[positions[0]])
+                elif name == "AVG":
+                    total, count = (accs[p].final() for p in positions)
+                    values.append(None if not count else total / count)
+                else:
+                    values.append(accs[positions[0]].final())
+            rows.append(tuple(values))
+
+        if stmt.orderingterm is not None:
+            reverse = not stmt.orderingterm.asc
+            rows.sort(key=lambda row: sortkey(row[pos]), reverse=reverse)  # type: ignore[index]
+        if stmt.limit:
+            offset = stmt.limit.offset
+            rows = rows[offset : offset + stmt.limit.limitval]
+        return rows
+
+    def locally(self, stmt: parser.SelectStmt, sql: str) -> Any:
+        "Runs the query on a local Engine holding the rows of its tables"
+        engine = Engine()
+        names = []
+        for select in [stmt, *parser.subselects(stmt)]:
+            if select.tablename is not None:
+                names.append(select.tablename)
+            names += [j.tablename for j in select.joins]
+        # WHERE of a single table query is applied by the shards too
+        single = not stmt.joins and len(names) == 1
+        for name in {name.lower() for name in names}:
+            schema = self.schemas.get(name)
+            if schema is None:
+                raise EngineError(f"no such table: {name}")
+            engine.run(replace(schema, partition_by=None), sql)
+            where = stmt.where if single else None
+            star = [parser.ResultColumn(parser.Star())]
+            fetch = parser.SelectStmt(
+                name, [], star, where, [], None, False, None, None
+            )
+            table = engine.gettable(name)
+            for rows in self.gather(fetch, sql, self.shardsfor(name, where)):
+                # keys of the shards interleave, rows get local rowids
+                engine.insertrows(
+                    table, [[tovalue(val) for val in row] for row in rows]
+                )
+        return engine.run(stmt, sql) or []
+
+
+def main(argv: list[str] | None = None) -> int:
+    argparser = argparse.ArgumentParser(description=__doc__)
+    argparser.add_argument("--host", default="127.0.0.1")
+    argparser.add_argument("--port", type=int, default=7001)
+    argparser.add_argument("--authkey", required=True)
+    args = argparser.parse_args(argv)
+
+    serve(Listener((args.host, args.port), authkey=args.authkey.encode()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
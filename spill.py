@@ -0,0 +1,182 @@
+"""
+Sort and DISTINCT operators bounded by a memory budget in bytes.
+What does not fit is written to temporary files and read back
+"""
+
+import heapq
+import itertools
+import operator
+import pickle
+import sys
+import tempfile
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from typing import IO, Any
+
+Row = tuple[Any, ...]
+
+# rows pickled together in temporary files
+CHUNK_ROWS = 1024
+
+
+def rowsize(row: Row) -> int:
+    return sys.getsizeof(row) + sum(sys.getsizeof(val) for val in row)
+
+
+def writerows(rows: Iterable[Any], directory: str | None) -> IO[bytes]:
+    file = tempfile.TemporaryFile(dir=directory)  # noqa: SIM115
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_ROWS:
+            pickle.dump(chunk, file)
+            chunk = []
+    if chunk:
+        pickle.dump(chunk, file)
+    file.seek(0)
+    return file
+
+
+def readrows(file: IO[bytes]) -> Iterator[Any]:
+    "Rows of a file from writerows(), the file is closed and deleted at the end"
+    try:
+        while True:
+            try:
+                # the file was written by this process
+                chunk = pickle.load(file)  # noqa: S301
+            except EOFError:
+                return
+            yield from chunk
+    finally:
+        file.close()
+
+
+def external_sort(
+    rows: Iterable[Row],
+    key: Callable[[Row], Any],
+    reverse: bool = False,
+    budget: int | None = None,
+    directory: str | None = None,
+) -> Iterator[Row]:
+    """
+    Stable sort. Runs of input that fill the budget are sorted
+    and spilled, then all of them are merged
+    """
+    if budget is None:
+        yield from sorted(rows, key=key, reverse=reverse)
+        return
+
+    runs: list[IO[bytes]] = []
+    buffer: list[Row] = []
+    used = 0
+    for row in rows:
+        buffer.append(row)
+        used += rowsize(row)
+        if used > budget:
+            buffer.sort(key=key, reverse=reverse)
+            runs.append(writerows(buffer, directory))
+            buffer = []
+            used = 0
+
+    buffer.sort(key=key, reverse=reverse)
+    if not runs:
+        yield from buffer
+        return
+
+    # earlier runs come first among equal keys, so the merge is stable too
+    inputs = [readrows(run) for run in runs] + [iter(buffer)]
+    yield from heapq.merge(*inputs, key=key, reverse=reverse)
+
+
+def topn(
+    rows: Iterable[Row],
+    n: int,
+    key: Callable[[Row], Any],
+    reverse: bool = False,
+    budget: int | None = None,
+    directory: str | None = None,
+) -> Iterator[Row]:
+    """
+    Same as sorted(rows, key=key, reverse=reverse)[:n] in O(n) memory,
+    or by external_sort() if the first n rows do not fit into the budget
+    """
+    it = iter(rows)
+    if budget is not None:
+        head: list[Row] = []
+        used = 0
+        for row in it:
+            head.append(row)
+            used += rowsize(row)
+            if len(head) == n or used > budget:
+                break
+        if used > budget:
+            ordered = external_sort(
+                itertools.chain(head, it), key, reverse, budget, directory
+            )
+            yield from itertools.islice(ordered, n)
+            return
+        it = itertools.chain(head, it)
+    if reverse:
+        yield from heapq.nlargest(n, it, key=key)
+    else:
+        yield from heapq.nsmallest(n, it, key=key)
+
+
+def external_distinct(
+    rows: Iterable[Row],
+    key: Callable[[Row], Hashable] | None = None,
+    budget: int | None = None,
+    directory: str | None = None,
+) -> Iterator[Row]:
+    """
+    First occurrences of rows by key, in order.
+    Rows are streamed while their keys fit into the budget. The rest are
+    numbered and sorted by external_sort() on the hash of their key, so
+    equal keys meet, then the first occurrences are sorted back by number
+    """
+    seen: set[Hashable] = set()
+    used = 0
+    it = iter(rows)
+    for row in it:
+        k = row if key is None else key(row)
+        if k in seen:
+            continue
+        seen.add(k)
+        yield row
+        if budget is not None:
+            used += rowsize(row)
+            if used > budget:
+                break
+    else:
+        return
+
+    def keyof(item: Row) -> Hashable:
+        return item[2:] if key is None else key(item[2:])
+
+    # items are the hash of the key, the row number and the row
+    numbered = (
+        (hash(k), number, *row)
+        for number, row in enumerate(it)
+        if (k := row if key is None else key(row)) not in seen
+    )
+    byhash = external_sort(
+        numbered, operator.itemgetter(0, 1), False, budget, directory
+    )
+    firsts = (
+        item
+        for _, items in itertools.groupby(byhash, operator.itemgetter(0))
+        # only keys with equal hashes are held at once
+        for item in unique(items, keyof)
+    )
+    bynumber = external_sort(firsts, operator.itemgetter(1), False, budget, directory)
+    for item in bynumber:
+        yield item[2:]
+
+
+def unique(items: Iterable[Row], key: Callable[[Row], Hashable]) -> Iterator[Row]:
+    "Items whose key was not seen before"
+    seen: set[Hashable] = set()
+    for item in items:
+        k = key(item)
+        if k not in seen:
+            seen.add(k)
+            yield item
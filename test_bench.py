@@ -0,0 +1,21 @@
+from pathlib import Path
+
+import bench
+
+
+def test_bench_smoke(tmp_path: Path) -> None:
+    results = bench.bench_size(200, memory=False)
+    workloads = {r.workload for r in results}
+    assert "bulk_insert" in workloads and "aggregate" in workloads
+    assert {r.runner for r in results} == {"engine", "sqlite3"}
+
+    path = str(tmp_path / "baseline.json")
+    bench.save(path, results)
+    assert bench.regressions(path, results, threshold=0.2) == []
+
+    slower = [
+        bench.Result(**{**r.__dict__, "p50": r.p50 * 10})
+        for r in results
+        if r.runner == "engine"
+    ]
+    assert len(bench.regressions(path, slower, threshold=0.2)) == len(slower)
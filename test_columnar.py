@@ -0,0 +1,82 @@
+import array
+from typing import Any
+
+import pytest
+
+from columnar import build
+from engine import Engine, EngineError
+
+
+def test_build() -> None:
+    ints = build("a", [1, 2, 3])
+    assert isinstance(ints.data, array.array) and ints.data.typecode == "q"
+    assert ints.memoryview().format == "q" and ints.valid is None
+
+    reals = build("a", [1, 2.5, None])
+    assert reals.data.typecode == "d"  # type: ignore[union-attr]
+    assert reals.valid == bytearray([1, 1, 0])
+    assert reals.tolist() == [1.0, 2.5, None]
+
+    for values in ([2**70, 1], ["x", None, 1], [None, None], []):
+        column = build("a", values)
+        assert column.tolist() == values
+    with pytest.raises(TypeError):
+        build("a", ["x"]).memoryview()
+
+
+def engine() -> Engine:
+    engine = Engine()
+    engine.execute("CREATE TABLE t (id INTEGER, x REAL, s TEXT)")
+    values = ", ".join(
+        f"({i}, {'NULL' if i % 7 == 0 else i / 2}, '{'abc'[i % 3]}')"
+        for i in range(100)
+    )
+    engine.execute(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    return engine
+
+
+def collect(engine: Engine, sql: str, batch_rows: int = 30) -> list[tuple[Any, ...]]:
+    return [row for batch in engine.columns(sql, batch_rows) for row in batch.rows()]
+
+
+def test_columns() -> None:
+    db = engine()
+    batches = list(db.columns("SELECT * FROM t", 30))
+    assert [len(b) for b in batches] == [30, 30, 30, 10]
+    s = batches[0].column("s")
+    # dictionary codes and values, the codes are a plain buffer
+    assert s.dictionary == ["a", "b", "c"]
+    assert s.memoryview().tolist()[:4] == [0, 1, 2, 0]
+    assert batches[0].column("x").valid is not None
+
+    db.execute("DELETE FROM t WHERE id BETWEEN 40 AND 49")
+    for sql in (
+        "SELECT * FROM t",
+        "SELECT s, id FROM t WHERE s = 'b' AND id > 20",
+        "SELECT id AS i, x FROM t WHERE x < 10 LIMIT 5 OFFSET 2",
+        "SELECT s, COUNT(*) FROM t GROUP BY s",
+        "SELECT id > 50 FROM t ORDER BY x DESC",
+        "SELECT * FROM t WHERE id > 1000",
+    ):
+        assert collect(db, sql) == db.execute(sql)
+
+    names = [
+        c.name for c in next(db.columns("SELECT id AS i, t.s, id > 2 FROM t")).columns
+    ]
+    assert names == ["i", "s", "column3"]
+    # an empty result is one empty batch, so the columns are still known
+    (empty,) = db.columns("SELECT id FROM t WHERE id < 0")
+    assert len(empty) == 0 and empty.column("id").tolist() == []
+
+    with pytest.raises(EngineError):
+        list(db.columns("DELETE FROM t"))
+
+
+def test_numpy() -> None:
+    np = pytest.importorskip("numpy")
+    db = engine()
+    (batch,) = db.columns("SELECT id, x FROM t")
+    ids = batch.column("id").numpy()
+    assert ids.dtype == np.int64 and ids.sum() == sum(range(100))
+    xs = batch.column("x").numpy()
+    assert xs.mask.sum() == 15
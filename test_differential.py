@@ -0,0 +1,14 @@
+import differential
+
+
+def test_differential_seeded() -> None:
+    outcomes = differential.run(seed=7, queries=300, rows=300)
+    mismatches = [o.query.sql for o in outcomes if not o.ok]
+    assert mismatches == []
+
+
+def test_same_ignores_order_of_ties() -> None:
+    expected = [(1, "a"), (1, "b"), (2, "c")]
+    assert differential.same(expected, [(1, "b"), (1, "a"), (2, "c")], 0)
+    assert not differential.same(expected, [(2, "c"), (1, "a"), (1, "b")], 0)
+    assert not differential.same(expected, [(1, "b"), (1, "a"), (2, "c")], None)
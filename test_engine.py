@@ -1,27 +1,36 @@
+import random
 import sqlite3
+import threading
+from collections import Counter
 from typing import Any
 
 import pytest
 
-from engine import Engine
+from cache import ResultCache
+from engine import (
+    Engine,
+    EngineError,
+    Interrupted,
+    MemoryLimitExceeded,
+    PartitionedTable,
+    QueryTimeout,
+    Table,
+    dotcommand,
+)
 
 
 class SqliteWrapper:
     """
-    I am not interested in implementing Transaction control
-    (manual commit after each insert)
-    So this wrapper commits on each executes, useful for testing,
-    but this is not proper use of `sqlite3`
+    sqlite3 in autocommit mode, every statement is committed
+    unless a transaction was opened with BEGIN or SAVEPOINT, as in Engine
     """
 
     def __init__(self) -> None:
-        self.con = sqlite3.connect(":memory:")
+        self.con = sqlite3.connect(":memory:", isolation_level=None)
         self.cur = self.con.cursor()
 
     def execute(self, text: str) -> Any:
-        res = self.cur.execute(text)
-        self.con.commit()
-        return res.fetchall()
+        return self.cur.execute(text).fetchall()
 
 
 class SameOutput:
@@ -32,6 +41,17 @@ class SameOutput:
     def same(self, cmd: str) -> None:
         assert self.sw.execute(cmd) == self.e.execute(cmd)
 
+    def same_unordered(self, cmd: str) -> None:
+        "For queries whose row order sqlite leaves up to the planner"
+        assert Counter(self.sw.execute(cmd)) == Counter(self.e.execute(cmd))
+
+
+def plaintable(e: Engine, tablename: str) -> Table:
+    "Storage of a table that is not partitioned"
+    table = e.gettable(tablename)
+    assert isinstance(table, Table)
+    return table
+
 
 def test1() -> None:
     sm = SameOutput()
@@ -92,6 +112,614 @@ def test_order() -> None:
     sm.same("SELECT x FROM nums ORDER BY x")
 
 
+def test_result_cache() -> None:
+    e = Engine(result_cache=ResultCache())
+    e.execute("CREATE TABLE nums(x INTEGER)")
+    e.execute("INSERT INTO nums VALUES (1), (2), (3)")
+    assert e.execute("SELECT x FROM nums WHERE x > 1") == [(2,), (3,)]
+    assert e.execute("select x   from nums where x > 1") == [(2,), (3,)]
+    assert e.result_cache is not None
+    stats = e.result_cache.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+    e.execute("INSERT INTO nums VALUES (4)")
+    assert e.execute("SELECT x FROM nums WHERE x > 1") == [(2,), (3,), (4,)]
+    stats = e.result_cache.stats()
+    assert (stats.hits, stats.misses, stats.invalidations) == (1, 2, 1)
+    e.execute("SELECT x FROM nums WHERE x > 1")
+    assert e.result_cache.stats().hit_rate == 0.5
+
+
+def test_result_cache_eviction() -> None:
+    cache = ResultCache(max_entries=2)
+    e = Engine(result_cache=cache)
+    e.execute("CREATE TABLE nums(x INTEGER)")
+    e.execute("INSERT INTO nums VALUES (1), (2), (3)")
+    e.execute("SELECT x FROM nums WHERE x = 1")
+    e.execute("SELECT x FROM nums WHERE x = 2")
+    e.execute("SELECT x FROM nums WHERE x = 1")
+    e.execute("SELECT x FROM nums WHERE x = 3")
+    stats = cache.stats()
+    assert (stats.entries, stats.evictions) == (2, 1)
+    e.execute("SELECT x FROM nums WHERE x = 2")
+    assert cache.stats().hits == 1
+
+    small = ResultCache(max_bytes=1)
+    e = Engine(result_cache=small)
+    e.execute("CREATE TABLE nums(x INTEGER)")
+    e.execute("SELECT x FROM nums")
+    assert small.stats().entries == 0
+
+
+def test_result_cache_recreated_table() -> None:
+    e = Engine(result_cache=ResultCache())
+    e.execute("CREATE TABLE nums(x INTEGER)")
+    e.execute("INSERT INTO nums VALUES (1)")
+    assert e.execute("SELECT x FROM nums") == [(1,)]
+    e.execute("CREATE TABLE nums(x INTEGER)")
+    assert e.execute("SELECT x FROM nums") == []
+
+
+def test_aggregates() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t(g TEXT, x INTEGER)")
+    sm.same("SELECT COUNT(*), SUM(x), AVG(x), MIN(x), MAX(x) FROM t")
+    sm.same("SELECT g, COUNT(*) FROM t GROUP BY g")
+    sm.same("INSERT INTO t VALUES ('b', 3), ('a', 1), ('b', NULL), (NULL, 7), ('a', 1)")
+    sm.same("SELECT COUNT(*) FROM t")
+    sm.same("SELECT COUNT(x), COUNT(DISTINCT x), SUM(x), AVG(x) FROM t")
+    sm.same("SELECT g, MAX(x) FROM t")
+    sm.same("SELECT g, MIN(x) FROM t WHERE x > 1")
+    sm.same("SELECT g, COUNT(*) AS n, SUM(x) FROM t GROUP BY g")
+    sm.same("SELECT g, COUNT(*) AS n FROM t GROUP BY g HAVING n > 1")
+    sm.same("SELECT g FROM t GROUP BY g HAVING MAX(x) >= 3")
+    sm.same("SELECT x, COUNT(*) FROM t GROUP BY x")
+
+
+def test_streaming_aggregate() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t(g INTEGER, x INTEGER)")
+    sm.same("INSERT INTO t VALUES (1, 5), (1, 6), (2, 1), (3, 2), (3, 2)")
+    assert plaintable(sm.e, "t").ordered == [True, False, True]
+    sm.same("SELECT g, SUM(x), COUNT(*) FROM t GROUP BY g")
+    sm.same("SELECT g, SUM(x) FROM t WHERE x < 6 GROUP BY g HAVING SUM(x) > 1")
+
+
+def test_joins() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE a(id INTEGER, x INTEGER)")
+    sm.same("CREATE TABLE b(aid INTEGER, y TEXT)")
+    sm.same("INSERT INTO a VALUES (1, 10), (2, 20), (3, 30), (NULL, 40)")
+    sm.same("INSERT INTO b VALUES (1, 'p'), (1, 'q'), (3, 'r'), (5, 's'), (NULL, 't')")
+    sm.same_unordered("SELECT * FROM a JOIN b ON a.id = b.aid")
+    sm.same_unordered("SELECT x, y FROM b INNER JOIN a ON id = aid")
+    sm.same_unordered("SELECT x, y FROM a JOIN b ON aid = id AND y != 'q'")
+    sm.same_unordered("SELECT * FROM a LEFT JOIN b ON a.id = b.aid")
+    sm.same_unordered("SELECT * FROM b LEFT OUTER JOIN a ON a.id = b.aid")
+    sm.same_unordered("SELECT x, y FROM a LEFT JOIN b ON id = aid WHERE y IS NULL")
+    sm.same_unordered("SELECT x, y FROM a JOIN b ON id < aid")
+    sm.same_unordered("SELECT x, y FROM a, b WHERE id = aid")
+    sm.same_unordered("SELECT y, COUNT(*) FROM a JOIN b ON id = aid GROUP BY y")
+
+
+def test_join_build_side() -> None:
+    e = Engine()
+    e.execute("CREATE TABLE small(k INTEGER, v TEXT)")
+    e.execute("CREATE TABLE big(k INTEGER)")
+    e.execute("INSERT INTO small VALUES (2, 'two'), (1, 'one')")
+    e.execute("INSERT INTO big VALUES (1), (2), (3), (1)")
+    # left input is kept in order whichever side the hash table is built on
+    assert e.execute("SELECT big.k, v FROM big JOIN small ON big.k = small.k") == [
+        (1, "one"),
+        (2, "two"),
+        (1, "one"),
+    ]
+    assert e.execute("SELECT v FROM small LEFT JOIN big ON big.k = small.k") == [
+        ("two",),
+        ("one",),
+        ("one",),
+    ]
+    with pytest.raises(EngineError):
+        e.execute("SELECT k FROM small JOIN big ON small.k = big.k")
+
+
+def test_join_operators() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE a(id INTEGER, x INTEGER)")
+    sm.same("CREATE TABLE b(aid INTEGER, y INTEGER)")
+    sm.same("INSERT INTO a VALUES (1, 10), (2, 20), (2, 21), (4, 40)")
+    sm.same("INSERT INTO b VALUES (4, 5), (1, 6), (2, 7), (2, 8), (3, 9)")
+
+    used: list[str] = []
+    for name in ("mergejoin", "indexjoin", "hashjoin"):
+        method = getattr(sm.e, name)
+
+        def spy(*args: Any, name: str = name, method: Any = method) -> Any:
+            used.append(name)
+            return method(*args)
+
+        setattr(sm.e, name, spy)
+
+    sm.same_unordered("SELECT * FROM a JOIN b ON id = aid")
+    assert used == ["hashjoin"]
+
+    sm.same("CREATE INDEX b_aid ON b (aid)")
+    sm.same_unordered("SELECT * FROM a JOIN b ON id = aid")
+    sm.same_unordered("SELECT * FROM a LEFT JOIN b ON id = aid AND y > 6")
+    assert used[1:] == ["mergejoin", "mergejoin"]
+
+    sm.same_unordered("SELECT * FROM b JOIN a ON id = aid")
+    sm.same_unordered("SELECT x, y FROM a, b WHERE id = aid AND x > 10")
+    assert used[3:] == ["mergejoin", "indexjoin"]
+
+
+def test_join_order() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE fact(d1 INTEGER, d2 INTEGER, amount INTEGER)")
+    sm.same("CREATE TABLE dim1(id INTEGER, name TEXT)")
+    sm.same("CREATE TABLE dim2(id INTEGER, name TEXT)")
+    sm.same(
+        "INSERT INTO fact VALUES "  # noqa: S608
+        + ", ".join(f"({i % 3}, {i % 4}, {i})" for i in range(30))
+    )
+    sm.same("INSERT INTO dim1 VALUES (0, 'a'), (1, 'b'), (2, 'c')")
+    sm.same("INSERT INTO dim2 VALUES (0, 'w'), (1, 'x'), (2, 'y'), (3, 'z')")
+    sm.same("CREATE INDEX fact_d2 ON fact (d2)")
+    sm.same_unordered(
+        "SELECT * FROM fact JOIN dim1 ON fact.d1 = dim1.id "
+        "JOIN dim2 ON fact.d2 = dim2.id WHERE dim1.name = 'b'"
+    )
+    sm.same_unordered(
+        "SELECT dim2.name, amount FROM dim1, fact, dim2 "
+        "WHERE d1 = dim1.id AND d2 = dim2.id AND amount > 20"
+    )
+    sm.same_unordered(
+        "SELECT dim1.name, SUM(amount) FROM fact JOIN dim1 ON d1 = dim1.id "
+        "JOIN dim2 ON dim2.id = d2 GROUP BY dim1.name"
+    )
+
+
+def test_index_grouping() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t(g INTEGER, x INTEGER)")
+    sm.same("INSERT INTO t VALUES (3, 1), (1, 2), (2, 3), (1, 4), (NULL, 5)")
+    sm.same("CREATE INDEX t_g ON t (g)")
+    table = plaintable(sm.e, "t")
+    assert table.ordered[0] is False
+    rows = table.orderedrows("g")
+    assert rows is not None
+    assert [r[1].val for r in rows] == [5, 2, 4, 3, 1]
+    sm.same("SELECT g, SUM(x) FROM t GROUP BY g")
+    sm.same("SELECT g, COUNT(*) FROM t WHERE x > 1 GROUP BY g")
+
+
+def test_explain_analyze() -> None:
+    e = Engine(result_cache=ResultCache())
+    e.execute("CREATE TABLE t (a INTEGER, b INTEGER)")
+    e.execute("INSERT INTO t VALUES (1, 1), (2, 2), (2, 3), (3, 4), (4, 5)")
+    query = "SELECT DISTINCT a FROM t WHERE b > 1 ORDER BY a DESC LIMIT 2"
+
+    stages = e.execute(f"EXPLAIN ANALYZE {query}")  # noqa: S608
+    assert [s[:3] for s in stages] == [
+        ("scan", 5, 5),
+        ("filter", 5, 4),
+        ("project", 4, 4),
+        ("distinct", 4, 3),
+        # ORDER BY with LIMIT keeps only the first rows
+        ("sort", 3, 2),
+        ("limit", 2, 2),
+    ]
+    assert all(s[3] >= 0 for s in stages)
+    assert e.result_cache is not None
+    assert e.result_cache.stats().entries == 0
+
+    stages = e.execute("EXPLAIN ANALYZE SELECT a, COUNT(*) FROM t GROUP BY a")
+    assert [s[:3] for s in stages] == [("scan", 5, 5), ("aggregate", 5, 4)]
+    stages = e.execute("EXPLAIN ANALYZE SELECT COUNT(*) FROM t")
+    assert [s[:3] for s in stages] == [("count", 5, 1)]
+
+    e.execute("CREATE INDEX t_b ON t (b)")
+    e.execute("INSERT INTO t VALUES (5, 0)")
+    stages = e.execute("EXPLAIN ANALYZE SELECT b, COUNT(*) FROM t GROUP BY b")
+    assert [s[:3] for s in stages] == [("index scan", 6, 6), ("aggregate", 6, 6)]
+
+
+def test_like_index_range() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, s)")
+    sm.same(
+        "INSERT INTO t VALUES (1, 'abc'), (2, 'ABD'), (3, 'xab'), (4, NULL), "
+        "(5, 'Ab'), (6, 12), (7, 'ac'), (8, 'ab%')"
+    )
+    sm.same("CREATE INDEX t_s ON t (s)")
+    for pattern in ("ab%", "aB_", "1%", "ab", "%b%", "ab\\%"):
+        sm.same(f"SELECT id FROM t WHERE s LIKE '{pattern}'")  # noqa: S608
+    sm.same("SELECT id FROM t WHERE s NOT LIKE 'ab%'")
+
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT id FROM t WHERE s LIKE 'ab%'")
+    # numbers are always read, LIKE matches their text
+    assert stages[0][:3] == ("index range scan", 5, 5)
+    assert stages[1][:3] == ("filter", 5, 4)
+
+    # long prefixes read the ranges of their first letters
+    sm.same("INSERT INTO t VALUES (9, 'abcdefgh'), (10, 'ABCDEFx'), (11, 'abcdeg')")
+    sm.same("SELECT id FROM t WHERE s LIKE 'abcdefg%'")
+    query = "EXPLAIN ANALYZE SELECT id FROM t WHERE s LIKE 'abcdefg%'"
+    stages = sm.e.execute(query)
+    assert stages[0][:3] == ("index range scan", 3, 3)
+    assert stages[1][:3] == ("filter", 3, 1)
+
+
+def test_dictionary_encoding() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, cat TEXT, n)")
+    sm.same(
+        "INSERT INTO t VALUES (1, 'a', 1), (2, 'b', 2), (3, 'a', 3), (4, NULL, 4), "
+        "(5, 'Ab', 5), (6, 'b', 6), (7, 'a', 7)"
+    )
+    table = plaintable(sm.e, "t")
+    assert list(table.dictionaries) == [1]
+    assert table.data[0][1] is table.data[2][1]
+    assert list(table.dictionaries[1].codes) == [0, 1, 0, 2, 3, 1, 0]
+
+    sm.same("SELECT id FROM t WHERE cat = 'a'")
+    sm.same("SELECT id FROM t WHERE cat IN ('b', 'ab') AND n > 1")
+    sm.same("SELECT id FROM t WHERE cat LIKE 'a%' AND cat != 'a'")
+    sm.same("SELECT id FROM t WHERE cat IS NULL OR cat = 'b'")
+    sm.same("SELECT id FROM t WHERE NOT cat = 'a' AND n < 6")
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT id FROM t WHERE cat = 'a' AND n > 1")
+    assert [s[:3] for s in stages[:2]] == [("dictionary scan", 3, 3), ("filter", 3, 2)]
+
+
+def test_zone_maps() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, v INTEGER, s TEXT)")
+    values = ", ".join(
+        f"({i}, {'NULL' if i % 5 == 0 else i % 7}, 's{i // 1000}')" for i in range(5000)
+    )
+    sm.same(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    table = plaintable(sm.e, "t")
+    assert [b.rows for b in table.blocks] == [1024, 1024, 1024, 1024, 904]
+    assert table.blocks[1].mins[0] == (1, 1024)
+    assert table.blocks[1].maxs[0] == (1, 2047)
+    assert table.blocks[1].nulls[1] == 205
+
+    sm.same("SELECT v FROM t WHERE id BETWEEN 2000 AND 2100")
+    sm.same("SELECT id FROM t WHERE 4990 < id AND v IS NOT NULL")
+    sm.same("SELECT id FROM t WHERE id IN (5, 4000, 7000) OR v = 100")
+    sm.same("SELECT id FROM t WHERE id IN (5, 4000, 7000)")
+    sm.same("SELECT COUNT(*) FROM t WHERE s = 's2' AND id <= 2050")
+    sm.same("SELECT id FROM t WHERE id >= 4999 OR id < 1")
+
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT v FROM t WHERE id > 3100")
+    assert stages[0][:3] == ("zone map scan", 1928, 1928)
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT v FROM t WHERE v = 3")
+    assert stages[0][0] == "scan"
+
+
+def test_progress_handler() -> None:
+    e = Engine()
+    e.execute("CREATE TABLE t (a INTEGER)")
+    values = ", ".join(f"({i})" for i in range(2500))
+    e.execute(f"INSERT INTO t VALUES {values}")  # noqa: S608
+
+    calls = []
+    e.set_progress_handler(lambda: calls.append(1), 500)
+    assert len(e.execute("SELECT a FROM t WHERE a > 10")) == 2489
+    assert len(calls) == 5
+
+    e.set_progress_handler(lambda: True, 100)
+    with pytest.raises(Interrupted):
+        e.execute("SELECT a FROM t")
+    e.set_progress_handler(None)
+    assert len(e.execute("SELECT a FROM t")) == 2500
+
+
+def test_timeout_and_interrupt() -> None:
+    e = Engine(timeout=0.05)
+    e.execute("CREATE TABLE t (a INTEGER)")
+    values = ", ".join(f"({i})" for i in range(2000))
+    e.execute(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    e.execute("CREATE TABLE u (a INTEGER)")
+    e.execute(f"INSERT INTO u VALUES {values}")  # noqa: S608
+    # nested loop join over 4M row pairs
+    slow = "SELECT t.a FROM t JOIN u ON t.a < u.a AND t.a < 0"
+
+    with pytest.raises(QueryTimeout):
+        e.execute(slow)
+    assert e.execute("SELECT a FROM t WHERE a = 5") == [(5,)]
+
+    timer = threading.Timer(0.05, e.interrupt)
+    timer.start()
+    with pytest.raises(Interrupted) as excinfo:
+        e.execute(slow, timeout=60)
+    assert excinfo.type is Interrupted
+    timer.join()
+
+
+def test_memory_budget_spills(tmp_path: Any) -> None:
+    e = Engine(memory_budget=2000, spill_dir=str(tmp_path))
+    con = sqlite3.connect(":memory:")
+    values = ", ".join(f"({i}, {i * 7 % 50}, 'w{i % 30}')" for i in range(3000))
+    for stmt in [
+        "CREATE TABLE t (id INTEGER, a INTEGER, s TEXT)",
+        f"INSERT INTO t VALUES {values}",  # noqa: S608
+    ]:
+        e.execute(stmt)
+        con.execute(stmt)
+
+    for sql in [
+        "SELECT id, a FROM t ORDER BY id DESC",
+        "SELECT DISTINCT a, s FROM t",
+        "SELECT DISTINCT s FROM t ORDER BY s",
+        "SELECT id FROM t ORDER BY id LIMIT 5 OFFSET 10",
+    ]:
+        assert e.execute(sql) == con.execute(sql).fetchall()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_memory_usage() -> None:
+    e = Engine(result_cache=ResultCache())
+    e.execute("CREATE TABLE t (a INTEGER, s TEXT, b TEXT)")
+    e.execute("CREATE INDEX ia ON t (a)")
+    empty = e.memory_usage()["tables"]["t"]
+    assert empty["total"] == 0 and empty["indexes"] == {"ia": 0}
+
+    values = ", ".join(f"({i}, 'same', 'text {i}')" for i in range(1000))
+    e.execute(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    e.execute("SELECT a FROM t")
+    usage = e.memory_usage()
+    table = usage["tables"]["t"]
+    assert table["indexes"]["ia"] > 0
+    # one shared value against a thousand distinct ones
+    assert table["columns"]["s"] < table["columns"]["b"] / 10
+    assert usage["cache"] > 0
+    assert usage["total"] == table["total"] + usage["cache"]
+
+    rows = e.execute("PRAGMA memory_usage")
+    assert ("t", "column", "a", table["columns"]["a"]) in rows
+    assert ("t", "index", "ia", table["indexes"]["ia"]) in rows
+    assert rows[-1] == (None, "total", None, usage["total"])
+    with pytest.raises(EngineError, match="unknown pragma"):
+        e.execute("PRAGMA nothing")
+
+
+def test_memory_limit() -> None:
+    e = Engine(memory_limit=100_000)
+    e.execute("CREATE TABLE t (a INTEGER)")
+    e.execute("INSERT INTO t VALUES (1), (2)")
+    values = ", ".join(f"({i})" for i in range(2000))
+    with pytest.raises(MemoryLimitExceeded, match="memory limit"):
+        e.execute(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    # nothing of the rejected statement was inserted
+    assert e.execute("SELECT a FROM t") == [(1,), (2,)]
+    assert e.memory_usage()["total"] <= 100_000
+
+
+def test_delete_update_compaction() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, a INTEGER, s TEXT)")
+    sm.same("CREATE INDEX ia ON t (a)")
+    rng = random.Random(3)
+    nextid = 0
+    for _ in range(20):
+        values = ", ".join(
+            f"({nextid + i}, {rng.randrange(20)}, 'w{rng.randrange(5)}')"
+            for i in range(300)
+        )
+        nextid += 300
+        sm.same(f"INSERT INTO t VALUES {values}")  # noqa: S608
+        lo = rng.randrange(nextid)
+        sm.same(f"DELETE FROM t WHERE id BETWEEN {lo} AND {lo + 100}")  # noqa: S608
+        a = rng.randrange(20)
+        sm.same(f"DELETE FROM t WHERE a = {a} AND s = 'w1'")  # noqa: S608
+        sm.same(f"UPDATE t SET a = {a}, s = 'u{a}' WHERE id < {lo // 4}")  # noqa: S608
+        sm.same(f"SELECT * FROM t WHERE a = {a}")  # noqa: S608
+        sm.same("SELECT s, COUNT(*) FROM t GROUP BY s")
+        sm.same("SELECT COUNT(*) FROM t")
+        sm.same(f"SELECT id FROM t WHERE id > {lo} AND s LIKE 'u%'")  # noqa: S608
+
+    table = plaintable(sm.e, "t")
+    # compaction ran in steps between the statements
+    assert table.tombstones < len(table.data)
+    sm.same("DELETE FROM t WHERE a < 10")
+    assert sm.e.compact() and table.shadow is None
+    assert table.tombstones == 0 and len(table.data) == table.count()
+    assert sum(map(len, table.indexes[0].buckets.values())) == table.count()
+    sm.same("SELECT * FROM t")
+    sm.same("SELECT a, COUNT(*) FROM t GROUP BY a")
+
+
+def test_transactions() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, a INTEGER, s TEXT)")
+    sm.same("CREATE INDEX ia ON t (a)")
+    values = ", ".join(f"({i}, {i % 7}, 'w{i % 3}')" for i in range(2100))
+    sm.same(f"INSERT INTO t VALUES {values}")  # noqa: S608
+    table = plaintable(sm.e, "t")
+
+    sm.same("BEGIN")
+    sm.same("UPDATE t SET a = 100 WHERE id BETWEEN 10 AND 20")
+    # only the first block of rows was copied
+    assert list(table.snapshots[0].chunks) == [0]
+    sm.same("SAVEPOINT one")
+    sm.same("DELETE FROM t WHERE id > 1500")
+    sm.same("INSERT INTO t VALUES (5000, 100, 'new')")
+    sm.same("CREATE TABLE u (x INTEGER)")
+    sm.same("SELECT COUNT(*) FROM t WHERE a = 100")
+    sm.same("ROLLBACK TO one")
+    sm.same("SELECT COUNT(*) FROM t WHERE a = 100")
+    assert not sm.e.hastable("u")
+    sm.same("RELEASE one")
+    sm.same("COMMIT")
+    sm.same("SELECT id FROM t WHERE a = 100")
+
+    with pytest.raises(EngineError, match="no transaction"):
+        sm.e.execute("COMMIT")
+    with pytest.raises(EngineError, match="no such savepoint"):
+        sm.e.execute("ROLLBACK TO nothing")
+
+    rng = random.Random(5)
+    statements = [
+        "UPDATE t SET a = {a}, s = 's{a}' WHERE id BETWEEN {lo} AND {hi}",
+        "DELETE FROM t WHERE id BETWEEN {lo} AND {hi}",
+        "DELETE FROM t WHERE a = {a} AND s LIKE 'w%'",
+        "INSERT INTO t VALUES ({hi}, {a}, 'i{a}')",
+    ]
+    for _ in range(3):
+        sm.same("BEGIN")
+        depth = 0
+        for _ in range(20):
+            lo = rng.randrange(2100)
+            params = {"a": rng.randrange(7), "lo": lo, "hi": lo + rng.randrange(300)}
+            sm.same(rng.choice(statements).format(**params))
+            choice = rng.random()
+            if choice < 0.2:
+                depth += 1
+                sm.same(f"SAVEPOINT sp{depth}")
+            elif choice < 0.35 and depth:
+                # savepoints inside the one rolled back to are closed
+                depth = rng.randrange(1, depth + 1)
+                sm.same(f"ROLLBACK TO sp{depth}")
+            elif choice < 0.4 and depth:
+                sm.same(f"RELEASE sp{depth}")
+                depth -= 1
+            sm.same(f"SELECT id, s FROM t WHERE a = {params['a']}")  # noqa: S608
+        sm.same(rng.choice(["COMMIT", "ROLLBACK"]))
+        sm.same("SELECT * FROM t")
+        sm.same("SELECT a, COUNT(*) FROM t GROUP BY a")
+        sm.same("SELECT COUNT(*) FROM t WHERE id BETWEEN 1000 AND 1100")
+    assert sum(map(len, table.indexes[0].buckets.values())) == table.count()
+
+
+def test_fork() -> None:
+    base = SameOutput()
+    base.same("CREATE TABLE t (id INTEGER, a INTEGER, s TEXT)")
+    base.same("CREATE INDEX ia ON t (a)")
+    base.same("CREATE TABLE u (x INTEGER)")
+    values = ", ".join(f"({i}, {i % 7}, 'w{i % 3}')" for i in range(2100))
+    base.same(f"INSERT INTO t VALUES {values}")  # noqa: S608
+
+    snapshot = base.e.snapshot()
+    with pytest.raises(EngineError, match="readonly"):
+        snapshot.execute("INSERT INTO u VALUES (1)")
+    fork = SameOutput()
+    base.sw.con.backup(fork.sw.con)
+    fork.e = snapshot.fork()
+    table, forked = plaintable(base.e, "t"), plaintable(fork.e, "t")
+    assert forked.data is table.data and forked.indexes[0] is table.indexes[0]
+    fork.same("UPDATE t SET a = 9 WHERE id = 5")
+    # only the updated row is copied
+    assert forked.data is not table.data and forked.data[5] is not table.data[5]
+    assert forked.data[6] is table.data[6]
+    assert table.index_on("a").lookup(9) == []  # type: ignore[union-attr]
+
+    statements = [
+        "UPDATE t SET a = {a}, s = 's{a}' WHERE id BETWEEN {lo} AND {hi}",
+        "DELETE FROM t WHERE id BETWEEN {lo} AND {hi}",
+        "INSERT INTO t VALUES ({hi}, {a}, 'i{a}')",
+    ]
+    rng = random.Random(11)
+    for _ in range(15):
+        for sm in (base, fork):
+            lo = rng.randrange(2100)
+            params = {"a": rng.randrange(7), "lo": lo, "hi": lo + rng.randrange(300)}
+            sm.same(rng.choice(statements).format(**params))
+            sm.same(f"SELECT id, s FROM t WHERE a = {params['a']}")  # noqa: S608
+    for sm in (base, fork):
+        sm.same("SELECT * FROM t")
+        sm.same("SELECT a, COUNT(*) FROM t GROUP BY a")
+    # the table nobody wrote to is still shared
+    assert plaintable(fork.e, "u").data is plaintable(base.e, "u").data
+    assert snapshot.execute("SELECT COUNT(*) FROM t") == [(2100,)]
+
+
+def test_partitions() -> None:
+    sm = SameOutput()
+    sm.sw.execute("CREATE TABLE t (ts INTEGER, k INTEGER, s TEXT)")
+    sm.e.execute(
+        "CREATE TABLE t (ts INTEGER, k INTEGER, s TEXT) PARTITION BY RANGE (ts) ("
+        "PARTITION p0 VALUES LESS THAN (1000), PARTITION p1 VALUES LESS THAN (2000), "
+        "PARTITION p2 VALUES LESS THAN (3000), PARTITION p3 VALUES LESS THAN MAXVALUE)"
+    )
+    sm.sw.execute("CREATE TABLE h (ts INTEGER, k INTEGER, s TEXT)")
+    sm.e.execute(
+        "CREATE TABLE h (ts INTEGER, k INTEGER, s TEXT) PARTITION BY HASH (k) PARTITIONS 4"
+    )
+    values = ", ".join(
+        f"({i}, {'NULL' if i % 11 == 0 else i % 9}, 's{i % 5}')" for i in range(4000)
+    )
+    for name in ("t", "h"):
+        sm.same(f"INSERT INTO {name} VALUES {values}")  # noqa: S608
+    sm.same("CREATE INDEX hs ON h (s)")
+    table, hashed = sm.e.gettable("t"), sm.e.gettable("h")
+    assert isinstance(table, PartitionedTable)
+    assert isinstance(hashed, PartitionedTable)
+    assert [part.count() for part in table.partitions] == [1000] * 4
+
+    for where in (
+        "ts = 1500",
+        "ts BETWEEN 990 AND 1010 AND k = 3",
+        "ts < 1000",
+        "ts <= 1000",
+        "2999 < ts",
+        "ts IN (5, 3500)",
+        "ts > 5000",
+        "ts >= 100 OR k = 1",
+    ):
+        sm.same(f"SELECT * FROM t WHERE {where}")  # noqa: S608
+    for where in ("k = 3", "k IN (1, 2)", "k IS NULL", "k = 3 AND s LIKE 's1%'"):
+        sm.same_unordered(f"SELECT * FROM h WHERE {where}")  # noqa: S608
+    sm.same("SELECT k, COUNT(*), MAX(ts) FROM h GROUP BY k")
+    sm.same("SELECT COUNT(*) FROM t")
+    sm.same("SELECT t.ts, h.k FROM t JOIN h ON t.ts = h.ts WHERE t.ts < 20")
+
+    # only the partitions that may hold matching rows are read
+    metrics = sm.e.metrics
+    before = metrics.rows_scanned
+    sm.same("SELECT k FROM t WHERE ts BETWEEN 1100 AND 1200")
+    assert metrics.rows_scanned - before == 1000
+    before = metrics.rows_scanned
+    sm.same_unordered("SELECT ts FROM h WHERE k IN (1, 2)")
+    found = {hashed.locate(1), hashed.locate(2)}
+    assert metrics.rows_scanned - before == sum(
+        hashed.partitions[i].count() for i in found if i is not None
+    )
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT k FROM t WHERE ts = 5")
+    assert stages[0][:3] == ("partition scan", 1, 1)
+
+    # updates of the partition column move rows between partitions
+    sm.same("UPDATE t SET ts = 3333 WHERE ts BETWEEN 500 AND 510")
+    sm.same("UPDATE h SET k = 8, s = 'moved' WHERE k = 2 AND ts < 100")
+    sm.same("DELETE FROM t WHERE ts >= 2000 AND k = 4")
+    sm.same("DELETE FROM h WHERE k IS NULL")
+    sm.same_unordered("SELECT * FROM t")
+    sm.same_unordered("SELECT * FROM h")
+    assert table.partitions[0].count() == 989
+
+    sm.same("BEGIN")
+    sm.same("UPDATE t SET ts = 10 WHERE ts > 3900")
+    sm.same("ROLLBACK")
+    sm.same("SELECT COUNT(*) FROM t WHERE ts > 3900")
+    sm.e.execute(
+        "CREATE TABLE r (a INTEGER) PARTITION BY RANGE (a) "
+        "(PARTITION low VALUES LESS THAN (10))"
+    )
+    with pytest.raises(EngineError, match="no partition"):
+        sm.e.execute("INSERT INTO r VALUES (10)")
+    usage = sm.e.execute("PRAGMA memory_usage")
+    assert [row[2] for row in usage if row[:2] == ("h", "partition")] == [
+        "p0",
+        "p1",
+        "p2",
+        "p3",
+    ]
+    # the words of PARTITION BY still name columns elsewhere
+    sm.same("CREATE TABLE u (range INTEGER, hash TEXT, partitions)")
+    sm.same("INSERT INTO u VALUES (1, 'a', 2)")
+    sm.same("SELECT hash, partitions FROM u WHERE range = 1")
+
+
 # sqlbolt.com like tests
 CREATE_MOVIES = """
     CREATE TABLE Movies (id INT, title TEXT, director TEXT, year INT, length_minutes INT);
@@ -193,6 +821,223 @@ INSERT_EMPLOYEES = """
 """
 
 
+def test_subqueries() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER, k INTEGER, s TEXT)")
+    sm.same("CREATE TABLE u (k INTEGER, name TEXT)")
+    sm.same("CREATE TABLE v (id INTEGER)")
+    sm.same(
+        "INSERT INTO t VALUES "  # noqa: S608
+        + ", ".join(
+            f"({i}, {'NULL' if i % 7 == 0 else i % 5}, 's{i % 3}')" for i in range(60)
+        )
+    )
+    sm.same("INSERT INTO u VALUES (1, 'a'), (3, 'b'), (3, 'c'), (NULL, 'd')")
+    for sql in (
+        "SELECT id FROM t WHERE k IN (SELECT k FROM u WHERE name < 'd')",
+        "SELECT id FROM t WHERE k NOT IN (SELECT k FROM u WHERE name < 'd')",
+        # a NULL in the subquery makes NOT IN unknown for every other value
+        "SELECT id FROM t WHERE k NOT IN (SELECT k FROM u)",
+        "SELECT id FROM t WHERE k IN (SELECT k FROM u WHERE k > 100)",
+        "SELECT id FROM t WHERE k NOT IN (SELECT k FROM u WHERE k > 100)",
+        "SELECT id, k IN (SELECT k FROM u) FROM t",
+        "SELECT s, COUNT(*) FROM t WHERE s IN (SELECT s FROM t WHERE id < 2) GROUP BY s",
+        "SELECT id FROM t WHERE EXISTS (SELECT * FROM u WHERE u.k = t.k)",
+        "SELECT id FROM t WHERE NOT EXISTS (SELECT * FROM u WHERE u.k = t.k)",
+        "SELECT id FROM t WHERE EXISTS (SELECT * FROM v)",
+        "SELECT name FROM u WHERE EXISTS (SELECT * FROM t WHERE t.k = u.k AND id > 50)",
+        # correlated through a nested subquery
+        (
+            "SELECT name FROM u WHERE k IN (SELECT k FROM t WHERE id IN "
+            "(SELECT id FROM t WHERE s = name))"
+        ),
+    ):
+        sm.same(sql)
+    sm.same_unordered(
+        "SELECT t.id, u.name FROM t JOIN u ON t.k = u.k "
+        "WHERE EXISTS (SELECT * FROM u WHERE u.name = 'c' AND u.k = t.k)"
+    )
+
+    # uncorrelated subqueries run once, correlated ones once per outer value
+    runs: list[Any] = []
+    runselect = sm.e.runselect
+
+    def spy(stmt: Any, *args: Any) -> Any:
+        runs.append(stmt.tablename)
+        return runselect(stmt, *args)
+
+    sm.e.runselect = spy  # type: ignore[method-assign, assignment]
+    sm.same("SELECT id FROM t WHERE k IN (SELECT k FROM u)")
+    assert runs == ["t", "u"]
+    sm.same("SELECT id FROM t WHERE EXISTS (SELECT * FROM u WHERE u.k = t.k)")
+    assert runs[2:] == ["t"] + ["u"] * 6
+    sm.e.runselect = runselect  # type: ignore[method-assign]
+
+    sm.same("DELETE FROM t WHERE k IN (SELECT k FROM u)")
+    sm.same("UPDATE t SET s = 'x' WHERE NOT EXISTS (SELECT * FROM u WHERE u.k = t.k)")
+    sm.same("SELECT * FROM t")
+
+    sm.e.result_cache = ResultCache()
+    query = "SELECT id FROM t WHERE id IN (SELECT id FROM v)"
+    sm.same(query)
+    sm.same("INSERT INTO v VALUES (2), (4)")
+    sm.same(query)
+
+    with pytest.raises(EngineError, match="2 columns"):
+        sm.e.execute("SELECT id FROM t WHERE k IN (SELECT k, name FROM u)")
+    with pytest.raises(EngineError, match="no such table"):
+        sm.e.execute("SELECT id FROM t WHERE EXISTS (SELECT * FROM nope)")
+
+
+def test_primary_key() -> None:
+    sm = SameOutput()
+    sm.same("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER, s TEXT)")
+    sm.same(
+        "INSERT INTO t VALUES "  # noqa: S608
+        + ", ".join(f"({i * 2}, {i % 7}, 's{i % 3}')" for i in range(3000))
+    )
+    # NULL keys get the largest key plus one, keys are converted to integers
+    sm.same("INSERT INTO t VALUES (NULL, 1, 'a'), ('7', 2, 'b'), (NULL, 3, 'c')")
+    sm.same("INSERT INTO t VALUES (9.0, 4, 'd')")
+    # keys out of order are merged into place, rows stay sorted by key
+    table = plaintable(sm.e, "t")
+    assert table.ordered[0]
+    assert table.indexes == []
+    sm.same("SELECT * FROM t WHERE id > 5990")
+    sm.same("SELECT * FROM t WHERE id IN (9, 7, 9, 100, 1) AND v > 0")
+    sm.same("SELECT id, v FROM t WHERE id BETWEEN 4 AND 11")
+    sm.same("SELECT s FROM t WHERE 3000 <= id AND id < 3010 AND id != 3004")
+    sm.same("SELECT COUNT(*) FROM t WHERE id = 6001 OR id = 6002")
+
+    for sql in (
+        "INSERT INTO t VALUES (1, 0, 'x'), (2, 0, 'x')",
+        "INSERT INTO t VALUES (3, 0, 'x'), (3, 0, 'x')",
+        "INSERT INTO t VALUES ('a', 0, 'x')",
+        "INSERT INTO t VALUES (1.5, 0, 'x')",
+        "UPDATE t SET id = 4 WHERE id = 6",
+        "UPDATE t SET id = 5 WHERE id < 3",
+        "UPDATE t SET id = NULL WHERE id = 6",
+    ):
+        with pytest.raises(sqlite3.DatabaseError):
+            sm.sw.execute(sql)
+        with pytest.raises(EngineError):
+            sm.e.execute(sql)
+    # rejected statements change nothing
+    sm.same("SELECT COUNT(*), MAX(id) FROM t")
+
+    sm.same("UPDATE t SET id = 3 WHERE id = 6")
+    sm.same("DELETE FROM t WHERE id BETWEEN 100 AND 5000")
+    sm.same("SELECT id, s FROM t WHERE id <= 12")
+    sm.same("SELECT id FROM t WHERE id >= 5990")
+    sm.same("SELECT * FROM t")
+    # rows moved by an insert before them are restored by ROLLBACK
+    sm.same("BEGIN")
+    sm.same("INSERT INTO t VALUES (1, 9, 'r'), (5001, 9, 'r')")
+    sm.same("SELECT id, s FROM t WHERE v = 9 AND id < 5010")
+    sm.same("ROLLBACK")
+    sm.same("SELECT * FROM t")
+
+    # sqlite returns rows in key order, also after UPDATE changed a key
+    sm.same("CREATE TABLE m (id INTEGER PRIMARY KEY, s TEXT)")
+    sm.same("INSERT INTO m VALUES (1, 'a'), (2, 'b'), (5, 'e'), (3, 'c')")
+    sm.same("UPDATE m SET id = 0 WHERE id = 5")
+    sm.same("SELECT * FROM m")
+    # text compared with the key is converted to a number first
+    sm.same("SELECT s FROM m WHERE id = '3'")
+    sm.same("SELECT s FROM m WHERE id IN ('2', 1) AND id <= '2.0'")
+    # and the key is the rowid
+    sm.same("SELECT rowid, oid, s FROM m WHERE _rowid_ > 1 ORDER BY rowid")
+
+    sm.same("CREATE TABLE c (k INTEGER PRIMARY KEY, v)")
+    sm.same("INSERT INTO c VALUES (NULL, 'a'), (NULL, 'b'), (10, 'c'), (NULL, 'd')")
+    sm.same("BEGIN")
+    sm.same("INSERT INTO c VALUES (20, 'e')")
+    sm.same("DELETE FROM c WHERE k = 10")
+    sm.same("ROLLBACK")
+    sm.same("INSERT INTO c VALUES (NULL, 'f')")
+    sm.same("SELECT * FROM c WHERE k > 1")
+    assert plaintable(sm.e, "c").ordered[0]
+    # appended keys are looked up by binary search of the rows
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT v FROM c WHERE k = 11")
+    assert stages[0][:3] == ("primary key search", 1, 1)
+    stages = sm.e.execute("EXPLAIN ANALYZE SELECT v FROM t WHERE id < 8")
+    assert stages[0][:3] == ("primary key search", 5, 5)
+
+    # other primary keys are unique, but not converted and may be NULL
+    sm.same("CREATE TABLE n (name TEXT PRIMARY KEY, v)")
+    sm.same("INSERT INTO n VALUES ('b', 1), (NULL, 2), (NULL, 3), ('a', 4)")
+    sm.same("SELECT v FROM n WHERE name = 'a'")
+    with pytest.raises(EngineError, match="UNIQUE constraint failed: n.name"):
+        sm.e.execute("INSERT INTO n VALUES ('b', 5)")
+    indexes = plaintable(sm.e, "n").indexes
+    assert [i.indexname for i in indexes] == ["sqlite_autoindex_n_1"]
+    # the rowid of such tables is a hidden column
+    sm.same("SELECT * FROM n")
+    sm.same("SELECT rowid, * FROM n WHERE rowid >= 2")
+    sm.same("UPDATE n SET rowid = 10 WHERE v = 1")
+    sm.same("SELECT rowid, v FROM n")
+    sm.same("SELECT n.rowid, m.s FROM n JOIN m ON n.v = m.id")
+    with pytest.raises(EngineError, match="2 columns but 3 values"):
+        sm.e.execute("INSERT INTO n VALUES ('c', 5, 11)")
+    # KEY is a keyword only after PRIMARY
+    sm.same("CREATE TABLE k (key INTEGER PRIMARY KEY, v)")
+    sm.same("INSERT INTO k VALUES (2, 'b'), (1, 'a')")
+    sm.same("SELECT key, v FROM k WHERE key = 1")
+    with pytest.raises(EngineError, match="more than one primary key"):
+        sm.e.execute("CREATE TABLE m (a INTEGER PRIMARY KEY, b PRIMARY KEY)")
+
+
+def test_csv(tmp_path: Any, capsys: pytest.CaptureFixture[str]) -> None:
+    path = tmp_path / "in.csv"
+    path.write_text(
+        "id,n,r,s,x,num\n"
+        "1, 12 ,3,007,5,1.5\n"
+        "\n"
+        '2,1.0,-2.5e1,"a, ""b""\nc",,2.0\n'
+        "3,abc,,x,y,1e3\n"
+    )
+    e = Engine()
+    e.execute(
+        "CREATE TABLE t (id INTEGER PRIMARY KEY, n INT, r REAL, s TEXT, x, num NUMERIC)"
+    )
+    # fields are converted by the declared types, like sqlite .import does
+    assert e.import_csv(str(path), "t", skip=1) == 3
+    assert e.execute("SELECT * FROM t") == [
+        (1, 12, 3.0, "007", "5", 1.5),
+        (2, 1, -25.0, 'a, "b"\nc', "", 2),
+        (3, "abc", "", "x", "y", 1000),
+    ]
+    with pytest.raises(EngineError, match="UNIQUE constraint failed: t.id"):
+        e.import_csv(str(path), "t", skip=1)
+
+    # a missing table is created with TEXT columns named by the header
+    out = tmp_path / "out.tsv"
+    assert e.export_csv(str(out), "t", delimiter="\t") == 3
+    assert out.read_text().startswith("id\tn\tr\ts\tx\tnum\n")
+    assert e.import_csv(str(out), "u", delimiter="\t") == 3
+    assert plaintable(e, "u").types[:6] == ["TEXT"] * 6
+    assert e.execute("SELECT id, n, r, x FROM u WHERE id = '2'") == [
+        ("2", "1", "-25.0", "")
+    ]
+    assert e.execute("SELECT s FROM u") == e.execute("SELECT s FROM t")
+
+    path.write_text("1,2\n3\n")
+    e.execute("CREATE TABLE v (a INTEGER, b INTEGER)")
+    with pytest.raises(EngineError, match="record 2 has 1 fields, expected 2"):
+        e.import_csv(str(path), "v")
+    # errors of dot commands are printed, the shell keeps running
+    dotcommand(e, f".import {tmp_path / 'missing.csv'} v")
+    dotcommand(e, f".export {out} nope")
+    dotcommand(e, '.import "in.csv v')
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("Error: [Errno 2] No such file")
+    assert lines[1] == "Error: no such table: nope"
+    assert lines[2] == "Error: No closing quotation"
+    e.readonly = True
+    with pytest.raises(EngineError, match="readonly"):
+        e.import_csv(str(out), "u", delimiter="\t")
+
+
 def test_lesson1() -> None:
     sm = SameOutput()
     sm.same(CREATE_MOVIES)
@@ -248,7 +1093,6 @@ def test_lesson3() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson4() -> None:
     sm = SameOutput()
     sm.same(CREATE_MOVIES)
@@ -336,7 +1180,6 @@ def test_lesson6() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson7() -> None:
     sm = SameOutput()
     sm.same(CREATE_BUILDINGS)
@@ -353,7 +1196,6 @@ def test_lesson7() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson8() -> None:
     sm = SameOutput()
     sm.same(CREATE_BUILDINGS)
@@ -399,7 +1241,6 @@ def test_lesson9() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson10() -> None:
     sm = SameOutput()
     sm.same(CREATE_EMPLOYEES)
@@ -417,7 +1258,6 @@ def test_lesson10() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson11() -> None:
     sm = SameOutput()
     sm.same(CREATE_EMPLOYEES)
@@ -461,7 +1301,6 @@ def test_lesson12() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson13() -> None:
     sm = SameOutput()
     sm.same(CREATE_MOVIES)
@@ -474,7 +1313,6 @@ def test_lesson13() -> None:
     sm.same("SELECT * FROM boxoffice;")
 
 
-@pytest.mark.xfail
 def test_lesson14() -> None:
     sm = SameOutput()
     sm.same(CREATE_MOVIES)
@@ -498,7 +1336,6 @@ def test_lesson14() -> None:
     """)
 
 
-@pytest.mark.xfail
 def test_lesson15() -> None:
     sm = SameOutput()
     sm.same(CREATE_MOVIES)
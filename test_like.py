@@ -0,0 +1,34 @@
+from like import compile_like, prefix_ranges
+
+
+def test_fast_paths() -> None:
+    assert compile_like("abc")("ABC")
+    assert compile_like("ab%")("aBcd") and not compile_like("ab%")("xab")
+    assert compile_like("%Cd")("abcd") and not compile_like("%cd")("cdx")
+    assert compile_like("%b%")("abc") and not compile_like("%b%")("ac")
+    assert compile_like("%")("")
+
+
+def test_regex_escaping() -> None:
+    assert compile_like("a.c")("a.c") and not compile_like("a.c")("abc")
+    assert compile_like("[a]_%*")("[A]x*")
+    assert compile_like("(%)")("(\n)")
+    # case is ignored for ascii letters only
+    assert not compile_like("é%")("É")
+
+
+def test_compiled_once() -> None:
+    compile_like.cache_clear()
+    for _ in range(3):
+        compile_like("a_c%")("abcd")
+    assert compile_like.cache_info().misses == 1
+
+
+def test_prefix_ranges() -> None:
+    assert prefix_ranges("%ab") is None
+    assert prefix_ranges("a1_%") == [("A1", "A2"), ("a1", "a2")]
+    # 2**7 case variants, the ranges are of the first 6 letters
+    ranges = prefix_ranges("abcdefg%")
+    assert ranges is not None and len(ranges) == 64
+    assert ranges[0] == ("ABCDEF", "ABCDEG") and ranges[-1] == ("abcdef", "abcdeg")
+    assert prefix_ranges("12abcdefgh") == prefix_ranges("12abcdef")
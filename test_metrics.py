@@ -0,0 +1,60 @@
+import json
+import urllib.request
+
+import metrics
+from cache import ResultCache
+from engine import Engine
+
+
+def test_normalize() -> None:
+    sql = "select a,b from t where s = 'x'  AND b IN (1, 2.5) limit 3;"
+    assert metrics.normalize(sql) == (
+        "SELECT a, b FROM t WHERE s = ? AND b IN (?, ?) LIMIT ?"
+    )
+
+
+def test_histogram() -> None:
+    hist = metrics.Histogram((0.1, 1.0))
+    for val in (0.05, 0.5, 0.7, 3.0):
+        hist.observe(val)
+    assert hist.cumulative() == [("0.1", 1), ("1.0", 3), ("+Inf", 4)]
+    assert hist.count == 4
+
+
+def test_engine_metrics() -> None:
+    e = Engine(ResultCache(), metrics.Metrics(slow_query_seconds=0.0))
+    e.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    e.execute("INSERT INTO t VALUES (1, 'x'), (2, 'y'), (3, 'x')")
+    e.execute("SELECT a FROM t WHERE b = 'x'")
+    e.execute("SELECT a FROM t WHERE b = 'x'")
+
+    stats = e.stats()
+    assert stats["statements"] == {"create": 1, "insert": 1, "select": 2}
+    assert stats["parse_seconds"]["count"] == 4
+    assert stats["execute_seconds"]["select"]["count"] == 2
+    # the second select is answered from the cache
+    assert stats["rows_scanned"] == 3
+    assert stats["rows_returned"] == 4
+    assert stats["cache"]["hits"] == 1
+    assert stats["slow_queries"] == 4
+    assert stats["slow_log"][-1]["sql"] == "SELECT a FROM t WHERE b = ?"
+
+    text = e.prometheus()
+    assert 'engine_statements_total{type="select"} 2' in text
+    assert 'engine_execute_seconds_count{type="select"} 2' in text
+    assert "engine_cache_hit_ratio 0.5" in text
+
+
+def test_serve() -> None:
+    e = Engine()
+    e.execute("CREATE TABLE t (a INTEGER)")
+    server = metrics.serve(e.stats, e.prometheus)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as resp:  # noqa: S310
+            assert 'engine_statements_total{type="create"} 1' in resp.read().decode()
+        with urllib.request.urlopen(f"{url}/metrics.json") as resp:  # noqa: S310
+            assert json.load(resp)["statements"] == {"create": 1}
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,114 @@
+import sqlite3
+from typing import Any
+
+import pytest
+
+import engine as engine_module
+import parser
+from engine import Engine, IntegerValue, TextValue, Value, membership
+from optimizer import Filter, InSet, Optimizer
+
+
+def where(sql: str) -> parser.Expr | None:
+    (stmt,) = parser.parse(f"SELECT * FROM t WHERE {sql};")  # noqa: S608
+    assert isinstance(stmt, parser.SelectStmt)
+    return stmt.where
+
+
+def optimized(sql: str) -> parser.Expr | None:
+    engine = Engine()
+    return engine.optimizer.predicate(where(sql))
+
+
+def test_rewrites() -> None:
+    assert optimized("1 = 1 AND k = 3 AND 2 > 1") == where("k = 3")
+    assert optimized("k = 3 OR 1 > 2 OR NULL") == where("k = 3")
+    assert optimized("1 = 1") is None
+    assert optimized("k IS k OR k = 3") is None
+    assert optimized("k = 3 AND NULL") == parser.ConstInt(0)
+    assert optimized("NOT (k = 3)") == where("k <> 3")
+    assert optimized("NOT (k < 3 OR s LIKE 'a%')") == where(
+        "k >= 3 AND s NOT LIKE 'a%'"
+    )
+    assert optimized("NOT (NOT (k BETWEEN 1 AND 2))") == where("k BETWEEN 1 AND 2")
+    # NOT of a value that is not a truth value stays
+    assert optimized("NOT (NOT k)") == where("NOT (NOT k)")
+
+    found = optimized("k NOT IN (1, 'a', NULL, 1)")
+    assert isinstance(found, InSet)
+    assert found.values == {1, "a"} and found.null and found.isnot
+    assert optimized("k IN (1, 2) OR 3 IN (1, 2, 3)") is None
+
+    # expressions that fail are left to fail when they run
+    optimizer = Optimizer(lambda node: 1 / 0)
+    assert optimizer.predicate(where("1 = 1")) == where("1 = 1")
+
+
+def test_results() -> None:
+    con = sqlite3.connect(":memory:")
+    engine = Engine()
+    for sql in (
+        "CREATE TABLE t (id INTEGER, k INTEGER, s TEXT)",
+        "INSERT INTO t VALUES "  # noqa: S608
+        + ", ".join(
+            f"({i}, {'NULL' if i % 4 == 0 else i % 5}, {'NULL' if i % 6 == 0 else repr(chr(97 + i % 3))})"
+            for i in range(40)
+        ),
+    ):
+        con.execute(sql)
+        engine.execute(sql)
+    for cond in (
+        "k IN (1, 2, NULL)",
+        "k NOT IN (1, 2, NULL)",
+        "k NOT IN (1, 2)",
+        "NOT (k IN (1, 2) AND s = 'a')",
+        "NOT (k > 2 OR s IS NULL)",
+        "NOT (NOT (k = 1))",
+        "NOT (s NOT LIKE 'b')",
+        "1 = 1 AND (k = 1 OR 1 = 2) AND NOT (2 < 1)",
+        "k IS NULL OR NULL",
+        "NOT (id BETWEEN 5 AND 30) AND 1 IN (1, 2)",
+        "id IN (1, 2, 3) AND k IN (1, 2, 3) AND s IN ('a', 'c')",
+    ):
+        sql = f"SELECT id FROM t WHERE {cond}"  # noqa: S608
+        assert engine.execute(sql) == con.execute(sql).fetchall(), cond
+    sql = "SELECT id, k IN (1, NULL), NOT (k = 2), 1 = 1 AND k > 2 FROM t"
+    assert engine.execute(sql) == con.execute(sql).fetchall()
+
+
+def test_filter_adapts() -> None:
+    engine = Engine()
+    cond = where("s LIKE 'x%' AND k IS NOT NULL")
+    assert cond is not None
+    keep = Filter(cond, engine.expr)
+    # LIKE is estimated to reject most rows, so it goes first
+    assert keep.order == [0, 1]
+    for i in range(Filter.ADAPT_ROWS):
+        context = {"s": TextValue(f"x{i}"), "k": IntegerValue(i)}
+        assert keep(context)
+    # every row passed it, the cheaper conjunct goes first now
+    assert keep.order == [1, 0]
+
+
+def test_inset_hashed(monkeypatch: pytest.MonkeyPatch) -> None:
+    con = sqlite3.connect(":memory:")
+    engine = Engine()
+    for sql in (
+        "CREATE TABLE t (k INTEGER)",
+        "INSERT INTO t VALUES (1), (2), (NULL), (4)",
+    ):
+        con.execute(sql)
+        engine.execute(sql)
+    calls = []
+
+    def counted(*args: Any) -> Value:
+        calls.append(args)
+        return membership(*args)
+
+    monkeypatch.setattr(engine_module, "membership", counted)
+    for cond in ("k IN (1, 4, 7)", "k NOT IN (1, NULL)", "NOT (k IN (2, NULL))"):
+        sql = f"SELECT k FROM t WHERE {cond}"  # noqa: S608
+        calls.clear()
+        assert engine.execute(sql) == con.execute(sql).fetchall(), cond
+        # literal lists are matched by hashing, once per row
+        assert len(calls) == 4, cond
@@ -0,0 +1,96 @@
+import time
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+
+from engine import EngineError
+from replication import Follower, Leader, ReplicationTimeout
+
+AUTHKEY = b"test"
+
+
+@pytest.fixture
+def leader() -> Iterator[Leader]:
+    leader = Leader(AUTHKEY)
+    yield leader
+    leader.close()
+
+
+def test_replicate(leader: Leader) -> None:
+    leader.execute("CREATE TABLE t (id INTEGER, s TEXT)")
+    leader.execute("INSERT INTO t VALUES (1, 'a'), (2, 'b')")
+    leader.execute("SELECT * FROM t")
+    # reads are not logged
+    assert leader.token() == 2
+
+    follower = Follower(leader.address, AUTHKEY)
+    try:
+        assert follower.execute("SELECT * FROM t", leader.token(), 5) == [
+            (1, "a"),
+            (2, "b"),
+        ]
+        # a failed write is not logged
+        with pytest.raises(EngineError):
+            leader.execute("UPDATE t SET nope = 1")
+
+        leader.execute("BEGIN")
+        leader.execute("UPDATE t SET s = 'x' WHERE id = 1")
+        leader.execute("SAVEPOINT p")
+        leader.execute("DELETE FROM t")
+        leader.execute("ROLLBACK TO p")
+        leader.execute("INSERT INTO t VALUES (3, 'c')")
+        # nothing is logged before the commit
+        assert leader.token() == 2
+        leader.execute("COMMIT")
+        assert leader.token() == 3
+        assert len(leader.log.entries[-1].stmts) == 2
+
+        leader.execute("BEGIN")
+        leader.execute("DELETE FROM t")
+        leader.execute("ROLLBACK")
+        assert leader.token() == 3
+
+        token = leader.token()
+        rows = follower.execute("SELECT * FROM t ORDER BY id", token, 5)
+        assert rows == leader.execute("SELECT * FROM t ORDER BY id")
+        stats = follower.stats()
+        assert stats["applied_lsn"] == 3 and stats["apply_errors"] == 0
+        assert stats["lag_entries"] == 0 and stats["lag_seconds"] >= 0
+
+        with pytest.raises(ReplicationTimeout):
+            follower.wait(token + 1, 0.1)
+        with pytest.raises(EngineError, match="readonly"):
+            follower.execute("DELETE FROM t")
+    finally:
+        follower.close()
+
+
+def test_leader_stats(leader: Leader) -> None:
+    follower = Follower(leader.address, AUTHKEY)
+    try:
+        leader.execute("CREATE TABLE t (id INTEGER)")
+        follower.wait(leader.token(), 5)
+        # the follower acknowledges applied entries
+        for _ in range(50):
+            stats = leader.stats()
+            if stats["followers"] and stats["followers"][0]["applied"] == 1:
+                break
+            time.sleep(0.05)
+        assert stats == {"lsn": 1, "followers": [{"applied": 1, "lag_entries": 0}]}
+    finally:
+        follower.close()
+
+
+def test_replicate_import(leader: Leader, tmp_path: Any) -> None:
+    path = tmp_path / "t.csv"
+    path.write_text("id,s\n1,a\n2.0,b\n")
+    leader.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, s TEXT)")
+    follower = Follower(leader.address, AUTHKEY)
+    try:
+        assert leader.engine.import_csv(str(path), "t", skip=1) == 2
+        # rows are replicated as converted on the leader
+        rows = follower.execute("SELECT * FROM t", leader.token(), 5)
+        assert rows == [(1, "a"), (2, "b")]
+    finally:
+        follower.close()
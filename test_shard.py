@@ -0,0 +1,84 @@
+import sqlite3
+from collections import Counter
+from collections.abc import Iterator
+
+import pytest
+
+import parser
+from engine import EngineError
+from shard import Coordinator
+
+
+@pytest.fixture(scope="module")
+def coordinator() -> Iterator[Coordinator]:
+    with Coordinator.local(3, keys={"u": "uid"}) as coordinator:
+        yield coordinator
+
+
+def test_scatter_gather(coordinator: Coordinator) -> None:
+    con = sqlite3.connect(":memory:", isolation_level=None)
+    for sql in (
+        "CREATE TABLE t (id INTEGER, k INTEGER, s TEXT)",
+        "CREATE TABLE u (name TEXT, uid INTEGER)",
+        "CREATE INDEX tk ON t (k)",
+        "INSERT INTO t VALUES "  # noqa: S608
+        + ", ".join(
+            f"({i}, {'NULL' if i % 13 == 0 else i % 7}, 's{i % 4}')" for i in range(600)
+        ),
+        "INSERT INTO u VALUES ('a', 1), ('b', 2), ('c', 3)",
+    ):
+        con.execute(sql)
+        coordinator.execute(sql)
+    # every row lives on the shard of its key
+    count = parser.parse("SELECT COUNT(*) FROM t;")[0]
+    counts = [rows[0][0] for rows in coordinator.gather(count, "")]
+    assert sum(counts) == 600 and min(counts) > 0
+
+    def same(sql: str, ordered: bool = True) -> None:
+        expected = con.execute(sql).fetchall()
+        actual = coordinator.execute(sql)
+        if ordered:
+            assert actual == expected, sql
+        else:
+            assert Counter(actual) == Counter(expected), sql
+
+    same("SELECT * FROM t WHERE id = 42")
+    same("SELECT id, s FROM t WHERE k = 3", ordered=False)
+    same("SELECT s, id FROM t WHERE k > 2 ORDER BY id DESC LIMIT 7 OFFSET 3")
+    same("SELECT id AS i FROM t WHERE id IN (5, 77, 599) ORDER BY i")
+    same("SELECT DISTINCT s FROM t ORDER BY s")
+    same("SELECT COUNT(*), SUM(k), MIN(s), MAX(id), AVG(k) FROM t")
+    same("SELECT k, COUNT(k), AVG(id) FROM t WHERE id < 500 GROUP BY k")
+    same("SELECT s, SUM(id) AS total FROM t GROUP BY s ORDER BY total DESC LIMIT 2")
+    same("SELECT COUNT(*) FROM t WHERE id = 1000")
+    # keys of different shards leave no shard to ask
+    other = next(
+        i for i in range(1, 100) if coordinator.shard(i) != coordinator.shard(0)
+    )
+    pruned = f"FROM t WHERE id = 0 AND id = {other}"
+    (select,) = parser.parse(f"SELECT * {pruned};")
+    assert isinstance(select, parser.SelectStmt)
+    assert coordinator.shardsfor("t", select.where) == []
+    same(f"SELECT COUNT(*), COUNT(k), SUM(k), MIN(s), AVG(id) {pruned}")
+    same("SELECT k, COUNT(*) FROM t GROUP BY k HAVING COUNT(*) > 80")
+    same("SELECT t.id, u.name FROM t JOIN u ON t.id = u.uid", ordered=False)
+    same("SELECT id FROM t WHERE id IN (SELECT uid FROM u) ORDER BY id")
+
+    for sql in (
+        "UPDATE t SET s = 'new' WHERE k = 1",
+        "DELETE FROM t WHERE id BETWEEN 100 AND 199",
+        "BEGIN",
+        "DELETE FROM t WHERE id = 7",
+        "ROLLBACK",
+    ):
+        con.execute(sql)
+        coordinator.execute(sql)
+    same("SELECT s, COUNT(*) FROM t GROUP BY s")
+    same("SELECT COUNT(*) FROM t WHERE id = 7")
+
+    with pytest.raises(EngineError, match="shard key"):
+        coordinator.execute("UPDATE t SET id = 1")
+    with pytest.raises(EngineError, match="subqueries"):
+        coordinator.execute("DELETE FROM t WHERE id IN (SELECT uid FROM u)")
+    with pytest.raises(EngineError, match="no such column"):
+        coordinator.execute("SELECT nope FROM t")
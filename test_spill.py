@@ -0,0 +1,83 @@
+import random
+from collections.abc import Iterable
+from pathlib import Path
+from typing import IO, Any
+
+import pytest
+
+import spill
+from spill import external_distinct, external_sort, topn
+
+
+def test_external_sort_is_stable(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(spill, "CHUNK_ROWS", 7)
+    rng = random.Random(1)
+    rows = [(rng.randrange(20), i) for i in range(500)]
+    for reverse in (False, True):
+        expected = sorted(rows, key=lambda r: r[0], reverse=reverse)
+        actual = external_sort(iter(rows), lambda r: r[0], reverse, 500, str(tmp_path))
+        assert list(actual) == expected
+    # temporary files are deleted once read
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_topn(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    rows = [(3, "a"), (1, "b"), (3, "c"), (2, "d")]
+    assert list(topn(rows, 3, lambda r: r[0])) == [(1, "b"), (2, "d"), (3, "a")]
+    assert list(topn(rows, 2, lambda r: r[0], reverse=True)) == [(3, "a"), (3, "c")]
+
+    # a LIMIT larger than the budget sorts externally
+    spilled = spill_counter(monkeypatch)
+    rng = random.Random(3)
+    numbered = [(rng.randrange(50), i) for i in range(2000)]
+    for reverse in (False, True):
+        expected = sorted(numbered, key=lambda r: r[0], reverse=reverse)[:1500]
+        actual = topn(numbered, 1500, lambda r: r[0], reverse, 2000, str(tmp_path))
+        assert list(actual) == expected
+    assert spilled
+    assert list(tmp_path.iterdir()) == []
+
+
+def spill_counter(monkeypatch: pytest.MonkeyPatch) -> list[int]:
+    "Numbers of rows of the files written from now on"
+    counts: list[int] = []
+    writerows = spill.writerows
+
+    def counted(rows: Iterable[Any], directory: str | None) -> IO[bytes]:
+        rows = list(rows)
+        counts.append(len(rows))
+        return writerows(rows, directory)
+
+    monkeypatch.setattr(spill, "writerows", counted)
+    return counts
+
+
+def test_external_distinct_keeps_first_occurrences(tmp_path: Path) -> None:
+    rng = random.Random(2)
+    rows = [(rng.randrange(300), i) for i in range(3000)]
+
+    def key(row: tuple[int, int]) -> int:
+        return row[0]
+
+    firsts: dict[int, tuple[int, int]] = {}
+    for row in rows:
+        firsts.setdefault(key(row), row)
+    expected = list(firsts.values())
+    assert list(external_distinct(rows, key, 1000, str(tmp_path))) == expected
+    assert list(external_distinct(rows, key)) == expected
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_external_distinct_stays_in_budget(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # nearly every row is distinct, far more of them than fit into the budget
+    spilled = spill_counter(monkeypatch)
+    rows = [(i // 2 * 7919 % 5000, "x" * (i % 5)) for i in range(10000)]
+    expected = list(dict.fromkeys(rows))
+    assert list(external_distinct(rows, None, 20000, str(tmp_path))) == expected
+    # sorted runs are spilled no larger than the budget allows
+    assert spilled and max(spilled) < 20000 // spill.rowsize(rows[0])
+    assert list(tmp_path.iterdir()) == []
@@ -26,16 +26,46 @@ class TokenType(enum.Enum):
     DESC = enum.auto()
     LIMIT = enum.auto()
     OFFSET = enum.auto()
+    NULL = enum.auto()
+    GROUP = enum.auto()
+    HAVING = enum.auto()
+    AS = enum.auto()
+    IS = enum.auto()
+    JOIN = enum.auto()
+    INNER = enum.auto()
+    LEFT = enum.auto()
+    OUTER = enum.auto()
+    ON = enum.auto()
+    INDEX = enum.auto()
+    EXPLAIN = enum.auto()
+    ANALYZE = enum.auto()
+    PRAGMA = enum.auto()
+    DELETE = enum.auto()
+    UPDATE = enum.auto()
+    SET = enum.auto()
+    BEGIN = enum.auto()
+    TRANSACTION = enum.auto()
+    COMMIT = enum.auto()
+    ROLLBACK = enum.auto()
+    SAVEPOINT = enum.auto()
+    RELEASE = enum.auto()
+    TO = enum.auto()
+    # methods of PARTITION BY, whose words are identifiers elsewhere
+    RANGE = enum.auto()
+    HASH = enum.auto()
+    EXISTS = enum.auto()
 
     IDENTIFIER = enum.auto()
     STRING_LITERAL = enum.auto()
     INT_LITERAL = enum.auto()
+    REAL_LITERAL = enum.auto()
 
     LCOLON = enum.auto()
     RCOLON = enum.auto()
     STAR = enum.auto()
     COMMA = enum.auto()
     SEMICOLON = enum.auto()
+    DOT = enum.auto()
 
     # cmp
     EQUAL = enum.auto()
@@ -74,6 +104,31 @@ keywords = {
     "DESC": TT.DESC,
     "LIMIT": TT.LIMIT,
     "OFFSET": TT.OFFSET,
+    "NULL": TT.NULL,
+    "GROUP": TT.GROUP,
+    "HAVING": TT.HAVING,
+    "AS": TT.AS,
+    "IS": TT.IS,
+    "JOIN": TT.JOIN,
+    "INNER": TT.INNER,
+    "LEFT": TT.LEFT,
+    "OUTER": TT.OUTER,
+    "ON": TT.ON,
+    "INDEX": TT.INDEX,
+    "EXPLAIN": TT.EXPLAIN,
+    "ANALYZE": TT.ANALYZE,
+    "PRAGMA": TT.PRAGMA,
+    "DELETE": TT.DELETE,
+    "UPDATE": TT.UPDATE,
+    "SET": TT.SET,
+    "BEGIN": TT.BEGIN,
+    "TRANSACTION": TT.TRANSACTION,
+    "COMMIT": TT.COMMIT,
+    "ROLLBACK": TT.ROLLBACK,
+    "SAVEPOINT": TT.SAVEPOINT,
+    "RELEASE": TT.RELEASE,
+    "TO": TT.TO,
+    "EXISTS": TT.EXISTS,
 }
 
 
@@ -97,7 +152,7 @@ def tokenize(source: str) -> list[Token]:
             continue
         elif c.isalpha() or c == "_":
             l = i
-            while i < len(source) and (source[i].isalpha() or source[i] == "_"):
+            while i < len(source) and (source[i].isalnum() or source[i] == "_"):
                 i += 1
             sseq = source[l:i]
             if sseq.upper() in keywords:
@@ -108,6 +163,12 @@ def tokenize(source: str) -> list[Token]:
             l = i
             while i < len(source) and source[i].isdigit():
                 i += 1
+            if i + 1 < len(source) and source[i] == "." and source[i + 1].isdigit():
+                i += 1
+                while i < len(source) and source[i].isdigit():
+                    i += 1
+                ans.append(Token(TokenType.REAL_LITERAL, source[l:i]))
+                continue
             sseq = source[l:i]
             ans.append(Token(TokenType.INT_LITERAL, sseq))
         elif c == "'":
@@ -133,6 +194,9 @@ def tokenize(source: str) -> list[Token]:
         elif c == ",":
             ans.append(Token(TokenType.COMMA, ""))
             i += 1
+        elif c == ".":
+            ans.append(Token(TokenType.DOT, ""))
+            i += 1
         elif c == "=":
             ans.append(Token(TokenType.EQUAL, ""))
             i += 1
@@ -229,6 +293,21 @@ def test_select() -> None:
     assert tokens == expected_tokens
 
 
+def test_real() -> None:
+    line = "SELECT 8.25, movies.id;"
+    tokens = tokenize(line)
+    expected_tokens = [
+        Token(TokenType.SELECT, ""),
+        Token(TokenType.REAL_LITERAL, "8.25"),
+        Token(TokenType.COMMA, ""),
+        Token(TokenType.IDENTIFIER, "movies"),
+        Token(TokenType.DOT, ""),
+        Token(TokenType.IDENTIFIER, "id"),
+        Token(TokenType.SEMICOLON, ""),
+    ]
+    assert tokens == expected_tokens
+
+
 def test_int() -> None:
     line = "SELECT 1;"
     tokens = tokenize(line)